@@ -0,0 +1,128 @@
+"""
+Arranque en frío: tiempo hasta que el servidor acepta la primera lectura.
+
+Lanza `uvicorn main:app` (igual que start.sh) y, desde el momento del spawn,
+mide cuándo responde con 200 cada uno de:
+
+    first_ingest_s  POST /api/ingreso   (lo primero que necesita el ESP32)
+    first_last_s    GET  /api/last
+    first_data_s    GET  /api/data      (necesita pandas ya cargado)
+
+Además mide en un proceso aparte cuánto tarda `import main` y qué módulos
+pesados quedaron cargados. Repite --runs veces y reporta la mediana.
+
+    python bench/coldstart.py
+    python bench/coldstart.py --runs 5 --output coldstart.json
+
+Requiere `httpx` (además de las dependencias de la app).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from loadtest import make_lectura  # noqa: E402
+
+HEAVY_MODULES = ["pandas", "openpyxl", "pyarrow"]
+
+IMPORT_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+elapsed = time.perf_counter() - t0
+print(json.dumps({"import_s": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_import(env: dict) -> dict:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def wait_for(client: httpx.Client, method: str, path: str, started: float, deadline: float,
+             **kwargs) -> Optional[float]:
+    """Segundos desde `started` hasta la primera respuesta 200 (None si vence)."""
+    while time.perf_counter() < deadline:
+        try:
+            if client.request(method, path, **kwargs).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.005)
+    return None
+
+
+def run_once(port: int, timeout: float, env: dict) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env,
+    )
+    deadline = started + timeout
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=2.0) as client:
+            lectura = make_lectura(0, 0, datetime.now())
+            return {
+                "first_ingest_s": wait_for(client, "POST", "/api/ingreso", started, deadline, json=lectura),
+                "first_last_s": wait_for(client, "GET", "/api/last", started, deadline),
+                "first_data_s": wait_for(client, "GET", "/api/data", started, deadline),
+            }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60.0, help="máximo por arranque (s)")
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto stdout)")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        # directorio de datos vacío: sin estado guardado que cargar
+        env = {**os.environ, "INVERNADERO_DATA_DIR": data_dir}
+        imports = [measure_import(env) for _ in range(args.runs)]
+        for i in range(args.runs):
+            runs.append(run_once(args.port, args.timeout, env))
+            print(f"arranque {i + 1}: {runs[-1]}", file=sys.stderr)
+
+    def median(key, rows):
+        values = [r[key] for r in rows if r.get(key) is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    report = {
+        "runs": args.runs,
+        "import_s": median("import_s", imports),
+        "loaded_at_import": imports[-1]["loaded"],
+        "first_ingest_s": median("first_ingest_s", runs),
+        "first_last_s": median("first_last_s", runs),
+        "first_data_s": median("first_data_s", runs),
+        "samples": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
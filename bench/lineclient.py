@@ -0,0 +1,160 @@
+"""
+Cliente del protocolo de línea (UDP/TCP) de main.py, para probarlo en local
+y medir cuántas lecturas por segundo acepta el servidor.
+
+Genera lecturas plausibles (las mismas que la prueba de carga), las envía
+con los alias cortos de LINE_ALIASES y cuenta las respuestas por tipo.
+
+    # servidor con el listener activo
+    LINE_TCP_PORT=9100 LINE_UDP_PORT=9100 LINE_TOKENS=esp32-1:secreto \\
+        uvicorn main:app --port 8000
+
+    python bench/lineclient.py --tcp 9100 --device esp32-1 --token secreto --count 20000
+    python bench/lineclient.py --udp 9100 --device esp32-1 --token secreto --count 5000 --per-datagram 20
+
+Con --cv la primera lectura pide también el estado de control (cv=0).
+Por UDP las lecturas sin respuesta se informan como "lost"; reenviarlas
+con las mismas secuencias (--seq-start) no las duplica en el servidor.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from loadtest import make_lectura  # noqa: E402
+
+# Campo de `Lectura` → alias corto (el inverso de main.LINE_ALIASES).
+SHORT = {
+    "timestamp": "ts", "dia_semana": "dia", "modo_control": "modo", "estacion": "est",
+    "temp_invernadero_C": "t", "hum_invernadero_rel": "h", "freq_ref_Hz": "fr",
+    "freq_cmd_Hz": "fc", "colg_ref_unidades": "cr", "n_colg_vent_on": "nc",
+    "relay_pared_on": "rp", "relay_colg_1_on": "rc1", "relay_colg_2_on": "rc2",
+    "vent_pared_on": "vp", "vent_colg_on": "vc", "vfd_freq_out_Hz": "vf",
+    "vfd_volt_out_V": "vv", "vfd_curr_out_A": "vi", "pump_on": "p", "pump_auto_mode": "pa",
+}
+
+
+def make_line(device: str, token: str, seq: int, ts: datetime, cv=None) -> bytes:
+    fields = [f"{SHORT.get(k, k)}={v}" for k, v in make_lectura(0, seq, ts).items()]
+    fields.append(f"seq={seq}")
+    if cv is not None:
+        fields.append(f"cv={cv}")
+    return (f"{device} {token} " + " ".join(fields) + "\n").encode("utf-8")
+
+
+def make_lines(args):
+    start = datetime.now() - timedelta(seconds=args.count)
+    return [make_line(args.device, args.token, args.seq_start + i, start + timedelta(seconds=i),
+                      0 if (args.cv and i == 0) else None)
+            for i in range(args.count)]
+
+
+async def run_tcp(args, lines) -> Counter:
+    reader, writer = await asyncio.open_connection(args.host, args.tcp)
+    replies: Counter = Counter()
+
+    async def read_replies():
+        for _ in lines:
+            reply = await reader.readline()
+            if not reply:
+                break
+            if args.verbose:
+                print(reply.decode().rstrip(), file=sys.stderr)
+            replies[reply.split(b" ", 1)[0].strip().decode()] += 1
+
+    reading = asyncio.create_task(read_replies())
+    for line in lines:
+        writer.write(line)
+        if writer.transport.get_write_buffer_size() > 256 * 1024:
+            await writer.drain()
+    await writer.drain()
+    await asyncio.wait_for(reading, args.timeout)
+    writer.close()
+    return replies
+
+
+class _Collector(asyncio.DatagramProtocol):
+    def __init__(self, replies: Counter, verbose: bool):
+        self.replies = replies
+        self.verbose = verbose
+
+    def datagram_received(self, data, addr):
+        for reply in data.splitlines():
+            if self.verbose:
+                print(reply.decode(), file=sys.stderr)
+            self.replies[reply.split(b" ", 1)[0].decode()] += 1
+
+
+async def run_udp(args, lines) -> Counter:
+    replies: Counter = Counter()
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _Collector(replies, args.verbose), remote_addr=(args.host, args.udp))
+    def wait_until(pending: int) -> "asyncio.Future":
+        # espera a que queden `pending` lecturas sin respuesta, o a que no
+        # llegue ninguna respuesta en un segundo (datagramas perdidos)
+        async def wait():
+            last, idle_since = -1, time.perf_counter()
+            while sent - sum(replies.values()) > pending:
+                got = sum(replies.values())
+                if got != last:
+                    last, idle_since = got, time.perf_counter()
+                elif time.perf_counter() - idle_since > 1.0:
+                    return
+                await asyncio.sleep(0.001)
+        return wait()
+
+    sent = 0
+    for start in range(0, len(lines), args.per_datagram):
+        # UDP no tiene control de flujo: con más de --window lecturas sin
+        # respuesta se espera, para no desbordar el buffer del servidor
+        await wait_until(args.window)
+        chunk = lines[start:start + args.per_datagram]
+        transport.sendto(b"".join(chunk))
+        sent += len(chunk)
+    await wait_until(0)
+    transport.close()
+    return replies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--tcp", type=int, metavar="PUERTO")
+    target.add_argument("--udp", type=int, metavar="PUERTO")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--device", default="esp32")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--count", type=int, default=1000, help="lecturas a enviar")
+    parser.add_argument("--seq-start", type=int, default=0, help="primer número de secuencia")
+    parser.add_argument("--per-datagram", type=int, default=1, help="líneas por datagrama UDP")
+    parser.add_argument("--window", type=int, default=200, help="lecturas UDP en vuelo sin respuesta")
+    parser.add_argument("--cv", action="store_true", help="pedir el estado de control en la primera lectura")
+    parser.add_argument("--timeout", type=float, default=30.0, help="espera máxima de respuestas (s)")
+    parser.add_argument("--verbose", action="store_true", help="imprime cada respuesta")
+    args = parser.parse_args()
+
+    lines = make_lines(args)
+    started = time.perf_counter()
+    replies = asyncio.run(run_tcp(args, lines) if args.tcp else run_udp(args, lines))
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "transport": "tcp" if args.tcp else "udp",
+        "sent": len(lines),
+        "replies": dict(replies),
+        "lost": len(lines) - sum(replies.values()),
+        "elapsed_s": round(elapsed, 3),
+        "readings_per_s": round(len(lines) / elapsed, 1) if elapsed > 0 else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Prueba de carga: simula una flota de controladores ESP32 y dashboards abiertos.
+
+Cada controlador envía una `Lectura` a /api/ingreso con la cadencia indicada
+y luego consulta /api/control_state (igual que el firmware); con --piggyback
+manda su `control_version` en la lectura y recibe el control en la misma
+respuesta, sin el segundo pedido. Cada dashboard
+pide /, /api/data y /api/last. Al final se imprime (o se guarda) un JSON con
+throughput y latencias p50/p95/p99 por ruta, más el RSS del servidor en el
+tiempo, pensado para compararse entre versiones.
+
+Ejemplos (desde la raíz del repo):
+
+    # levanta uvicorn en un puerto local y lo mide
+    python bench/loadtest.py --controllers 50 --dashboards 5 --duration 60
+
+    # app en el mismo proceso (sin red, útil para perfilar)
+    python bench/loadtest.py --in-process --controllers 20 --duration 20
+
+    # contra un servidor ya levantado
+    python bench/loadtest.py --url http://127.0.0.1:8000 --output run.json
+
+Requiere `httpx` (además de las dependencias de la app).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DIAS = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+
+
+def make_lectura(device_idx: int, seq: int, ts: datetime) -> dict:
+    """Genera una lectura plausible para el controlador `device_idx`."""
+    temp = 24.0 + 6.0 * random.random() + device_idx % 3
+    freq = min(50.0, max(0.0, (temp - 22.0) * 6.0))
+    colg = int(temp > 27.0) + int(temp > 29.0)
+    return {
+        "timestamp": ts.isoformat(timespec="seconds"),
+        "dia_semana": DIAS[ts.weekday()],
+        "modo_control": "auto",
+        "estacion": "verano",
+        "temp_invernadero_C": round(temp, 2),
+        "hum_invernadero_rel": round(55.0 + 20.0 * random.random(), 1),
+        "freq_ref_Hz": round(freq, 1),
+        "freq_cmd_Hz": round(freq, 1),
+        "colg_ref_unidades": float(colg),
+        "n_colg_vent_on": colg,
+        "relay_pared_on": int(freq > 0),
+        "relay_colg_1_on": int(colg >= 1),
+        "relay_colg_2_on": int(colg >= 2),
+        "vent_pared_on": int(freq > 0),
+        "vent_colg_on": int(colg > 0),
+        "vfd_freq_out_Hz": round(freq, 1),
+        "vfd_volt_out_V": round(freq * 7.6, 1),
+        "vfd_curr_out_A": round(freq * 0.08, 2),
+        "pump_on": int(temp > 28.0),
+        "pump_auto_mode": 1,
+    }
+
+
+class Recorder:
+    """Guarda latencias (ms) y errores por ruta."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, path: str, **kwargs):
+        t0 = time.perf_counter()
+        ok = False
+        resp = None
+        try:
+            resp = await client.request(method, path, **kwargs)
+            # 404 en /api/data o /api/last sólo significa "todavía sin datos"
+            ok = resp.status_code < 400 or resp.status_code == 404
+        except httpx.HTTPError:
+            ok = False
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        self.latencies.setdefault(label, []).append(elapsed)
+        if not ok:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        return resp
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """RSS actual de `pid` en MB (Linux /proc); None si no se puede leer."""
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if pid == os.getpid():
+        import resource
+        # ru_maxrss es el pico (KB en Linux), a falta de algo mejor
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return None
+
+
+# Los clientes arrancan escalonados al azar, pero sin pasar de esta
+# fracción de la prueba: con una cadencia larga y una prueba corta, si no,
+# una clase de clientes podría no llegar a hacer ningún pedido.
+START_JITTER_FRACTION = 0.1
+
+
+def start_jitter(cadence: float, duration: float) -> float:
+    return random.random() * min(cadence, START_JITTER_FRACTION * duration)
+
+
+async def controller(client, rec: Recorder, idx: int, cadence: float, stop_at: float, piggyback: bool,
+                     jitter: float):
+    seq = 0
+    control_version = 0
+    ts = datetime.now() - timedelta(days=1) + timedelta(seconds=idx)
+    await asyncio.sleep(jitter)
+    while time.perf_counter() < stop_at:
+        t0 = time.perf_counter()
+        ts += timedelta(seconds=max(cadence, 1.0))
+        lectura = make_lectura(idx, seq, ts)
+        if piggyback:
+            lectura["control_version"] = control_version
+        resp = await rec.call(client, "POST /api/ingreso", "POST", "/api/ingreso", json=lectura)
+        if not piggyback:
+            await rec.call(client, "GET /api/control_state", "GET", "/api/control_state")
+        elif resp is not None and resp.status_code == 200:
+            control_version = resp.json().get("controlVersion", control_version)
+        seq += 1
+        await asyncio.sleep(max(0.0, cadence - (time.perf_counter() - t0)))
+
+
+async def dashboard(client, rec: Recorder, cadence: float, stop_at: float, jitter: float):
+    await asyncio.sleep(jitter)
+    while time.perf_counter() < stop_at:
+        t0 = time.perf_counter()
+        await rec.call(client, "GET /", "GET", "/")
+        await rec.call(client, "GET /api/data", "GET", "/api/data")
+        await rec.call(client, "GET /api/last", "GET", "/api/last")
+        await asyncio.sleep(max(0.0, cadence - (time.perf_counter() - t0)))
+
+
+async def rss_sampler(pid: Optional[int], samples: list, started: float, stop_at: float, every: float):
+    while pid is not None and time.perf_counter() < stop_at:
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            samples.append({"t_s": round(time.perf_counter() - started, 2), "rss_mb": round(rss, 2)})
+        await asyncio.sleep(every)
+
+
+def spawn_server(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn terminó antes de aceptar conexiones")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/control_state", timeout=1.0)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("uvicorn no respondió a tiempo")
+
+
+async def run(args) -> dict:
+    proc = None
+    main = None
+    if args.in_process:
+        sys.path.insert(0, REPO_ROOT)
+        import main
+        transport = httpx.ASGITransport(app=main.app)
+        base_url = "http://testserver"
+        server_pid = os.getpid()
+    elif args.url:
+        transport = None
+        base_url = args.url.rstrip("/")
+        server_pid = args.server_pid
+    else:
+        proc = spawn_server(args.port)
+        transport = None
+        base_url = f"http://127.0.0.1:{args.port}"
+        server_pid = proc.pid
+
+    rec = Recorder()
+    rss_samples: list = []
+    limits = httpx.Limits(max_connections=args.controllers + args.dashboards + 4)
+    # ASGITransport no ejecuta el lifespan: se levanta a mano para que
+    # corran las tareas de fondo (cola de ingreso, persistencia).
+    lifespan = main.app.router.lifespan_context(main.app) if args.in_process else contextlib.nullcontext()
+    try:
+        async with lifespan, httpx.AsyncClient(base_url=base_url, transport=transport,
+                                     timeout=args.timeout, limits=limits) as client:
+            started = time.perf_counter()
+            stop_at = started + args.duration
+            tasks = [controller(client, rec, i, args.cadence, stop_at, args.piggyback,
+                                start_jitter(args.cadence, args.duration))
+                     for i in range(args.controllers)]
+            tasks += [dashboard(client, rec, args.dashboard_cadence, stop_at,
+                                start_jitter(args.dashboard_cadence, args.duration))
+                      for _ in range(args.dashboards)]
+            tasks.append(rss_sampler(server_pid, rss_samples, started, stop_at, args.rss_every))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    routes = {}
+    total = 0
+    for label, values in sorted(rec.latencies.items()):
+        values.sort()
+        total += len(values)
+        routes[label] = {
+            "count": len(values),
+            "errors": rec.errors.get(label, 0),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2),
+        }
+
+    # una clase de clientes sin pedidos no mide nada: la corrida no sirve
+    silent = []
+    if args.controllers and "POST /api/ingreso" not in rec.latencies:
+        silent.append("controladores")
+    if args.dashboards and "GET /" not in rec.latencies:
+        silent.append("dashboards")
+    if silent:
+        raise RuntimeError(f"Sin pedidos registrados de: {', '.join(silent)} "
+                           f"(prueba de {args.duration} s demasiado corta para la cadencia)")
+
+    rss_values = [s["rss_mb"] for s in rss_samples]
+    return {
+        "config": {
+            "controllers": args.controllers,
+            "dashboards": args.dashboards,
+            "cadence_s": args.cadence,
+            "dashboard_cadence_s": args.dashboard_cadence,
+            "duration_s": args.duration,
+            "piggyback": args.piggyback,
+            "mode": "in-process" if args.in_process else ("url" if args.url else "uvicorn"),
+        },
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "elapsed_s": round(elapsed, 2),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "routes": routes,
+        "rss": {
+            "samples": rss_samples,
+            "start_mb": rss_values[0] if rss_values else None,
+            "peak_mb": max(rss_values) if rss_values else None,
+            "end_mb": rss_values[-1] if rss_values else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--controllers", type=int, default=10, help="controladores ESP32 simulados (N)")
+    parser.add_argument("--dashboards", type=int, default=2, help="dashboards abiertos simulados (M)")
+    parser.add_argument("--cadence", type=float, default=5.0, help="segundos entre lecturas de cada controlador")
+    parser.add_argument("--dashboard-cadence", type=float, default=10.0, help="segundos entre recargas de cada dashboard")
+    parser.add_argument("--duration", type=float, default=30.0, help="duración de la prueba (s)")
+    parser.add_argument("--piggyback", action="store_true",
+                        help="el control viaja en la respuesta de /api/ingreso (sin GET /api/control_state)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="timeout por petición (s)")
+    parser.add_argument("--rss-every", type=float, default=1.0, help="intervalo de muestreo de RSS (s)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--in-process", action="store_true", help="monta main.app en este mismo proceso")
+    target.add_argument("--url", help="URL de un servidor ya levantado")
+    parser.add_argument("--server-pid", type=int, help="PID del servidor de --url, para medir su RSS")
+    parser.add_argument("--port", type=int, default=8765, help="puerto para el uvicorn local")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto stdout)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    try:
+        report = asyncio.run(run(args))
+    except RuntimeError as e:
+        print(f"Prueba inválida: {e}", file=sys.stderr)
+        sys.exit(1)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
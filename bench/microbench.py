@@ -0,0 +1,248 @@
+"""
+Microbenchmarks de los caminos calientes de main.py.
+
+Casos (cada uno con datos generados de 1k, 100k y 1M filas por defecto):
+
+    records     dataframe_to_records  (constructor de filas de /api/data)
+    last        last_record           (registro de /api/last)
+    append      DataSnapshot.appended (versión nueva en /api/ingreso, una lectura)
+    datetimes   parse_datetime_columns (inferencia de fechas de /upload)
+    labels      build_field_metadata  (prettify_column_name + descripciones)
+
+Para cada caso se informa ops/s, filas/s y asignaciones (pico de memoria
+y bloques según tracemalloc, medidos en una pasada aparte para no sesgar
+los tiempos). Los resultados se comparan con bench/baselines.json.
+
+    python bench/microbench.py                       # todo, compara con baseline
+    python bench/microbench.py --sizes 1000 100000 --cases records last
+    python bench/microbench.py --save-baseline       # actualiza baselines.json
+    python bench/microbench.py --check               # exit 1 si hay regresión
+
+Las baselines dependen de la máquina: conviene regenerarlas en el host
+donde se van a comparar.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import main  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+
+
+def make_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    """DataFrame sintético con el esquema de `Lectura` y `n` filas."""
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range("2024-01-01", periods=n, freq="30s")
+    temp = 22.0 + 8.0 * rng.random(n)
+    freq = np.clip((temp - 22.0) * 6.0, 0.0, 50.0)
+    colg = (temp > 27.0).astype(int) + (temp > 29.0).astype(int)
+    hum = 55.0 + 20.0 * rng.random(n)
+    hum[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        "timestamp": ts,
+        "dia_semana": ts.day_name(),
+        "modo_control": "auto",
+        "estacion": "verano",
+        "temp_invernadero_C": temp,
+        "hum_invernadero_rel": hum,
+        "freq_ref_Hz": freq,
+        "freq_cmd_Hz": freq,
+        "colg_ref_unidades": colg.astype(float),
+        "n_colg_vent_on": colg,
+        "relay_pared_on": (freq > 0).astype(int),
+        "relay_colg_1_on": (colg >= 1).astype(int),
+        "relay_colg_2_on": (colg >= 2).astype(int),
+        "vent_pared_on": (freq > 0).astype(int),
+        "vent_colg_on": (colg > 0).astype(int),
+        "vfd_freq_out_Hz": freq,
+        "vfd_volt_out_V": freq * 7.6,
+        "vfd_curr_out_A": freq * 0.08,
+        "pump_on": (temp > 28.0).astype(int),
+        "pump_auto_mode": 1,
+    })
+
+
+# Cada "setup" recibe el DataFrame generado y devuelve la función a medir
+# (sin argumentos). El trabajo de preparación queda fuera de la medición.
+
+def setup_records(df: pd.DataFrame) -> Callable:
+    datetime_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+    return lambda: main.dataframe_to_records(df, datetime_cols)
+
+
+def setup_last(df: pd.DataFrame) -> Callable:
+    return lambda: main.last_record(df)
+
+
+def setup_append(df: pd.DataFrame) -> Callable:
+    rec = {c: df[c].iloc[-1] for c in df.columns}
+    rec["timestamp"] = df["timestamp"].iloc[-1].isoformat()
+    one = pd.DataFrame([rec])
+    snap = main.DataSnapshot(0, (df,))
+    return lambda: snap.appended(one)
+
+
+def setup_datetimes(df: pd.DataFrame) -> Callable:
+    raw = df[["timestamp", "dia_semana", "temp_invernadero_C"]].copy()
+    raw["timestamp"] = raw["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return lambda: main.parse_datetime_columns(raw.copy())
+
+
+def setup_labels(df: pd.DataFrame) -> Callable:
+    # El costo depende del número de columnas, no de filas: se escala la
+    # cantidad de nombres (conocidos y desconocidos) con el tamaño.
+    base = list(df.columns)
+    extra = [f"sensor_{i}_valor.promedio" for i in range(max(0, len(df) // 1000))]
+    columns = base + extra
+    return lambda: main.build_field_metadata(columns)
+
+
+CASES: Dict[str, Callable] = {
+    "records": setup_records,
+    "last": setup_last,
+    "append": setup_append,
+    "datetimes": setup_datetimes,
+    "labels": setup_labels,
+}
+
+
+def time_fn(fn: Callable, min_time: float, max_repeat: int) -> Tuple[float, int]:
+    """Mejor tiempo (s) por llamada, repitiendo hasta `min_time` segundos."""
+    best = float("inf")
+    runs = 0
+    started = time.perf_counter()
+    while runs < max_repeat:
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+        runs += 1
+        if time.perf_counter() - started >= min_time:
+            break
+    return best, runs
+
+
+def alloc_fn(fn: Callable) -> Tuple[int, int]:
+    """(pico de bytes, bloques asignados) durante una llamada."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(max(0, s.count_diff) for s in after.compare_to(before, "filename"))
+    return peak, blocks
+
+
+def run(cases: List[str], sizes: List[int], min_time: float, max_repeat: int, allocs: bool) -> dict:
+    results: Dict[str, dict] = {}
+    for n in sizes:
+        df = make_frame(n)
+        for name in cases:
+            fn = CASES[name](df)
+            best, runs = time_fn(fn, min_time, max_repeat)
+            entry = {
+                "rows": n,
+                "runs": runs,
+                "best_s": round(best, 6),
+                "ops_per_s": round(1.0 / best, 3) if best > 0 else None,
+                "rows_per_s": round(n / best, 1) if best > 0 else None,
+            }
+            if allocs:
+                peak, blocks = alloc_fn(fn)
+                entry["alloc_peak_bytes"] = peak
+                entry["alloc_blocks"] = blocks
+            key = f"{name}/{n}"
+            results[key] = entry
+            print(f"{key:<22} {entry['ops_per_s']:>14,.2f} ops/s  {entry['rows_per_s']:>16,.0f} filas/s"
+                  + (f"  pico {entry['alloc_peak_bytes'] / 1e6:,.1f} MB" if allocs else ""),
+                  file=sys.stderr)
+        del df
+        gc.collect()
+    return results
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> List[dict]:
+    """Compara contra las baselines; marca regresión si ops/s cae más de `tolerance`."""
+    rows = []
+    for key, cur in results.items():
+        base = baselines.get(key)
+        if not base or not base.get("ops_per_s") or not cur.get("ops_per_s"):
+            continue
+        speedup = cur["ops_per_s"] / base["ops_per_s"]
+        row = {"case": key, "speedup": round(speedup, 3), "regression": speedup < 1.0 - tolerance}
+        if "alloc_peak_bytes" in cur and base.get("alloc_peak_bytes"):
+            row["alloc_ratio"] = round(cur["alloc_peak_bytes"] / base["alloc_peak_bytes"], 3)
+        rows.append(row)
+    return rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--min-time", type=float, default=1.0, help="tiempo mínimo de medición por caso (s)")
+    parser.add_argument("--max-repeat", type=int, default=50)
+    parser.add_argument("--no-allocs", action="store_true", help="omite la pasada de tracemalloc")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="caída de ops/s tolerada (0.25 = 25%%)")
+    parser.add_argument("--baseline", default=BASELINES_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="termina con código 1 si hay regresiones")
+    parser.add_argument("--output", help="archivo JSON con el reporte completo")
+    args = parser.parse_args()
+
+    results = run(args.cases, args.sizes, args.min_time, args.max_repeat, not args.no_allocs)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fh:
+            baselines = json.load(fh).get("results", {})
+    comparison = compare(results, baselines, args.tolerance)
+
+    report = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "results": results,
+        "comparison": comparison,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.save_baseline:
+        merged = {**baselines, **results}
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump({"python": report["python"], "pandas": report["pandas"],
+                       "machine": report["machine"], "results": merged}, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+
+    regressions = [r for r in comparison if r["regression"]]
+    for r in regressions:
+        print(f"REGRESIÓN {r['case']}: {r['speedup']:.2f}x de la baseline", file=sys.stderr)
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
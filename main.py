@@ -1,12 +1,70 @@
-from fastapi import FastAPI, UploadFile, File, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
+import numpy as np
+import asyncio
+import bisect
+import hashlib
+import hmac
+import importlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+import operator
+from datetime import datetime, timezone
 from io import BytesIO
+from urllib.parse import parse_qs
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, get_type_hints
 
-app = FastAPI(title="Dashboard Invernadero ADTEC")
+
+class LazyModule:
+    """
+    Módulo que se importa recién cuando se usa uno de sus atributos. pandas
+    (y con él dateutil, pytz, etc.) tarda más en importarse que el resto de
+    la app: así el servidor arranca y acepta lecturas del ESP32 sin esperar,
+    y el import se hace en segundo plano al iniciar (ver on_startup).
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def _is_loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+pd = LazyModule("pandas")
+
+@asynccontextmanager
+async def lifespan(app):
+    await on_startup()
+    try:
+        yield
+    finally:
+        await on_shutdown()
+
+
+app = FastAPI(title="Dashboard Invernadero ADTEC", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,7 +73,325 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-LAST_DF = None
+# ===================== Instrumentación de peticiones =====================
+
+# Umbral (ms) a partir del cual una petición se guarda en el registro de lentas.
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+# Cantidad máxima de peticiones lentas que se conservan (buffer circular).
+SLOW_LOG_SIZE = int(os.environ.get("SLOW_LOG_SIZE", "200"))
+
+SLOW_LOG: deque = deque(maxlen=SLOW_LOG_SIZE)
+
+
+class StageTimer:
+    """Acumula la duración (ms) de etapas con nombre dentro de una petición."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000.0
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.2f}")
+        return ", ".join(parts)
+
+
+_CURRENT_TIMER: ContextVar[Optional[StageTimer]] = ContextVar("_CURRENT_TIMER", default=None)
+
+
+def stage(name: str):
+    """
+    Mide una etapa de la petición en curso:
+
+        with stage("read_excel"):
+            ...
+
+    Fuera de una petición instrumentada no hace nada.
+    """
+    timer = _CURRENT_TIMER.get()
+    if timer is None:
+        return nullcontext()
+    return timer.stage(name)
+
+
+class TimingMiddleware:
+    """
+    Middleware ASGI que crea un StageTimer por petición, agrega la cabecera
+    `Server-Timing` con las etapas medidas y registra las peticiones lentas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer()
+        token = _CURRENT_TIMER.set(timer)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _CURRENT_TIMER.reset(token)
+            total = timer.total_ms()
+            if total >= SLOW_REQUEST_MS:
+                SLOW_LOG.append({
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status_code,
+                    "duration_ms": round(total, 2),
+                    "stages": {k: round(v, 2) for k, v in timer.stages.items()},
+                })
+
+
+
+# ===================== Compresión =====================
+
+# Respuestas más chicas que esto no se comprimen (no vale la pena).
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+# Desde este tamaño la compresión de una respuesta completa va a un hilo.
+COMPRESS_THREAD_BYTES = 256 * 1024
+# Respuestas ya comprimidas que se guardan (cantidad y bytes en total).
+COMPRESS_CACHE_SIZE = int(os.environ.get("COMPRESS_CACHE_SIZE", "32"))
+COMPRESS_CACHE_MAX_BYTES = int(os.environ.get("COMPRESS_CACHE_MAX_MB", "64")) * 1024 * 1024
+# Rutas cuya respuesta depende sólo de la URL y de la versión de los datos.
+COMPRESS_CACHE_PATHS = {"/api/data", "/api/series"}
+COMPRESSIBLE_TYPES = ("text/", "application/json", "image/svg")
+# Nivel por codificación: (recursos estáticos, una vez al arrancar; respuestas dinámicas)
+COMPRESS_LEVELS = {"br": (11, 5), "zstd": (19, 3), "gzip": (9, 6)}
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli no se ofrece br
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # opcional: sin zstandard no se ofrece zstd
+    zstandard = None
+
+# Codificaciones disponibles, en orden de preferencia.
+ENCODINGS = [e for e, available in (("br", brotli), ("zstd", zstandard), ("gzip", zlib)) if available]
+
+
+def accepted_encodings(header: Optional[str]) -> Dict[str, float]:
+    """Codificaciones de un Accept-Encoding con su q (se descartan las q=0)."""
+    out = {}
+    for part in (header or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            out[name] = q
+    return out
+
+
+def choose_encoding(header: Optional[str], available) -> Optional[str]:
+    """La codificación de `available` (en orden de preferencia) que más quiere el cliente."""
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class StreamCompressor:
+    """Compresor incremental para br, zstd o gzip."""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=level)
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: formato gzip
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self, final: bool = False) -> bytes:
+        """Vacía lo pendiente; con `final` cierra el stream."""
+        if self.encoding == "br":
+            return self._obj.finish() if final else self._obj.flush()
+        if self.encoding == "zstd":
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._obj.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def compress_body(body: bytes, encoding: str, static: bool = False) -> bytes:
+    compressor = StreamCompressor(encoding, COMPRESS_LEVELS[encoding][0 if static else 1])
+    return compressor.compress(body) + compressor.flush(final=True)
+
+
+def _encoded_headers(headers, encoding: str, length: Optional[int]):
+    """Cabeceras de una respuesta comprimida con `encoding` (sin largo si es streaming)."""
+    out = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"vary")]
+    vary = [v for k, v in headers if k.lower() == b"vary"]
+    out.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+    out.append((b"content-encoding", encoding.encode("latin-1")))
+    if length is not None:
+        out.append((b"content-length", str(length).encode("latin-1")))
+    return out
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime las respuestas de /api/ de texto o JSON con
+    la codificación que pide el cliente (br, zstd o gzip, según lo instalado).
+
+    Una respuesta completa se comprime de una vez si pasa COMPRESS_MIN_BYTES.
+    Una de streaming se comprime bloque a bloque, vaciando el compresor en
+    cada uno para que el cliente reciba los datos a medida que salen. Las
+    respuestas de COMPRESS_CACHE_PATHS se guardan comprimidas junto con la
+    versión de los datos (del conjunto pedido con ?dataset=) y, mientras no
+    cambie, se reenvían sin llamar a la app. La clave incluye el Origin del
+    pedido: los encabezados guardados traen los de CORS calculados para él.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._cache: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._cache_bytes = 0
+
+    def _cache_get(self, key, version):
+        entry = self._cache.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _cache_put(self, key, version, start, body) -> None:
+        if len(body) > COMPRESS_CACHE_MAX_BYTES:
+            return
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self._cache_bytes -= len(old[2])
+        # primero se descartan las versiones viejas del mismo conjunto, después las menos usadas
+        for k in [k for k, e in self._cache.items() if e[0][0] == version[0] and e[0] != version]:
+            self._cache_bytes -= len(self._cache.pop(k)[2])
+        self._cache[key] = (version, start, body)
+        self._cache_bytes += len(body)
+        while len(self._cache) > COMPRESS_CACHE_SIZE or self._cache_bytes > COMPRESS_CACHE_MAX_BYTES:
+            self._cache_bytes -= len(self._cache.popitem(last=False)[1][2])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        accept = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"accept-encoding"), None)
+        encoding = choose_encoding(accept, ENCODINGS)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = version = None
+        if scope["method"] == "GET" and scope["path"] in COMPRESS_CACHE_PATHS:
+            query = scope.get("query_string", b"")
+            origin = next((v for k, v in scope["headers"] if k == b"origin"), None)
+            key = (scope["path"], query, encoding, origin)
+            dataset = parse_qs(query.decode("latin-1")).get("dataset", [LIVE_DATASET])[-1]
+            version = (dataset, DATASETS.version(dataset))
+            hit = self._cache_get(key, version)
+            if hit is not None:
+                await send(hit[1])
+                await send({"type": "http.response.body", "body": hit[2]})
+                return
+
+        start = None
+        compressor = None
+        passthrough = False
+        level = COMPRESS_LEVELS[encoding][1]
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = next((v for k, v in headers if k.lower() == b"content-type"), b"").decode("latin-1")
+                passthrough = (message["status"] < 200 or message["status"] in (204, 304)
+                               or any(k.lower() == b"content-encoding" for k, _ in headers)
+                               or not content_type.startswith(COMPRESSIBLE_TYPES))
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None and not more:
+                # respuesta completa
+                if len(body) < COMPRESS_MIN_BYTES:
+                    await send(start)
+                    await send(message)
+                    return
+                with stage("compress"):
+                    if len(body) >= COMPRESS_THREAD_BYTES:
+                        packed = await asyncio.to_thread(compress_body, body, encoding)
+                    else:
+                        packed = compress_body(body, encoding)
+                encoded = {**start, "headers": _encoded_headers(start.get("headers", []), encoding, len(packed))}
+                if key is not None and start["status"] == 200:
+                    self._cache_put(key, version, encoded, packed)
+                await send(encoded)
+                await send({"type": "http.response.body", "body": packed})
+                return
+
+            if compressor is None:
+                compressor = StreamCompressor(encoding, level)
+                await send({**start, "headers": _encoded_headers(start.get("headers", []), encoding, None)})
+            with stage("compress"):
+                out = compressor.compress(body) + compressor.flush(final=not more)
+            await send({"type": "http.response.body", "body": out, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# La compresión queda dentro del temporizador: su costo entra en Server-Timing.
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(TimingMiddleware)
 
 # Descripciones conocidas (ajusta según tus columnas reales)
 KNOWN_FIELD_DESCRIPTIONS = {
@@ -50,2008 +426,1741 @@ def prettify_column_name(col: str) -> str:
     return col2[0].upper() + col2[1:]
 
 
-DASHBOARD_HTML = """
-<!DOCTYPE html>
-<html lang="es">
-<head>
-  <meta charset="UTF-8">
-  <title>ADTEC · Dashboard Invernadero</title>
-  <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-  <script src="https://cdn.jsdelivr.net/npm/xlsx@0.18.5/dist/xlsx.full.min.js"></script>
-  <style>
-    :root {
-      --bg-color: #05070a;
-      --card-color: #111827;
-      --accent: #38bdf8;
-      --accent-soft: rgba(56, 189, 248, 0.15);
-      --text-main: #e5e7eb;
-      --text-muted: #9ca3af;
-      --success: #22c55e;
-      --danger: #ef4444;
-      --warn: #f59e0b;
-      --cool: #0ea5e9;
-      --adtec-yellow: #fbbf24;
-    }
-    * { box-sizing: border-box; }
-    body {
-      margin: 0;
-      font-family: system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
-      background: radial-gradient(circle at top, #020617 0, #020617 45%, #000 100%);
-      color: var(--text-main);
-    }
-    .app-shell { min-height: 100vh; display: flex; flex-direction: column; }
-    header {
-      padding: 16px 32px;
-      border-bottom: 1px solid rgba(148, 163, 184, 0.25);
-      display: flex;
-      align-items: center;
-      justify-content: space-between;
-      gap: 16px;
-      backdrop-filter: blur(10px);
-      background: linear-gradient(to right, rgba(15,23,42,0.95), rgba(15,23,42,0.4));
-    }
-    .logo { display: flex; align-items: center; gap: 12px; }
-    .logo-icon {
-      width: 36px; height: 36px; border-radius: 10px;
-      background: linear-gradient(135deg, #0f172a, #020617);
-      border: 1px solid rgba(248, 250, 252, 0.2);
-      box-shadow: 0 0 25px rgba(250, 204, 21, 0.7);
-      display: flex; align-items: center; justify-content: center;
-      position: relative; overflow: hidden;
-    }
-    .logo-icon::before {
-      content: ""; position: absolute; inset: -40%;
-      background: conic-gradient(from 180deg, #22c55e, #0ea5e9, #fbbf24, #22c55e);
-      opacity: 0.28; mix-blend-mode: screen;
-    }
-    .logo-icon-inner {
-      position: relative; z-index: 1;
-      font-size: 11px; font-weight: 700;
-      color: var(--adtec-yellow); letter-spacing: 0.16em; text-transform: uppercase;
-    }
-    .logo-text-title {
-      font-size: 17px; font-weight: 600;
-      letter-spacing: 0.12em; text-transform: uppercase;
-    }
-    .logo-text-sub { font-size: 12px; color: var(--text-muted); }
-    .logo-text-strong { font-weight: 700; color: var(--adtec-yellow); }
-    main {
-      flex: 1;
-      padding: 12px 24px 32px;
-      max-width: 1320px;
-      margin: 0 auto;
-      width: 100%;
-    }
-    .pill {
-      font-size: 11px;
-      padding: 4px 10px;
-      border-radius: 999px;
-      border: 1px solid rgba(148,163,184,0.5);
-      color: var(--text-muted);
-      display: inline-flex; align-items: center; gap: 4px;
-    }
-    .pill-dot {
-      width: 7px; height: 7px; border-radius: 999px;
-      background: var(--accent); box-shadow: 0 0 12px rgba(56,189,248,0.9);
-    }
-    .tabs {
-      margin-top: 12px;
-      display: flex; gap: 6px;
-      border-bottom: 1px solid rgba(31,41,55,0.9);
-      padding-bottom: 4px;
-    }
-    .tab {
-      font-size: 12px; padding: 7px 14px;
-      border-radius: 999px; border: 1px solid transparent;
-      background: transparent; color: var(--text-muted);
-      cursor: pointer; display: inline-flex; align-items: center; gap: 6px;
-      transition: all 0.12s ease;
-    }
-    .tab-dot {
-      width: 7px; height: 7px; border-radius: 999px;
-      background: rgba(148,163,184,0.7);
-    }
-    .tab.active {
-      border-color: rgba(56,189,248,0.7);
-      background: radial-gradient(circle at top, rgba(56,189,248,0.22), rgba(15,23,42,0.98));
-      color: var(--accent);
-      box-shadow: 0 10px 28px rgba(15,23,42,0.9);
-    }
-    .tab.active .tab-dot {
-      background: var(--accent);
-      box-shadow: 0 0 12px rgba(56,189,248,0.9);
-    }
-    .tab-panel { display: none; margin-top: 14px; }
-    .tab-panel.active { display: block; }
-    .grid {
-      display: grid;
-      grid-template-columns: minmax(0, 3fr) minmax(0, 2fr);
-      gap: 16px;
-    }
-    .card {
-      background: linear-gradient(145deg, rgba(15,23,42,0.97), rgba(15,23,42,0.7));
-      border-radius: 16px;
-      padding: 16px 18px;
-      border: 1px solid rgba(148, 163, 184, 0.35);
-      box-shadow: 0 18px 45px rgba(15,23,42,0.9);
-      position: relative; overflow: hidden;
-    }
-    .card-header {
-      display: flex; justify-content: space-between; align-items: center;
-      margin-bottom: 8px; position: relative; z-index: 1;
-    }
-    .card-title {
-      font-size: 14px; letter-spacing: 0.08em;
-      text-transform: uppercase; color: var(--text-muted);
-    }
-    .btn {
-      border-radius: 999px;
-      border: 1px solid rgba(56,189,248,0.7);
-      background: radial-gradient(circle at top, rgba(56,189,248,0.2), rgba(15,23,42,0.95));
-      color: var(--text-main);
-      padding: 7px 14px; font-size: 12px;
-      cursor: pointer; display: inline-flex; align-items: center; gap: 6px;
-      transition: transform 0.12s ease, box-shadow 0.12s ease, background 0.12s ease;
-    }
-    .btn:hover {
-      transform: translateY(-1px);
-      box-shadow: 0 10px 28px rgba(56,189,248,0.45);
-      background: radial-gradient(circle at top, rgba(56,189,248,0.3), rgba(15,23,42,1));
-    }
-    .btn-secondary {
-      border-color: rgba(148,163,184,0.7);
-      background: radial-gradient(circle at top, rgba(148,163,184,0.15), rgba(15,23,42,0.95));
-      font-size: 11px; padding: 5px 10px;
-    }
-    .upload-area {
-      border-radius: 14px;
-      border: 1px dashed rgba(148, 163, 184, 0.8);
-      padding: 16px 14px;
-      display: flex; flex-direction: column; gap: 8px;
-      background: radial-gradient(circle at top right, rgba(56,189,248,0.12), rgba(15,23,42,0.96));
-    }
-    .upload-row { display: flex; gap: 10px; align-items: center; flex-wrap: wrap; }
-    .form-label-inline { font-size: 11px; color: var(--text-muted); margin-right: 4px; }
-    select, input[type="file"] {
-      font-size: 12px; color: var(--text-main);
-      background: rgba(15,23,42,0.9);
-      border: 1px solid rgba(55,65,81,0.9);
-      border-radius: 999px;
-      padding: 6px 10px; outline: none;
-    }
-    select:focus {
-      border-color: var(--accent);
-      box-shadow: 0 0 0 1px rgba(56,189,248,0.5);
-    }
-    input[type="file"] { border-radius: 6px; }
-    .controls-grid {
-      display: grid;
-      grid-template-columns: repeat(3, minmax(0, 1fr));
-      gap: 8px; margin-top: 10px;
-    }
-    .form-group { display: flex; flex-direction: column; gap: 3px; }
-    .form-label {
-      font-size: 11px; color: var(--text-muted);
-      text-transform: uppercase; letter-spacing: 0.09em;
-    }
-    input[type="datetime-local"] {
-      background: rgba(15,23,42,0.9);
-      border-radius: 10px;
-      border: 1px solid rgba(55,65,81,0.9);
-      padding: 6px 8px; color: var(--text-main); font-size: 12px; outline: none; width: 100%;
-    }
-    .chip-toggle-group { display: flex; gap: 6px; flex-wrap: wrap; margin-top: 6px; }
-    .chip-toggle {
-      font-size: 11px; padding: 4px 9px;
-      border-radius: 999px; border: 1px solid rgba(148,163,184,0.7);
-      background: rgba(15,23,42,0.85);
-      color: var(--text-muted);
-      cursor: pointer; display: inline-flex; align-items: center; gap: 4px;
-    }
-    .chip-toggle.active {
-      border-color: var(--accent);
-      background: var(--accent-soft);
-      color: var(--accent);
-    }
-    .chip-toggle-dot {
-      width: 6px; height: 6px; border-radius: 999px;
-      background: rgba(148,163,184,0.9);
-    }
-    .chip-toggle.active .chip-toggle-dot {
-      background: var(--accent);
-      box-shadow: 0 0 10px rgba(56,189,248,0.8);
-    }
-    .chart-container {
-      margin-top: 12px;
-      padding: 8px;
-      border-radius: 14px;
-      background: radial-gradient(circle at top, rgba(15,23,42,0.5), rgba(2,6,23,0.98));
-      border: 1px solid rgba(30,64,175,0.8);
-      height: 360px;
-    }
-    #chartWideContainer { height: 460px; }
-    canvas { width: 100% !important; height: 100% !important; }
-    .status-grid {
-      display: grid;
-      grid-template-columns: repeat(4, minmax(0, 1fr));
-      gap: 10px; margin-top: 8px;
-    }
-    .status-item {
-      padding: 10px 12px;
-      border-radius: 12px;
-      background: radial-gradient(circle at top, rgba(15,118,110,0.3), rgba(15,23,42,0.96));
-      border: 1px solid rgba(45,212,191,0.4);
-      position: relative;
-    }
-    .status-item h3 {
-      font-size: 11px;
-      text-transform: uppercase; letter-spacing: 0.08em;
-      color: var(--text-muted); margin: 0 0 4px;
-    }
-    .status-value { font-size: 16px; font-weight: 600; }
-    .status-sub {
-      font-size: 11px;
-      color: var(--text-muted);
-      margin-top: 2px;
-    }
-    .status-chip {
-      display: inline-flex; align-items: center; gap: 6px;
-      padding: 3px 8px; border-radius: 999px;
-      font-size: 11px; margin-top: 4px;
-      border: 1px solid rgba(148,163,184,0.4);
-    }
-    .status-chip.on {
-      background: rgba(34,197,94,0.16);
-      color: var(--success);
-      border-color: rgba(34,197,94,0.6);
-    }
-    .status-dot {
-      width: 8px; height: 8px; border-radius: 999px;
-      background: rgba(148,163,184,0.9);
-    }
-    .status-dot.on {
-      background: var(--success);
-      box-shadow: 0 0 10px rgba(34,197,94,0.7);
-    }
-    .temp-bar {
-      width: 100%;
-      height: 8px;
-      border-radius: 999px;
-      background: linear-gradient(90deg, #0ea5e9, #22c55e, #f59e0b, #ef4444);
-      margin-top: 6px;
-      position: relative;
-      overflow: hidden;
-      opacity: 0.9;
-    }
-    .temp-bar-fill {
-      position: absolute;
-      top: 0;
-      left: 0;
-      height: 100%;
-      border-radius: 999px;
-      background: rgba(15,23,42,0.2);
-      border-right: 2px solid rgba(249,250,251,0.9);
-    }
-    .temp-sparkline-wrapper {
-      margin-top: 6px;
-      height: 40px;
-    }
-    #tempSparkline {
-      width: 100% !important;
-      height: 100% !important;
-    }
-    .meta-info {
-      font-size: 11px; color: var(--text-muted);
-      margin-top: 6px;
-      display: flex; justify-content: space-between;
-      flex-wrap: wrap; gap: 4px;
-    }
-    .legend-dot {
-      width: 10px; height: 10px; border-radius: 999px;
-      border: 1px solid rgba(148,163,184,0.9);
-    }
-    .legend-dot.y1 {
-      border-color: #38bdf8; box-shadow: 0 0 12px rgba(56,189,248,0.9);
-    }
-    .legend-dot.y2 {
-      border-color: #a855f7; box-shadow: 0 0 12px rgba(168,85,247,0.9);
-    }
-    .empty-state {
-      font-size: 13px; color: var(--text-muted);
-      text-align: center; padding: 40px 16px;
-    }
-    .table-wrapper {
-      margin-top: 8px;
-      border-radius: 12px;
-      border: 1px solid rgba(31,41,55,0.9);
-      overflow: auto; max-height: 420px;
-      background: rgba(15,23,42,0.98);
-    }
-    table { border-collapse: collapse; width: 100%; font-size: 12px; color: var(--text-main); }
-    th, td {
-      border-bottom: 1px solid rgba(31,41,55,0.9);
-      padding: 6px 8px; text-align: left; white-space: nowrap;
-    }
-    th { position: sticky; top: 0; background: #020617; z-index: 1; }
-    tr:nth-child(even) { background: rgba(15,23,42,0.9); }
-    .fields-grid {
-      display: grid;
-      grid-template-columns: repeat(2, minmax(0, 1fr));
-      gap: 10px; margin-top: 8px;
-    }
-    .field-card {
-      padding: 10px 12px;
-      border-radius: 12px;
-      background: radial-gradient(circle at top, rgba(30,64,175,0.3), rgba(15,23,42,0.96));
-      border: 1px solid rgba(59,130,246,0.6);
-      font-size: 12px;
-    }
-    .field-name { font-weight: 600; }
-    .field-label { color: var(--accent); font-size: 11px; }
-    .field-desc { margin-top: 4px; color: var(--text-muted); font-size: 11px; }
-    @media (max-width: 960px) {
-      .grid { grid-template-columns: minmax(0, 1fr); }
-      header { flex-direction: column; align-items: flex-start; }
-      .status-grid { grid-template-columns: repeat(2, minmax(0, 1fr)); }
-      .fields-grid { grid-template-columns: minmax(0, 1fr); }
-    }
-  </style>
-</head>
-<body>
-  <div class="app-shell">
-    <header>
-      <div class="logo">
-        <div class="logo-icon"><div class="logo-icon-inner">ADTEC</div></div>
-        <div>
-          <div class="logo-text-title">
-            <span class="logo-text-strong">ADTEC Ingeniería</span> · Invernadero inteligente
-          </div>
-          <div class="logo-text-sub">Pozo canadiense · Control VFD · Telemetría local</div>
-        </div>
-      </div>
-      <div class="pill">
-        <div class="pill-dot"></div>
-        <span id="datasetInfo">Sin archivo cargado</span>
-      </div>
-    </header>
-    <div id="gsmStatusBanner" class="card" style="max-width:960px;margin:8px auto 0 auto;padding:8px 12px;display:flex;align-items:center;justify-content:space-between;gap:8px;">
-      <div style="display:flex;align-items:center;gap:8px;">
-        <span id="gsmStatusDot" class="status-dot" style="width:10px;height:10px;"></span>
-        <span id="gsmStatusLabel" class="status-sub">Estado GSM: Desconocido</span>
-      </div>
-      <span id="gsmStatusDetail" class="status-sub" style="font-size:11px;">Esperando datos del ESP32...</span>
-    </div>
-
-
-    <main>
-      <div class="tabs">
-        <button class="tab active" data-tab="dashboard">
-          <span class="tab-dot"></span>Dashboard
-        </button>
-        <button class="tab" data-tab="charts">
-          <span class="tab-dot"></span>Gráficos
-        </button>
-        <button class="tab" data-tab="table">
-          <span class="tab-dot"></span>Tabla de datos
-        </button>
-        <button class="tab" data-tab="control">
-          <span class="tab-dot"></span>Control
-        </button>
-        <button class="tab" data-tab="fields">
-          <span class="tab-dot"></span>Diccionario de campos
-        </button>
-      </div>
-
-      <!-- TAB DASHBOARD -->
-      <div class="tab-panel active" id="tab-dashboard">
-        <div class="grid">
-          <section class="card">
-            <div class="card-header">
-              <div class="card-title">Visualización general</div>
-              <span style="font-size:11px;color:var(--text-muted);">
-                La configuración de gráficos se realiza en la pestaña <strong>Gráficos</strong>.
-              </span>
-            </div>
-            <div class="card-content">
-              <div class="upload-area">
-                <div class="upload-row">
-                  <span class="form-label-inline">Modo de carga:</span>
-                  <select id="uploadMode">
-                    <option value="replace">Reemplazar datos</option>
-                    <option value="append">Añadir a datos actuales</option>
-                  </select>
-                </div>
-                <div class="upload-row">
-                  <input type="file" id="fileInput" accept=".xlsx,.xls">
-                  <button class="btn" id="btnUpload">⬆ Cargar datos</button>
-                </div>
-              </div>
-
-              <div class="chart-container" id="chartContainer">
-                <canvas id="chart"></canvas>
-              </div>
-
-              <div class="meta-info" id="chartMeta" style="display:none;">
-                <span><span class="legend-dot y1"></span> Y1: <span id="metaY1"></span></span>
-                <span><span class="legend-dot y2"></span> Y2: <span id="metaY2"></span></span>
-                <span>Registros en la vista: <span id="metaCount"></span></span>
-              </div>
-
-              <div class="empty-state" id="emptyState">
-                Sube un archivo Excel generado por tu sistema ESP32 para comenzar.<br>
-                Luego entra en la pestaña <strong>Gráficos</strong> para elegir variables, fechas y filtros.
-              </div>
-            </div>
-          </section>
-
-          <section class="card">
-            <div class="card-header">
-              <div class="card-title">Estado actual del sistema</div>
-            </div>
-            <div class="card-content">
-              <div class="status-grid">
-                <div class="status-item" id="statusTempCard">
-                  <h3>Clima interno</h3>
-                  <div class="status-value" id="statusTemp">-- °C</div>
-                  <div class="status-sub" id="statusTempRange">Mín: -- °C · Máx: -- °C</div>
-                  <div class="temp-bar">
-                    <div class="temp-bar-fill" id="tempBarFill" style="width:0%;"></div>
-                  </div>
-                  <div class="temp-sparkline-wrapper">
-                    <canvas id="tempSparkline"></canvas>
-                  </div>
-                  <div class="status-chip" id="chipDayNight">
-                    <span class="status-dot" id="dotDayNight"></span>
-                    <span id="labelDayNight">Sin datos</span>
-                  </div>
-                </div>
-
-                <div class="status-item">
-                  <h3>Modo de trabajo</h3>
-                  <div class="status-value" id="statusMode">--</div>
-                  <div class="status-sub" id="statusModeDesc">Sin datos aún.</div>
-                  <div class="status-chip" id="chipStation">
-                    <span class="status-dot" id="dotStation"></span>
-                    <span id="labelStation">Estación: --</span>
-                  </div>
-                </div>
-
-                <div class="status-item">
-                  <h3>Ventiladores pared</h3>
-                  <div class="status-value" id="statusWall">--</div>
-                  <div class="status-chip" id="chipWall">
-                    <span class="status-dot" id="dotWall"></span>
-                    <span id="labelWall">OFF</span>
-                  </div>
-                </div>
-                <div class="status-item">
-                  <h3>Ventiladores colgantes</h3>
-                  <div class="status-value" id="statusColg">--</div>
-                  <div class="status-sub" id="statusColgDetail">—</div>
-                  <div class="status-chip" id="chipColg">
-                    <span class="status-dot" id="dotColg"></span>
-                    <span id="labelColg">OFF</span>
-                  </div>
-                </div>
-              </div>
-
-              <div class="status-grid" style="margin-top:12px;">
-                <div class="status-item">
-                  <h3>Frecuencia VFD</h3>
-                  <div class="status-value" id="statusVfdFreq">-- Hz</div>
-                </div>
-                <div class="status-item">
-                  <h3>Tensión VFD</h3>
-                  <div class="status-value" id="statusVfdVolt">-- V</div>
-                </div>
-                <div class="status-item">
-                  <h3>Consumo VFD</h3>
-                  <div class="status-value" id="statusVfdCurr">-- A</div>
-                </div>
-                <div class="status-item">
-                  <h3>Último registro</h3>
-                  <div class="status-value" id="statusLastTs">--</div>
-                </div>
-              </div>
-
-              <!-- NUEVOS WIDGETS -->
-              <div class="status-grid" style="margin-top:12px;">
-                <div class="status-item">
-                  <h3>Estabilidad térmica (hoy)</h3>
-                  <div class="status-value" id="statusTempStd">--</div>
-                  <div class="status-sub" id="statusTempMean">Promedio: -- °C</div>
-                </div>
-                <div class="status-item">
-                  <h3>Ventilación últimas 24 h</h3>
-                  <div class="status-sub" id="statusVentHours">Pared: -- h · Colg.: -- h</div>
-                  <div class="status-sub" id="statusVentSamples">Muestras analizadas: --</div>
-                </div>
-                <div class="status-item">
-                  <h3>Energía estimada 24 h</h3>
-                  <div class="status-value" id="statusEnergy">-- kWh</div>
-                  <div class="status-sub" id="statusPowerMean">Potencia media: -- kW</div>
-                </div>
-                <div class="status-item">
-                  <h3>Carga por modo (hoy)</h3>
-                  <div class="status-sub" id="statusModeLoad">
-                    Auto: -- h · Verano man.: -- h · Invierno man.: -- h
-                  </div>
-                </div>
-              </div>
-              <!-- FIN NUEVOS WIDGETS -->
-
-            
-                <div class="status-item" id="statusHumCard">
-                  <h3>Humedad interna</h3>
-                  <div class="status-value" id="statusHum">-- %</div>
-                  <div class="status-sub" id="statusHumRange">Mín: -- % · Máx: -- %</div>
-                  <div class="temp-bar">
-                    <div class="temp-bar-fill" id="humBarFill" style="width:0%;"></div>
-                  </div>
-                </div>
-
-                <div class="status-item">
-                  <h3>Bomba / nebulización</h3>
-                  <div class="status-value" id="statusPump">--</div>
-                  <div class="status-chip" id="chipPump">
-                    <span class="status-dot" id="dotPump"></span>
-                    <span id="labelPump">OFF</span>
-                  </div>
-                </div>
-
-                <div class="status-item">
-                  <h3>Clima exterior</h3>
-                  <div class="status-sub">Benjamín Aceval · Cerrito, Paraguay</div>
-                  <div style="margin-top:8px;">
-                    <a class="weatherwidget-io"
-                       href="https://forecast7.com/en/n25d04n57d37/asuncion/"
-                       data-label_1="BENJAMÍN ACEVAL"
-                       data-label_2="CERRITO · PY"
-                       data-theme="dark"
-                       data-basecolor="#020617"
-                       data-textcolor="#e5e7eb"
-                       data-highcolor="#fbbf24"
-                       data-lowcolor="#38bdf8"
-                       data-suncolor="#fbbf24"
-                       data-mooncolor="#38bdf8">
-                      BENJAMÍN ACEVAL CERRITO · PY
-                    </a>
-                  </div>
-                </div>
-</div>
-          </section>
-        </div>
-      </div>
-
-      <!-- TAB GRAFICOS -->
-      <div class="tab-panel" id="tab-charts">
-        <section class="card">
-          <div class="card-header">
-            <div class="card-title">Laboratorio de gráficos</div>
-            <button class="btn-secondary btn" id="btnReset">⟳ Reset filtros</button>
-          </div>
-          <div class="card-content">
-            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
-              Aquí eliges qué variables graficar, en qué rango de fechas y si quieres ver sólo día o sólo noche.
-              El gráfico grande de abajo se actualiza y el pequeño del Dashboard se mantiene sincronizado.
-            </p>
-
-            <div id="controlsWrapper" style="margin-top:10px;">
-              <div class="controls-grid">
-                <div class="form-group">
-                  <label class="form-label">Variable eje Y principal</label>
-                  <select id="selectY1"></select>
-                </div>
-                <div class="form-group">
-                  <label class="form-label">Variable eje Y secundario</label>
-                  <select id="selectY2">
-                    <option value="">(sin eje secundario)</option>
-                  </select>
-                </div>
-                <div class="form-group">
-                  <label class="form-label">Columna de tiempo</label>
-                  <select id="selectTime"></select>
-                </div>
-              </div>
-
-              <div class="controls-grid" style="margin-top:8px;">
-                <div class="form-group">
-                  <label class="form-label">Desde</label>
-                  <input type="datetime-local" id="fromDate">
-                </div>
-                <div class="form-group">
-                  <label class="form-label">Hasta</label>
-                  <input type="datetime-local" id="toDate">
-                </div>
-                <div class="form-group">
-                  <label class="form-label">Rango rápido</label>
-                  <select id="selectRangePreset">
-                    <option value="last_day" selected>Último día</option>
-                    <option value="last_7">Últimos 7 días</option>
-                    <option value="last_30">Último mes</option>
-                    <option value="all">Todo el dataset</option>
-                  </select>
-                </div>
-                <div class="form-group">
-                  <label class="form-label">Vista</label>
-                  <div class="chip-toggle-group">
-
-                <div class="form-group">
-                  <label class="form-label">Exportar</label>
-                  <button class="btn" id="btnExportXlsx" type="button">⬇ Exportar XLSX</button>
-                </div>
-                    <button class="chip-toggle active" data-filter="all" id="fltAll">
-                      <span class="chip-toggle-dot"></span>Todo el día
-                    </button>
-                    <button class="chip-toggle" data-filter="day" id="fltDay">
-                      <span class="chip-toggle-dot"></span>Sólo horario diurno
-                    </button>
-                    <button class="chip-toggle" data-filter="night" id="fltNight">
-                      <span class="chip-toggle-dot"></span>Sólo horario nocturno
-                    </button>
-                  </div>
-                </div>
-              </div>
-            </div>
-
-            <div class="chart-container" id="chartWideContainer">
-              <canvas id="chartWide"></canvas>
-            </div>
-          </div>
-        </section>
-      </div>
-
-      <!-- TAB TABLA -->
-      <div class="tab-panel" id="tab-table">
-        <section class="card">
-          <div class="card-header">
-            <div class="card-title">Tabla de registros</div>
-          </div>
-          <div class="card-content">
-            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
-              Visualización tabular de los datos capturados (muestra hasta 300 filas para no saturar el navegador).
-            </p>
-            <div class="table-wrapper" id="tableWrapper"></div>
-          </div>
-        </section>
-      </div>
-
-      
-      <!-- TAB CONTROL -->
-      <div class="tab-panel" id="tab-control">
-        <section class="card">
-          <div class="card-header">
-            <div class="card-title">Control remoto de equipos</div>
-          </div>
-          <div class="card-content">
-            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
-              Desde aquí puedes ver el estado actual reportado por el ESP32 y enviar órdenes manuales
-              a los relés de pared, colgantes y bomba / nebulización.
-            </p>
-
-            <div class="controls-grid" style="margin-top:10px;">
-              <div class="form-group">
-                <label class="form-label">Ventiladores pared</label>
-                <div class="status-sub" id="ctrlWallState">Estado actual: --</div>
-                <div class="chip-toggle-group" style="margin-top:6px;">
-                  <label class="status-sub">
-                    <input type="checkbox" id="ctrlWallManual"> Modo manual
-                  </label>
-                  <label class="status-sub">
-                    <input type="checkbox" id="ctrlWallOn"> Forzar ON
-                  </label>
-                </div>
-              </div>
-
-              <div class="form-group">
-                <label class="form-label">Ventiladores colgantes</label>
-                <div class="status-sub" id="ctrlColgState">Estado actual: --</div>
-                <div class="status-sub" id="ctrlColgDetail">Cantidad objetivo / real: --</div>
-                <div class="chip-toggle-group" style="margin-top:6px;">
-                  <label class="status-sub">
-                    <input type="checkbox" id="ctrlColgManual"> Modo manual
-                  </label>
-                  <label class="status-sub">
-                    <input type="checkbox" id="ctrlColgOn"> Forzar ON
-                  </label>
-                </div>
-              </div>
-
-              <div class="form-group">
-                <label class="form-label">Bomba / nebulización</label>
-                <div class="status-sub" id="ctrlPumpState">Estado actual: --</div>
-                <div class="chip-toggle-group" style="margin-top:6px;">
-                  <label class="status-sub">
-                    <input type="checkbox" id="ctrlPumpManual"> Modo manual
-                  </label>
-                  <label class="status-sub">
-                    <input type="checkbox" id="ctrlPumpOn"> Forzar ON
-                  </label>
-                </div>
-              </div>
-            </div>
-
-            <div style="margin-top:12px; display:flex; gap:8px; flex-wrap:wrap;">
-              <button class="btn" id="btnApplyControl">Aplicar cambios</button>
-              <span style="font-size:11px;color:var(--text-muted);" id="ctrlStatusMsg">
-                Los cambios se envían a /api/control_state y serán leídos por el ESP32 en su próximo ciclo.
-              </span>
-            </div>
-          </div>
-        </section>
-      </div>
-
-<!-- TAB CAMPOS -->
-      <div class="tab-panel" id="tab-fields">
-        <section class="card">
-          <div class="card-header">
-            <div class="card-title">Diccionario de campos</div>
-          </div>
-          <div class="card-content">
-            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
-              Aquí ves el nombre real de cada columna (como está en el Excel),
-              la etiqueta legible que usa la interfaz y una descripción funcional.
-            </p>
-            <div class="fields-grid" id="fieldsGrid"></div>
-          </div>
-        </section>
-      </div>
-    </main>
-  </div>
-
-  
-  <script>
-    (function() {
-      var d = document;
-      var id = "weatherwidget-io-js";
-      if (!d.getElementById(id)) {
-        var s = d.createElement("script");
-        s.id = id;
-        s.src = "https://weatherwidget.io/js/widget.min.js";
-        s.async = true;
-        d.head.appendChild(s);
-      }
-    })();
-  </script>
-
-<script>
-    let globalData = null;
-    let globalChart = null;
-    let globalChartWide = null;
-    let currentFilter = "all";
-
-    function setDatasetInfo(text) {
-      document.getElementById("datasetInfo").textContent = text;
-    }
+def build_field_metadata(columns):
+    """Devuelve (etiquetas legibles, descripciones) para cada columna."""
+    field_labels = {}
+    field_descriptions = {}
+    for c in columns:
+        pretty = prettify_column_name(c)
+        field_labels[c] = pretty
+        desc = KNOWN_FIELD_DESCRIPTIONS.get(c)
+        if desc is None:
+            desc = f"Campo registrado: {pretty}."
+        field_descriptions[c] = desc
+    return field_labels, field_descriptions
 
-    function setEmptyState(visible) {
-      const empty = document.getElementById("emptyState");
-      const meta = document.getElementById("chartMeta");
-      if (empty) empty.style.display = visible ? "block" : "none";
-      if (meta) meta.style.display = visible ? "none" : "flex";
-      // Los controles del laboratorio de gráficos permanecen visibles siempre,
-      // aunque no haya datos todavía.
-    }
 
-    function accentChip(el, on) {
-      if (!el) return;
-      if (on) el.classList.add("active"); else el.classList.remove("active");
-    }
+def serialize_value(val, is_datetime: bool):
+    """Convierte un valor de pandas/numpy en algo serializable a JSON."""
+    if pd.isna(val):
+        return None
+    if is_datetime:
+        return val.isoformat()
+    return val.item() if hasattr(val, "item") else val
 
-    function applyFilterButtons() {
-      accentChip(document.getElementById("fltAll"), currentFilter === "all");
-      accentChip(document.getElementById("fltDay"), currentFilter === "day");
-      accentChip(document.getElementById("fltNight"), currentFilter === "night");
-    }
 
-    async function uploadFile() {
-      const input = document.getElementById("fileInput");
-      const mode = document.getElementById("uploadMode").value || "replace";
-      if (!input.files || !input.files.length) {
-        alert("Selecciona un archivo Excel primero.");
-        return;
-      }
-      const formData = new FormData();
-      formData.append("file", input.files[0]);
-      setDatasetInfo("Subiendo archivo...");
-      try {
-        const resp = await fetch("/upload?mode=" + encodeURIComponent(mode), {
-          method: "POST",
-          body: formData
-        });
-        if (!resp.ok) {
-          const txt = await resp.text();
-          alert("Error al subir el archivo: " + txt);
-          setDatasetInfo("Error en subida");
-          return;
-        }
-        const json = await resp.json();
-        setDatasetInfo(`Archivo: ${json.filename} · ${json.rows} filas, ${json.columns.length} columnas`);
-        await loadData();
-      } catch (err) {
-        console.error(err);
-        alert("Error de red al subir el archivo.");
-        setDatasetInfo("Error de red");
-      }
-    }
+def dataframe_to_records(df, datetime_cols):
+    """Lista de dicts fila → valor, tal como la consume el dashboard."""
+    dt = set(datetime_cols)
+    data_rows = []
+    for _, row in df.iterrows():
+        record = {}
+        for c in df.columns:
+            record[c] = serialize_value(row[c], c in dt)
+        data_rows.append(record)
+    return data_rows
 
-    async function loadData() {
-      try {
-        const resp = await fetch("/api/data");
-        if (!resp.ok) {
-          setEmptyState(true);
-          return;
-        }
-        globalData = await resp.json();
-        if (!globalData.rows || !globalData.rows.length) {
-          setEmptyState(true);
-          return;
-        }
-        initControls();
-        updateStatusFromData();
-        updateGsmStatusFromData();
-        updateChart();
-        renderTable();
-        renderFieldsDictionary();
-        setEmptyState(false);
-      } catch (err) {
-        console.error(err);
-        setEmptyState(true);
-      }
-    }
 
-    function findPreferredColumn(candidates, inList) {
-      for (const c of candidates) {
-        if (inList.includes(c)) return c;
-      }
-      return inList[0] || null;
-    }
+def last_record(df):
+    """Último registro del DataFrame como dict serializable."""
+    last_row = df.iloc[-1]
+    datetime_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+    return {c: serialize_value(last_row[c], c in datetime_cols) for c in df.columns}
 
-    function initControls() {
-      if (!globalData) return;
-      const numericCols = globalData.numericColumns || [];
-      const timeCols = globalData.datetimeColumns || [];
-      const labels = globalData.fieldFriendlyLabels || {};
-
-      const selectY1 = document.getElementById("selectY1");
-      const selectY2 = document.getElementById("selectY2");
-      const selectTime = document.getElementById("selectTime");
-
-      if (!selectY1 || !selectY2 || !selectTime) return;
-
-      selectY1.innerHTML = "";
-      selectY2.innerHTML = '<option value="">(sin eje secundario)</option>';
-      selectTime.innerHTML = "";
-
-      numericCols.forEach(col => {
-        const label = labels[col] || col;
-        const opt1 = document.createElement("option");
-        opt1.value = col;
-        opt1.textContent = label;
-        selectY1.appendChild(opt1);
-
-        const opt2 = document.createElement("option");
-        opt2.value = col;
-        opt2.textContent = label;
-        selectY2.appendChild(opt2);
-      });
-
-      timeCols.forEach(col => {
-        const label = labels[col] || col;
-        const opt = document.createElement("option");
-        opt.value = col;
-        opt.textContent = label;
-        selectTime.appendChild(opt);
-      });
-
-      const preferredY1 = findPreferredColumn(
-        ["temp_invernadero_C", "tempC", "temperatura"],
-        numericCols
-      );
-      const preferredY2 = findPreferredColumn(
-        ["vfd_freq_out_Hz", "freq_cmd_Hz", "freq_ref_Hz"],
-        numericCols
-      );
-      const preferredTime = findPreferredColumn(
-        ["timestamp", "FechaHora", "fecha_hora"],
-        timeCols
-      );
-
-      if (preferredY1) selectY1.value = preferredY1;
-      if (preferredY2) selectY2.value = preferredY2;
-      if (preferredTime) selectTime.value = preferredTime;
-
-      document.getElementById("fromDate").value = "";
-      document.getElementById("toDate").value = "";
-    }
 
-    function parseDateFromRow(row, timeCol) {
-      if (!timeCol || !row[timeCol]) return null;
-      const d = new Date(row[timeCol]);
-      if (isNaN(d.getTime())) return null;
-      return d;
-    }
+def is_text_dtype(series) -> bool:
+    """True para columnas de texto (object o el dtype `str` de pandas >= 3)."""
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
 
-    function filterRows() {
-      if (!globalData) return [];
-      const rows = globalData.rows || [];
-      const timeCol = document.getElementById("selectTime").value;
-
-      const fromStr = document.getElementById("fromDate").value;
-      const toStr = document.getElementById("toDate").value;
-      const fromDate = fromStr ? new Date(fromStr) : null;
-      const toDate = toStr ? new Date(toStr) : null;
-
-      return rows.filter(row => {
-        const d = parseDateFromRow(row, timeCol);
-        if (d) {
-          if (fromDate && d < fromDate) return false;
-          if (toDate && d > toDate) return false;
-        }
-        if (currentFilter === "day" || currentFilter === "night") {
-          if (!d) return false;
-          const hour = d.getHours();
-          const isDay = hour >= 7 && hour < 19;
-          if (currentFilter === "day" && !isDay) return false;
-          if (currentFilter === "night" && isDay) return false;
-        }
-        return true;
-      });
-    }
 
-    function formatForDateTimeLocal(d) {
-      if (!d) return "";
-      const pad = (n) => String(n).padStart(2, "0");
-      const yyyy = d.getFullYear();
-      const MM = pad(d.getMonth() + 1);
-      const dd = pad(d.getDate());
-      const hh = pad(d.getHours());
-      const mm = pad(d.getMinutes());
-      return `${yyyy}-${MM}-${dd}T${hh}:${mm}`;
-    }
+def parse_datetime_columns(df):
+    """
+    Convierte in-place a datetime las columnas de texto que parecen fechas
+    (más de la mitad de los valores parseables).
+    """
+    for col in df.columns:
+        if is_text_dtype(df[col]):
+            try:
+                parsed = pd.to_datetime(df[col])
+                if parsed.notna().mean() > 0.5:
+                    df[col] = parsed
+            except Exception:
+                continue
+    return df
 
-    function applyRangePreset(preset) {
-      const selectTime = document.getElementById("selectTime");
-      const timeCol = selectTime ? selectTime.value : null;
-      if (!globalData || !globalData.rows || !globalData.rows.length || !timeCol) return;
-
-      const rows = globalData.rows || [];
-      const times = rows
-        .map(r => parseDateFromRow(r, timeCol))
-        .filter(d => d !== null)
-        .sort((a, b) => a - b);
-
-      if (!times.length) return;
-      const last = times[times.length - 1];
-      let from;
-
-      if (preset === "last_day") {
-        from = new Date(last.getTime() - 24 * 60 * 60 * 1000);
-      } else if (preset === "last_7") {
-        from = new Date(last.getTime() - 7 * 24 * 60 * 60 * 1000);
-      } else if (preset === "last_30") {
-        from = new Date(last.getTime() - 30 * 24 * 60 * 60 * 1000);
-      } else if (preset === "all") {
-        from = times[0];
-      } else {
-        return;
-      }
-
-      const fromInput = document.getElementById("fromDate");
-      const toInput = document.getElementById("toDate");
-      if (fromInput) fromInput.value = formatForDateTimeLocal(from);
-      if (toInput) toInput.value = formatForDateTimeLocal(last);
-    }
 
+# ===================== Consultas por rango =====================
 
-    
-    function exportXlsx() {
-      if (!globalData || !globalData.rows || !globalData.rows.length) {
-        alert("No hay datos para exportar.");
-        return;
-      }
-      if (typeof XLSX === "undefined") {
-        alert("La librería XLSX no está disponible en esta página.");
-        return;
-      }
-      const rows = filterRows();
-      if (!rows.length) {
-        alert("No hay filas en el rango seleccionado.");
-        return;
-      }
-      const cols = globalData.columns || [];
-      const dataForSheet = rows.map(r => {
-        const obj = {};
-        cols.forEach(c => {
-          obj[c] = r[c];
-        });
-        return obj;
-      });
-      const wb = XLSX.utils.book_new();
-      const ws = XLSX.utils.json_to_sheet(dataForSheet);
-      XLSX.utils.book_append_sheet(wb, ws, "datos_filtrados");
-      XLSX.writeFile(wb, "invernadero_export.xlsx");
-    }
+# Columnas de tiempo preferidas, en el mismo orden que usa el dashboard.
+TIME_COLUMN_CANDIDATES = ["timestamp", "FechaHora", "fecha_hora"]
 
-    function buildDatasetsAndLabels() {
-      if (!globalData) return { labels: [], datasets: [] };
-
-      const y1 = document.getElementById("selectY1")?.value;
-      const y2 = document.getElementById("selectY2")?.value;
-      const timeCol = document.getElementById("selectTime")?.value;
-      const labelsDict = globalData.fieldFriendlyLabels || {};
-
-      const filtered = filterRows();
-      const labels = [];
-      const dataY1 = [];
-      const dataY2 = [];
-
-      filtered.forEach(row => {
-        const d = parseDateFromRow(row, timeCol);
-        labels.push(d ? d : row[timeCol] || "");
-        dataY1.push(y1 ? Number(row[y1]) : null);
-        if (y2) dataY2.push(Number(row[y2]));
-      });
-
-      const datasets = [];
-      if (y1) {
-        datasets.push({
-          label: labelsDict[y1] || y1,
-          data: dataY1,
-          borderColor: "rgba(56,189,248,0.9)",
-          backgroundColor: "rgba(56,189,248,0.2)",
-          borderWidth: 2,
-          tension: 0.25,
-          yAxisID: "y1",
-          pointRadius: 0
-        });
-      }
-      if (y2) {
-        datasets.push({
-          label: labelsDict[y2] || y2,
-          data: dataY2,
-          borderColor: "rgba(168,85,247,0.9)",
-          backgroundColor: "rgba(168,85,247,0.18)",
-          borderWidth: 2,
-          tension: 0.25,
-          yAxisID: "y2",
-          pointRadius: 0
-        });
-      }
-
-      return { labels, datasets, filtered, labelsDict, y1, y2 };
-    }
+# Zona horaria del invernadero. Los timestamps sin zona (los del ESP32) se
+# consideran ya en hora local; los que traen zona se convierten a ésta.
+GREENHOUSE_TZ = os.environ.get("GREENHOUSE_TZ", "America/Asuncion")
 
-    function updateChart() {
-      if (!globalData) return;
-
-      const ctxMain = document.getElementById("chart").getContext("2d");
-      const ctxWide = document.getElementById("chartWide").getContext("2d");
-
-      const { labels, datasets, filtered, labelsDict, y1, y2 } = buildDatasetsAndLabels();
-
-      const baseOptions = {
-        responsive: true,
-        maintainAspectRatio: false,
-        interaction: { mode: "index", intersect: false },
-        scales: {
-          x: {
-            ticks: { color: "rgba(148,163,184,0.9)", maxRotation: 0, autoSkip: true },
-            grid: { color: "rgba(31,41,55,0.8)" }
-          },
-          y1: {
-            position: "left",
-            ticks: { color: "rgba(56,189,248,0.9)" },
-            grid: { color: "rgba(31,41,55,0.7)" }
-          },
-          y2: {
-            position: "right",
-            ticks: { color: "rgba(168,85,247,0.9)" },
-            grid: { drawOnChartArea: false }
-          }
-        },
-        plugins: {
-          legend: {
-            labels: { color: "rgba(209,213,219,0.9)" }
-          }
-        }
-      };
-
-      if (globalChart) globalChart.destroy();
-      globalChart = new Chart(ctxMain, {
-        type: "line",
-        data: { labels, datasets },
-        options: baseOptions
-      });
-
-      if (globalChartWide) globalChartWide.destroy();
-      globalChartWide = new Chart(ctxWide, {
-        type: "line",
-        data: { labels, datasets },
-        options: baseOptions
-      });
-
-      document.getElementById("metaY1").textContent = y1 ? (labelsDict[y1] || y1) : "—";
-      document.getElementById("metaY2").textContent = y2 ? (labelsDict[y2] || y2) : "—";
-      document.getElementById("metaCount").textContent = filtered.length;
-    }
+# Ventana diurna para los filtros day/night:
+#   DAY_WINDOW=fixed → de DAY_START a DAY_END (hora local, "HH:MM")
+#   DAY_WINDOW=sun   → de la salida a la puesta del sol en SITE_LAT/SITE_LON
+DAY_WINDOW = os.environ.get("DAY_WINDOW", "fixed")
+DAY_START = os.environ.get("DAY_START", "07:00")
+DAY_END = os.environ.get("DAY_END", "19:00")
+# Benjamín Aceval · Cerrito (PY)
+SITE_LAT = float(os.environ.get("SITE_LAT", "-24.97"))
+SITE_LON = float(os.environ.get("SITE_LON", "-57.57"))
 
-    function setOnOffChip(chipId, dotId, labelId, isOn, textIfOn, textIfOff) {
-      const chip = document.getElementById(chipId);
-      const dot = document.getElementById(dotId);
-      const label = document.getElementById(labelId);
-      if (!chip || !dot || !label) return;
-      if (isOn) {
-        chip.classList.add("on");
-        dot.classList.add("on");
-        label.textContent = textIfOn || "ON";
-      } else {
-        chip.classList.remove("on");
-        dot.classList.remove("on");
-        label.textContent = textIfOff || "OFF";
-      }
-    }
 
-    function tempColorForValue(t) {
-      if (t === null || isNaN(t)) return "#6b7280";
-      if (t < 18) return "#0ea5e9";
-      if (t < 26) return "#22c55e";
-      if (t < 32) return "#f59e0b";
-      return "#ef4444";
-    }
+def _minutes_of_day(hhmm: str) -> int:
+    hh, _, mm = hhmm.partition(":")
+    return int(hh) * 60 + int(mm or 0)
 
-    function drawTempSparkline(dayTemps) {
-      const canvas = document.getElementById("tempSparkline");
-      if (!canvas) return;
-      const ctx = canvas.getContext("2d");
-      const w = canvas.width = canvas.clientWidth;
-      const h = canvas.height = canvas.clientHeight;
-
-      ctx.clearRect(0, 0, w, h);
-
-      if (!dayTemps || !dayTemps.length) return;
-      const minT = Math.min(...dayTemps);
-      const maxT = Math.max(...dayTemps);
-      const color = tempColorForValue(dayTemps[dayTemps.length - 1]);
-
-      ctx.beginPath();
-      dayTemps.forEach((t, idx) => {
-        const x = (idx / (dayTemps.length - 1 || 1)) * (w - 4) + 2;
-        let y = h / 2;
-        if (maxT > minT) {
-          const norm = (t - minT) / (maxT - minT);
-          y = (1 - norm) * (h - 6) + 3;
-        }
-        if (idx === 0) ctx.moveTo(x, y);
-        else ctx.lineTo(x, y);
-      });
-      ctx.strokeStyle = color;
-      ctx.lineWidth = 1.5;
-      ctx.stroke();
-    }
+# Filas por bloque al exportar (acota la memoria usada por cada export).
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "50000"))
 
-    function computeStd(values) {
-      if (!values || values.length === 0) return null;
-      const mean = values.reduce((a, b) => a + b, 0) / values.length;
-      const variance = values.reduce((acc, v) => acc + Math.pow(v - mean, 2), 0) / values.length;
-      return Math.sqrt(variance);
-    }
 
-    function updateTemperatureVisuals() {
-      if (!globalData || !globalData.rows || !globalData.rows.length) return;
-      const rows = globalData.rows;
-      const cols = globalData.columns || [];
-      const timeCols = globalData.datetimeColumns || [];
-
-      const timeCol = timeCols.includes("timestamp")
-        ? "timestamp"
-        : (timeCols[0] || null);
-
-      const tempCol = cols.find(c => ["temp_invernadero_C", "tempC", "temperatura"].includes(c));
-      if (!tempCol) return;
-
-      let lastRow = rows[rows.length - 1];
-      if (timeCol) {
-        const sorted = [...rows].filter(r => r[timeCol]).sort((a, b) => {
-          return new Date(a[timeCol]) - new Date(b[timeCol]);
-        });
-        if (sorted.length) lastRow = sorted[sorted.length - 1];
-      }
-
-      const lastTemp = lastRow[tempCol] !== undefined ? Number(lastRow[tempCol]) : null;
-
-      let refDate = null;
-      if (timeCol && lastRow[timeCol]) {
-        const d = new Date(lastRow[timeCol]);
-        if (!isNaN(d.getTime())) refDate = d;
-      }
-
-      let dayTemps = [];
-      if (refDate && timeCol) {
-        const day = refDate.getDate();
-        const month = refDate.getMonth();
-        const year = refDate.getFullYear();
-        rows.forEach(r => {
-          if (!r[timeCol]) return;
-          const d = new Date(r[timeCol]);
-          if (isNaN(d.getTime())) return;
-          if (d.getDate() === day && d.getMonth() === month && d.getFullYear() === year) {
-            const tv = Number(r[tempCol]);
-            if (!isNaN(tv)) dayTemps.push(tv);
-          }
-        });
-      }
-
-      if (!dayTemps.length) {
-        dayTemps = rows
-          .map(r => Number(r[tempCol]))
-          .filter(v => !isNaN(v));
-      }
-
-      let minT = null;
-      let maxT = null;
-      let meanT = null;
-      let stdT = null;
-      if (dayTemps.length) {
-        minT = Math.min(...dayTemps);
-        maxT = Math.max(...dayTemps);
-        meanT = dayTemps.reduce((a, b) => a + b, 0) / dayTemps.length;
-        stdT = computeStd(dayTemps);
-      }
-
-      const rangeLabel = document.getElementById("statusTempRange");
-      if (rangeLabel) {
-        if (minT !== null && maxT !== null) {
-          rangeLabel.textContent = `Mín: ${minT.toFixed(1)} °C · Máx: ${maxT.toFixed(1)} °C`;
-        } else {
-          rangeLabel.textContent = "Mín: -- °C · Máx: -- °C";
-        }
-      }
-
-      const tempValueLabel = document.getElementById("statusTemp");
-      if (tempValueLabel) {
-        tempValueLabel.textContent =
-          (lastTemp !== null && !isNaN(lastTemp)) ? `${lastTemp.toFixed(1)} °C` : "-- °C";
-      }
-
-      const barFill = document.getElementById("tempBarFill");
-      if (barFill) {
-        let pct = 50;
-        if (minT !== null && maxT !== null && maxT > minT && lastTemp !== null && !isNaN(lastTemp)) {
-          pct = ((lastTemp - minT) / (maxT - minT)) * 100;
-          if (pct < 0) pct = 0;
-          if (pct > 100) pct = 100;
-        }
-        barFill.style.width = pct + "%";
-        barFill.style.backgroundColor = tempColorForValue(lastTemp);
-      }
-
-      const tempCard = document.getElementById("statusTempCard");
-      if (tempCard) {
-        const color = tempColorForValue(lastTemp);
-        tempCard.style.boxShadow = `0 0 24px ${color}40`;
-        tempCard.style.borderColor = `${color}80`;
-      }
-
-      const stdLabel = document.getElementById("statusTempStd");
-      const meanLabel = document.getElementById("statusTempMean");
-      if (stdLabel) {
-        if (stdT !== null) {
-          stdLabel.textContent = stdT.toFixed(2) + " °C";
-        } else {
-          stdLabel.textContent = "--";
-        }
-      }
-      if (meanLabel) {
-        if (meanT !== null) {
-          meanLabel.textContent = `Promedio: ${meanT.toFixed(1)} °C`;
-        } else {
-          meanLabel.textContent = "Promedio: -- °C";
-        }
-      }
+def find_time_column(df) -> Optional[str]:
+    """Columna de tiempo principal: datetime preferida, o el `timestamp` de texto del ESP32."""
+    datetime_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+    for c in TIME_COLUMN_CANDIDATES:
+        if c in datetime_cols:
+            return c
+    if datetime_cols:
+        return datetime_cols[0]
+    for c in TIME_COLUMN_CANDIDATES:
+        if c in df.columns:
+            return c
+    return None
+
+
+def time_values(df, col: str):
+    """Serie datetime de la columna `col` (parsea texto; lo inválido queda NaT)."""
+    s = df[col]
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, errors="coerce")
+
+
+def parse_time_param(value: Optional[str]):
+    """Parsea un parámetro from/to (ISO o datetime-local). Lanza ValueError si es inválido."""
+    if value is None or value == "":
+        return None
+    ts = pd.Timestamp(value)
+    if pd.isna(ts):
+        raise ValueError(f"fecha inválida: {value!r}")
+    return ts
+
+
+def _align_tz(ts, tz):
+    """Ajusta el timestamp de un parámetro a la zona horaria de la serie."""
+    if ts is None:
+        return None
+    if tz is None:
+        return ts.tz_convert(None) if ts.tzinfo is not None else ts
+    return ts.tz_convert(tz) if ts.tzinfo is not None else ts.tz_localize(tz)
+
+
+def iter_chunks(snap, positions, columns):
+    """Recorre las filas seleccionadas de `snap` en bloques de EXPORT_CHUNK_ROWS."""
+    for start in range(0, len(positions), EXPORT_CHUNK_ROWS):
+        yield snap.take(columns, positions[start:start + EXPORT_CHUNK_ROWS])
+
+
+def _naive_datetimes(chunk):
+    """Excel no admite zonas horarias: se exportan las fechas en hora local sin tz."""
+    for c in chunk.columns:
+        if isinstance(chunk[c].dtype, pd.DatetimeTZDtype):
+            chunk[c] = chunk[c].dt.tz_localize(None)
+    return chunk
+
+
+def iter_csv(snap, positions, columns):
+    yield snap.schema[columns].to_csv(index=False)
+    for chunk in iter_chunks(snap, positions, columns):
+        yield chunk.to_csv(index=False, header=False)
+
+
+def iter_xlsx(snap, positions, columns):
+    # Workbook write_only vuelca las filas a un archivo temporal en lugar de
+    # mantener todas las celdas en memoria.
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("datos_filtrados")
+    ws.append(list(columns))
+    for chunk in iter_chunks(snap, positions, columns):
+        chunk = _naive_datetimes(chunk.copy()).astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append(row)
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            data = tmp.read(1 << 16)
+            if not data:
+                break
+            yield data
+
+
+class _ByteSink:
+    """Archivo mínimo en memoria que se vacía después de cada bloque escrito."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
 
-      drawTempSparkline(dayTemps);
-    }
 
-    function estimateStepHours(rows, timeCol) {
-      if (!timeCol) return 0.5;
-      const times = [];
-      rows.forEach(r => {
-        if (!r[timeCol]) return;
-        const d = new Date(r[timeCol]);
-        if (!isNaN(d.getTime())) times.push(d.getTime());
-      });
-      if (times.length < 2) return 0.5;
-      times.sort((a, b) => a - b);
-      let diffs = [];
-      for (let i = 1; i < times.length; i++) {
-        diffs.push(times[i] - times[i - 1]);
-      }
-      if (!diffs.length) return 0.5;
-      const avgMs = diffs.reduce((a, b) => a + b, 0) / diffs.length;
-      let hours = avgMs / (1000 * 60 * 60);
-      if (hours < 0.05) hours = 0.05;
-      if (hours > 1.5) hours = 1.5;
-      return hours;
-    }
+def _parquet_frame(chunk, time_col: Optional[str], tz, text_cols):
+    """
+    Tipos estables para Arrow: la columna de tiempo como datetime (un Excel
+    la trae parseada y el ESP32 como texto ISO) y las columnas de texto, que
+    pueden mezclar números y cadenas entre bloques, como str.
+    """
+    if time_col in chunk.columns:
+        times = time_values(chunk, time_col)
+        if tz is not None and getattr(times.dt, "tz", None) is None:
+            times = times.dt.tz_localize(tz, ambiguous="NaT", nonexistent="NaT")
+        chunk[time_col] = times
+    for c in text_cols:
+        s = chunk[c]
+        chunk[c] = s.astype(object).where(s.isna(), s.astype(str))
+    return chunk
+
+
+def iter_parquet(snap, positions, columns, index):
+    """
+    Esquema y primer bloque se convierten al llamarla, no al recorrerla: un
+    error de tipos sale antes de empezar la respuesta. El esquema sale de
+    los tipos de todos los bloques (snap.schema), no de una muestra.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    time_col = index.column if index.column in columns else None
+    classes = {c: column_class(snap.schema[c].dtype) for c in columns}
+    text_cols = [c for c in columns if c != time_col and classes[c] == "text"]
+    schema = pa.Schema.from_pandas(snap.schema[columns], preserve_index=False)
+    for i, field in enumerate(schema):
+        if field.name == time_col:
+            tz = None if index.tz is None else str(index.tz)
+            schema = schema.set(i, pa.field(field.name, pa.timestamp("ns", tz=tz)))
+        elif field.name in text_cols or pa.types.is_null(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+
+    def table(chunk):
+        chunk = _parquet_frame(chunk, time_col, index.tz, text_cols)
+        return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+    chunks = iter_chunks(snap, positions, columns)
+    first = next(chunks, None)
+    first = None if first is None else table(first)
+
+    def body():
+        sink = _ByteSink()
+        writer = pq.ParquetWriter(sink, schema)
+        if first is not None:
+            writer.write_table(first)
+            yield sink.drain()
+        for chunk in chunks:
+            writer.write_table(table(chunk))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    return body()
+
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv; charset=utf-8"),
+    "xlsx": (iter_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": (iter_parquet, "application/vnd.apache.parquet"),
+}
+
+
+# ===================== Índice temporal =====================
 
-    function updateSummaryWidgets() {
-      if (!globalData || !globalData.rows || !globalData.rows.length) return;
-      const rows = globalData.rows;
-      const cols = globalData.columns || [];
-      const timeCols = globalData.datetimeColumns || [];
+NAT_NS = np.iinfo(np.int64).min
 
-      const timeCol = timeCols.includes("timestamp")
-        ? "timestamp"
-        : (timeCols[0] || null);
 
-      if (!timeCol) {
-        document.getElementById("statusVentHours").textContent = "Pared: -- h · Colg.: -- h";
-        document.getElementById("statusVentSamples").textContent = "Muestras analizadas: --";
-        document.getElementById("statusEnergy").textContent = "-- kWh";
-        document.getElementById("statusPowerMean").textContent = "Potencia media: -- kW";
-        document.getElementById("statusModeLoad").textContent = "Auto: -- h · Verano man.: -- h · Invierno man.: -- h";
-        return;
-      }
+def _times_ns(df, col: str, tz=None):
+    """
+    Tiempos de `col` como int64 (ns); NaT queda como NAT_NS. Con `tz` los
+    valores se guardan en UTC, sin tz en hora local tal como vienen.
+    """
+    times = time_values(df, col)
+    cur_tz = getattr(times.dt, "tz", None)
+    if tz is None:
+        if cur_tz is not None:
+            times = times.dt.tz_localize(None)
+    else:
+        times = times.dt.tz_localize(tz) if cur_tz is None else times.dt.tz_convert(tz)
+        times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+    return times.astype("datetime64[ns]").to_numpy().view(np.int64)
 
-      let sorted = rows.filter(r => r[timeCol]).slice();
-      sorted.sort((a, b) => new Date(a[timeCol]) - new Date(b[timeCol]));
-      if (!sorted.length) return;
 
-      const lastDate = new Date(sorted[sorted.length - 1][timeCol]);
-      if (isNaN(lastDate.getTime())) return;
+class GrowableArray:
+    """Arreglo numpy de solo-agregar con capacidad que se duplica (append O(1) amortizado)."""
 
-      const cutoff24 = new Date(lastDate.getTime() - 24 * 60 * 60 * 1000);
+    def __init__(self, dtype):
+        self._buf = np.empty(0, dtype=dtype)
+        self.n = 0
 
-      const rows24 = sorted.filter(r => {
-        const d = new Date(r[timeCol]);
-        if (isNaN(d.getTime())) return false;
-        return d >= cutoff24 && d <= lastDate;
-      });
+    @property
+    def values(self):
+        return self._buf[:self.n]
 
-      const stepHours = estimateStepHours(sorted, timeCol);
+    def adopt(self, values):
+        """Usa `values` (p. ej. un mmap copy-on-write) como contenido; se copia al crecer."""
+        self._buf = values
+        self.n = len(values)
 
-      const wallCol = cols.find(c => ["vent_pared_on", "relay_pared_on", "wallFansOn"].includes(c));
-      const colgCol = cols.find(c => ["vent_colg_on", "n_colg_vent_on", "colgFansOn"].includes(c));
+    def extend(self, values):
+        k = len(values)
+        if self.n + k > len(self._buf):
+            buf = np.empty(max(1024, len(self._buf) * 2, self.n + k), dtype=self._buf.dtype)
+            buf[:self.n] = self._buf[:self.n]
+            self._buf = buf
+        self._buf[self.n:self.n + k] = values
+        self.n += k
 
-      let wallOnCount = 0;
-      let colgOnCount = 0;
 
-      rows24.forEach(r => {
-        if (wallCol) {
-          const v = Number(r[wallCol]);
-          if (!isNaN(v) && v > 0) wallOnCount++;
-        }
-        if (colgCol) {
-          const v = Number(r[colgCol]);
-          if (!isNaN(v) && v > 0) colgOnCount++;
-        }
-      });
-
-      const hoursWall = wallOnCount * stepHours;
-      const hoursColg = colgOnCount * stepHours;
-
-      const ventHoursLabel = document.getElementById("statusVentHours");
-      const ventSamplesLabel = document.getElementById("statusVentSamples");
-      if (ventHoursLabel) {
-        ventHoursLabel.textContent = `Pared: ${hoursWall.toFixed(1)} h · Colg.: ${hoursColg.toFixed(1)} h`;
-      }
-      if (ventSamplesLabel) {
-        ventSamplesLabel.textContent = `Muestras analizadas: ${rows24.length}`;
-      }
-
-      const voltCol = cols.find(c => ["vfd_volt_out_V"].includes(c));
-      const currCol = cols.find(c => ["vfd_curr_out_A"].includes(c));
-      const freqCol = cols.find(c => ["vfd_freq_out_Hz", "freq_cmd_Hz"].includes(c));
-      let energyKWh = 0;
-      let powerSamples = 0;
-      let sumPower = 0;
-
-      rows24.forEach(r => {
-        if (!voltCol || !currCol) return;
-        const v = Number(r[voltCol]);
-        const i = Number(r[currCol]);
-        if (isNaN(v) || isNaN(i) || v <= 0 || i <= 0) return;
-        let freqOk = true;
-        if (freqCol) {
-          const f = Number(r[freqCol]);
-          if (isNaN(f) || f <= 0.5) freqOk = false;
-        }
-        if (!freqOk) return;
-        const p_kw = v * i * 0.001 * 0.9;
-        energyKWh += p_kw * stepHours;
-        sumPower += p_kw;
-        powerSamples++;
-      });
-
-      const powerMean = powerSamples > 0 ? (sumPower / powerSamples) : null;
-
-      const energyLabel = document.getElementById("statusEnergy");
-      const powerLabel = document.getElementById("statusPowerMean");
-      if (energyLabel) {
-        energyLabel.textContent = energyKWh > 0 ? energyKWh.toFixed(2) + " kWh" : "-- kWh";
-      }
-      if (powerLabel) {
-        powerLabel.textContent = powerMean !== null ? "Potencia media: " + powerMean.toFixed(2) + " kW" : "Potencia media: -- kW";
-      }
-
-      const modeCol = cols.find(c => ["modo_control", "modo", "controlMode"].includes(c));
-      const modeLoadLabel = document.getElementById("statusModeLoad");
-
-      if (modeCol && modeLoadLabel) {
-        let autoCount = 0;
-        let verCount = 0;
-        let invCount = 0;
-
-        const day = lastDate.getDate();
-        const month = lastDate.getMonth();
-        const year = lastDate.getFullYear();
-
-        const rowsToday = sorted.filter(r => {
-          const d = new Date(r[timeCol]);
-          return !isNaN(d.getTime()) &&
-                 d.getDate() === day &&
-                 d.getMonth() === month &&
-                 d.getFullYear() === year;
-        });
-
-        rowsToday.forEach(r => {
-          const raw = String(r[modeCol] || "").toUpperCase();
-          if (raw.includes("AUTO") || raw === "0") {
-            autoCount++;
-          } else if (raw.includes("MANUAL VER")) {
-            verCount++;
-          } else if (raw.includes("MANUAL INV")) {
-            invCount++;
-          }
-        });
-
-        const autoHours = autoCount * stepHours;
-        const verHours = verCount * stepHours;
-        const invHours = invCount * stepHours;
-
-        modeLoadLabel.textContent =
-          `Auto: ${autoHours.toFixed(1)} h · Verano man.: ${verHours.toFixed(1)} h · Invierno man.: ${invHours.toFixed(1)} h`;
-      }
-
-      // HUMEDAD INTERNA (hum_invernadero_rel)
-      const humCol = cols.find(c => ["hum_invernadero_rel", "humedad", "humidity"].includes(c));
-      if (humCol) {
-        let lastHum = null;
-        const humVals = [];
-        rows.forEach(r => {
-          const raw = r[humCol];
-          if (raw === undefined || raw === null) return;
-          const v = Number(raw);
-          if (!isNaN(v)) {
-            humVals.push(v);
-            lastHum = v;
-          }
-        });
-
-        const humValueLabel = document.getElementById("statusHum");
-        const humRangeLabel = document.getElementById("statusHumRange");
-        const humBarFill = document.getElementById("humBarFill");
-
-        if (humValueLabel) {
-          humValueLabel.textContent =
-            (lastHum !== null && !isNaN(lastHum)) ? lastHum.toFixed(1) + " %" : "-- %";
-        }
+NS_PER_MINUTE = 60 * 1_000_000_000
+NS_PER_DAY = 1440 * NS_PER_MINUTE
+
 
-        if (humRangeLabel) {
-          if (humVals.length) {
-            const minH = Math.min(...humVals);
-            const maxH = Math.max(...humVals);
-            humRangeLabel.textContent =
-              `Mín: ${minH.toFixed(1)} % · Máx: ${maxH.toFixed(1)} %`;
-          } else {
-            humRangeLabel.textContent = "Mín: -- % · Máx: -- %";
-          }
+def sun_window_minutes(days, lat: float = SITE_LAT, lon: float = SITE_LON, tz: str = GREENHOUSE_TZ):
+    """
+    Salida y puesta del sol (minutos desde la medianoche local) para cada día
+    de `days` (días desde 1970-01-01 en hora local). Aproximación de NOAA,
+    con error de un par de minutos, suficiente para separar día y noche.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    dates = pd.to_datetime(days * NS_PER_DAY)
+    gamma = 2.0 * np.pi / 365.0 * (dates.dayofyear.to_numpy() - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    phi = np.radians(lat)
+    cos_ha = np.cos(np.radians(90.833)) / (np.cos(phi) * np.cos(decl)) - np.tan(phi) * np.tan(decl)
+    ha = np.degrees(np.arccos(np.clip(cos_ha, -1.0, 1.0)))
+    rise_utc = 720.0 - 4.0 * (lon + ha) - eqtime
+    set_utc = 720.0 - 4.0 * (lon - ha) - eqtime
+    # desfase local de cada fecha (al mediodía, para esquivar cambios de hora)
+    noon = dates + pd.Timedelta(hours=12)
+    offset = (noon - noon.tz_localize(tz).tz_convert("UTC").tz_localize(None)) / pd.Timedelta(minutes=1)
+    offset = np.asarray(offset, dtype=float)
+    return rise_utc + offset, set_utc + offset
+
+
+_SUN_CACHE: Dict[int, Any] = {}
+
+
+class TimeIndex:
+    """
+    Índice temporal de los datos. Por fila guarda epoch-ns, minuto del día y
+    día local (hora del invernadero), agregados en cada ingreso; así el
+    orden por tiempo, los rangos y el filtro día/noche son operaciones
+    vectorizadas. El orden sólo se recalcula si llegan datos desordenados.
+    """
+
+    def __init__(self):
+        self.column: Optional[str] = None
+        self.tz = None
+        self._times = GrowableArray(np.int64)
+        self._minutes = GrowableArray(np.int16)
+        self._days = GrowableArray(np.int32)
+        self.monotonic = True
+        self.valid = 0
+        self._order = None
+
+    @property
+    def n(self) -> int:
+        return self._times.n
+
+    @property
+    def times(self):
+        return self._times.values
+
+    @property
+    def minutes(self):
+        """Minuto del día en hora local (-1 si la fila no tiene tiempo)."""
+        return self._minutes.values
+
+    @property
+    def days(self):
+        """Día local (días desde 1970-01-01) de cada fila."""
+        return self._days.values
+
+    def rebuild(self, df):
+        self.__init__()
+        self.column = find_time_column(df) if df is not None else None
+        if self.column is None or df is None or not len(df):
+            return
+        times = time_values(df, self.column)
+        self.tz = getattr(times.dt, "tz", None)
+        self._push(_times_ns(df, self.column, self.tz))
+
+    def state(self) -> dict:
+        """Metadatos para el checkpoint (los arreglos se guardan aparte)."""
+        return {
+            "column": self.column,
+            "tz": None if self.tz is None else str(self.tz),
+            "greenhouseTz": GREENHOUSE_TZ,
+            "monotonic": self.monotonic,
+            "valid": self.valid,
         }
 
-        if (humBarFill) {
-          let pct = (lastHum !== null && !isNaN(lastHum)) ? lastHum : 0;
-          if (pct < 0) pct = 0;
-          if (pct > 100) pct = 100;
-          humBarFill.style.width = pct + "%";
+    def arrays(self) -> Dict[str, Any]:
+        return {"times": self.times, "minutes": self.minutes, "days": self.days}
+
+    def restore(self, state: dict, arrays: Dict[str, Any]) -> None:
+        """Retoma el índice de un checkpoint sin recalcular nada."""
+        self.__init__()
+        self.column = state["column"]
+        self.tz = None if state["tz"] is None else pd.DatetimeTZDtype(tz=state["tz"]).tz
+        self._times.adopt(arrays["times"])
+        self._minutes.adopt(arrays["minutes"])
+        self._days.adopt(arrays["days"])
+        self.monotonic = state["monotonic"]
+        self.valid = state["valid"]
+
+    def extend(self, df_new, times=None):
+        """
+        Agrega al índice las filas nuevas (ya agregadas al final de los datos).
+        `times`: sus tiempos ya calculados con block_times (p. ej. en un hilo).
+        """
+        if times is not None:
+            self._push(times)
+        elif self.column is None or self.column not in df_new.columns:
+            self._push(np.full(len(df_new), NAT_NS, dtype=np.int64))
+        else:
+            self._push(_times_ns(df_new, self.column, self.tz))
+
+    def local_times(self, positions):
+        """epoch-ns en hora local del invernadero para `positions` (NaT = NAT_NS)."""
+        values = self.times[positions]
+        local = self._local_ns(values)
+        return np.where(values == NAT_NS, NAT_NS, local)
+
+    def _local_ns(self, values):
+        if self.tz is None:
+            return values
+        local = pd.DatetimeIndex(values.view("datetime64[ns]")).tz_localize("UTC")
+        return local.tz_convert(GREENHOUSE_TZ).tz_localize(None).asi8
+
+    def _push(self, values):
+        k = len(values)
+        prev = self.times[-1] if self.n else NAT_NS
+        valid = values != NAT_NS
+        local = self._local_ns(values)
+        self._times.extend(values)
+        self._minutes.extend(np.where(valid, (local // NS_PER_MINUTE) % 1440, -1))
+        self._days.extend(np.where(valid, local // NS_PER_DAY, 0))
+        n_valid = int(valid.sum())
+        if self.monotonic and n_valid:
+            v = values[valid]
+            # NaT al medio rompe la correspondencia posición ↔ orden
+            if n_valid != k or (prev == NAT_NS and self.valid != self.n - k) \
+                    or (prev != NAT_NS and v[0] < prev) or np.any(np.diff(v) < 0):
+                self.monotonic = False
+        elif n_valid != k:
+            self.monotonic = False
+        self.valid += n_valid
+        self._order = None
+
+    def order(self):
+        """Posiciones de las filas con tiempo válido, ordenadas por tiempo."""
+        if self.monotonic and self.valid == self.n:
+            return np.arange(self.n)
+        if self._order is None:
+            times = self.times
+            pos = np.flatnonzero(times != NAT_NS)
+            self._order = pos[np.argsort(times[pos], kind="stable")]
+        return self._order
+
+    def _bound(self, ts):
+        ts = _align_tz(ts, self.tz)
+        if self.tz is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        return ts.value
+
+    def range_positions(self, from_ts=None, to_ts=None):
+        """Posiciones en [from_ts, to_ts] ordenadas por tiempo (búsqueda binaria)."""
+        order = self.order()
+        if from_ts is None and to_ts is None:
+            return order
+        sorted_times = self.times[order]
+        lo = 0 if from_ts is None else int(np.searchsorted(sorted_times, self._bound(from_ts), "left"))
+        hi = len(order) if to_ts is None else int(np.searchsorted(sorted_times, self._bound(to_ts), "right"))
+        return order[lo:max(lo, hi)]
+
+    def day_mask(self, positions=None):
+        """Máscara booleana "es de día" para `positions` (todas si es None)."""
+        minutes = self.minutes if positions is None else self.minutes[positions]
+        if DAY_WINDOW == "sun":
+            days = self.days if positions is None else self.days[positions]
+            uniq, inverse = np.unique(days, return_inverse=True)
+            missing = [d for d in uniq.tolist() if d not in _SUN_CACHE]
+            if missing:
+                rises, sets = sun_window_minutes(missing)
+                for d, r, s in zip(missing, rises.tolist(), sets.tolist()):
+                    _SUN_CACHE[d] = (r, s)
+            bounds = np.array([_SUN_CACHE[d] for d in uniq.tolist()], dtype=float).reshape(-1, 2)
+            start, end = bounds[inverse, 0], bounds[inverse, 1]
+            return (minutes >= start) & (minutes < end)
+        start, end = _minutes_of_day(DAY_START), _minutes_of_day(DAY_END)
+        if start <= end:
+            return (minutes >= start) & (minutes < end)
+        # ventana que cruza la medianoche
+        return (minutes >= start) | ((minutes >= 0) & (minutes < end))
+
+    def filter_positions(self, positions, day_filter: str = "all"):
+        """Aplica el filtro all/day/night a `positions`."""
+        if day_filter == "all":
+            return positions
+        is_day = self.day_mask(positions)
+        if day_filter == "day":
+            return positions[is_day]
+        return positions[~is_day & (self.minutes[positions] >= 0)]
+
+
+# ===================== Energía =====================
+
+# Directorio donde se persisten los datos derivados (vacío = no persistir).
+DATA_DIR = os.environ.get("INVERNADERO_DATA_DIR", "data")
+# Factor de potencia asumido para el variador (P = V · I · PF).
+VFD_POWER_FACTOR = float(os.environ.get("VFD_POWER_FACTOR", "0.9"))
+# Intervalos entre muestras mayores a esto se consideran cortes y no se integran.
+ENERGY_MAX_GAP_S = float(os.environ.get("ENERGY_MAX_GAP_S", "900"))
+
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+
+
+def data_path(name: str) -> Optional[str]:
+    """Ruta dentro de DATA_DIR (None si la persistencia está desactivada)."""
+    if not DATA_DIR:
+        return None
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def save_json_atomic(path: str, obj) -> None:
+    """Escribe JSON a un temporal y lo renombra, para no dejar archivos a medias."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(obj, fh, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# Columnas que necesita el libro de energía.
+ENERGY_COLUMNS = ["vfd_volt_out_V", "vfd_curr_out_A", "vfd_freq_out_Hz"]
+
+
+class EnergyLedger:
+    """
+    Energía del variador integrada por trapecios sobre los deltas reales de
+    tiempo (hora local del invernadero). Guarda la energía acumulada al
+    inicio de cada hora, así la energía de cualquier período es la resta de
+    dos acumulados: O(1). Los intervalos que contienen un corte registrado
+    en el índice de cortes (los mismos de /api/outages) no se integran; sin
+    índice, los más largos que ENERGY_MAX_GAP_S.
+    """
+
+    def __init__(self, power_factor: float = VFD_POWER_FACTOR, max_gap_s: float = ENERGY_MAX_GAP_S):
+        self.power_factor = power_factor
+        self.max_gap_ns = int(max_gap_s * 1e9)
+        self.base_hour: Optional[int] = None
+        self._cum_kwh = GrowableArray(np.float64)
+        self._cum_hours = GrowableArray(np.float64)
+        self.total_kwh = 0.0
+        self.covered_hours = 0.0
+        self.last_t: Optional[int] = None
+        self.last_p: Optional[float] = None
+        self.samples = 0
+        self.gaps = 0
+        self.out_of_order = 0
+
+    def power_kw(self, df):
+        """Potencia (kW) por fila; NaN si faltan tensión o corriente."""
+        if "vfd_volt_out_V" not in df.columns or "vfd_curr_out_A" not in df.columns:
+            return np.full(len(df), np.nan)
+        volt = pd.to_numeric(df["vfd_volt_out_V"], errors="coerce").to_numpy(dtype=float)
+        curr = pd.to_numeric(df["vfd_curr_out_A"], errors="coerce").to_numpy(dtype=float)
+        p = volt * curr * self.power_factor / 1000.0
+        running = (volt > 0) & (curr > 0)
+        if "vfd_freq_out_Hz" in df.columns:
+            freq = pd.to_numeric(df["vfd_freq_out_Hz"], errors="coerce").to_numpy(dtype=float)
+            running &= ~(freq <= 0.5)
+        return np.where(np.isnan(p), np.nan, np.where(running, p, 0.0))
+
+    def extend(self, t_ns, p_kw, gaps: Optional["GapIndex"] = None):
+        """
+        Integra nuevas muestras (t en ns locales, P en kW). O(1) por muestra.
+        `gaps` ya tiene que incluir los cortes de estas muestras.
+        """
+        t = np.asarray(t_ns, dtype=np.int64)
+        p = np.asarray(p_kw, dtype=float)
+        keep = (t != NAT_NS) & ~np.isnan(p)
+        t, p = t[keep], p[keep]
+        if len(t) > 1:
+            order = np.argsort(t, kind="stable")
+            t, p = t[order], p[order]
+        if self.last_t is not None:
+            late = t <= self.last_t
+            self.out_of_order += int((t < self.last_t).sum())
+            t, p = t[~late], p[~late]
+            t = np.concatenate(([self.last_t], t))
+            p = np.concatenate(([self.last_p], p))
+        if len(t) == 0:
+            return
+        if self.base_hour is None:
+            self.base_hour = int(t[0] // NS_PER_HOUR)
+            self._cum_kwh.extend([0.0])
+            self._cum_hours.extend([0.0])
+
+        dt = np.diff(t)
+        gap = dt > self.max_gap_ns if gaps is None else gaps.mask(t)
+        step_h = np.where(gap, 0.0, dt / NS_PER_HOUR)
+        energy = (p[1:] + p[:-1]) / 2.0 * step_h
+        cum_e = self.total_kwh + np.concatenate(([0.0], np.cumsum(energy)))
+        cum_h = self.covered_hours + np.concatenate(([0.0], np.cumsum(step_h)))
+
+        # acumulados en cada inicio de hora cruzado por el nuevo tramo
+        first_h = self.base_hour + self._cum_kwh.n
+        last_h = int(t[-1] // NS_PER_HOUR)
+        if last_h >= first_h:
+            bounds = np.arange(first_h, last_h + 1, dtype=np.int64) * NS_PER_HOUR
+            self._cum_kwh.extend(np.interp(bounds, t, cum_e))
+            self._cum_hours.extend(np.interp(bounds, t, cum_h))
+
+        self.total_kwh = float(cum_e[-1])
+        self.covered_hours = float(cum_h[-1])
+        self.samples += len(t) - (1 if self.last_t is not None else 0)
+        self.gaps += int(gap.sum())
+        self.last_t = int(t[-1])
+        self.last_p = float(p[-1])
+
+    def rebuild(self, df, index: "TimeIndex", gaps: Optional["GapIndex"] = None):
+        """Recalcula todo el libro desde el DataFrame, en orden temporal."""
+        self.__init__(self.power_factor, self.max_gap_ns / 1e9)
+        if df is None or index.column is None or not len(df):
+            return
+        order = index.order()
+        self.extend(index.local_times(order), self.power_kw(df)[order], gaps)
+
+    def _cum_at(self, arr, total: float, ns: int) -> float:
+        if self.base_hour is None:
+            return 0.0
+        h = ns // NS_PER_HOUR
+        i = h - self.base_hour
+        if i < 0:
+            return 0.0
+        values = arr.values
+        frac = (ns - h * NS_PER_HOUR) / NS_PER_HOUR
+        if i < len(values) - 1:
+            return float(values[i] + (values[i + 1] - values[i]) * frac)
+        if ns >= self.last_t:
+            return total
+        start = h * NS_PER_HOUR
+        return float(values[-1] + (total - values[-1]) * (ns - start) / max(1, self.last_t - start))
+
+    def energy_between(self, from_ns: Optional[int], to_ns: Optional[int]):
+        """(kWh, horas integradas) entre dos instantes locales."""
+        lo = self.base_hour * NS_PER_HOUR if from_ns is None and self.base_hour is not None else (from_ns or 0)
+        hi = self.last_t if to_ns is None else to_ns
+        if self.last_t is None or hi is None or hi <= lo:
+            return 0.0, 0.0
+        kwh = self._cum_at(self._cum_kwh, self.total_kwh, hi) - self._cum_at(self._cum_kwh, self.total_kwh, lo)
+        hours = self._cum_at(self._cum_hours, self.covered_hours, hi) - self._cum_at(self._cum_hours, self.covered_hours, lo)
+        return kwh, hours
+
+    def buckets(self, hours_per_bucket: int = 1):
+        """Lista [(inicio ns local, kWh)] por hora o por día."""
+        if self.base_hour is None:
+            return []
+        first = (self.base_hour // hours_per_bucket) * hours_per_bucket
+        last = int(self.last_t // NS_PER_HOUR)
+        out = []
+        for h in range(first, last + 1, hours_per_bucket):
+            kwh, _ = self.energy_between(h * NS_PER_HOUR, (h + hours_per_bucket) * NS_PER_HOUR)
+            out.append((h * NS_PER_HOUR, kwh))
+        return out
+
+    def to_json(self) -> dict:
+        def fmt(ns, pattern):
+            return pd.Timestamp(ns).strftime(pattern)
+        return {
+            "version": 1,
+            "power_factor": self.power_factor,
+            "max_gap_s": self.max_gap_ns / 1e9,
+            "base_hour": self.base_hour,
+            "cum_kwh": self._cum_kwh.values.tolist(),
+            "cum_hours": self._cum_hours.values.tolist(),
+            "total_kwh": self.total_kwh,
+            "covered_hours": self.covered_hours,
+            "last_t": self.last_t,
+            "last_p": self.last_p,
+            "samples": self.samples,
+            "gaps": self.gaps,
+            "out_of_order": self.out_of_order,
+            "hourly": {fmt(ns, "%Y-%m-%dT%H:00"): round(kwh, 6) for ns, kwh in self.buckets(1)},
+            "daily": {fmt(ns, "%Y-%m-%d"): round(kwh, 6) for ns, kwh in self.buckets(24)},
         }
-      }
 
-    }
+    def load_json(self, data: dict) -> None:
+        if data.get("version") != 1:
+            return
+        self.__init__(data.get("power_factor", self.power_factor), data.get("max_gap_s", self.max_gap_ns / 1e9))
+        self.base_hour = data["base_hour"]
+        self._cum_kwh.extend(data["cum_kwh"])
+        self._cum_hours.extend(data["cum_hours"])
+        self.total_kwh = data["total_kwh"]
+        self.covered_hours = data["covered_hours"]
+        self.last_t = data["last_t"]
+        self.last_p = data["last_p"]
+        self.samples = data.get("samples", 0)
+        self.gaps = data.get("gaps", 0)
+        self.out_of_order = data.get("out_of_order", 0)
 
-    function updateStatusFromData() {
-      if (!globalData || !globalData.rows || !globalData.rows.length) return;
-      const rows = globalData.rows;
-      const cols = globalData.columns || [];
-      const timeCols = globalData.datetimeColumns || [];
-
-      const timeCol = timeCols.includes("timestamp")
-        ? "timestamp"
-        : (timeCols[0] || null);
-
-      let lastRow = rows[rows.length - 1];
-      if (timeCol) {
-        const sorted = [...rows].filter(r => r[timeCol]).sort((a, b) => {
-          return new Date(a[timeCol]) - new Date(b[timeCol]);
-        });
-        if (sorted.length) lastRow = sorted[sorted.length - 1];
-      }
-
-
-    function updateGsmStatusFromData() {
-      const banner = document.getElementById("gsmStatusBanner");
-      const dot = document.getElementById("gsmStatusDot");
-      const label = document.getElementById("gsmStatusLabel");
-      const detail = document.getElementById("gsmStatusDetail");
-
-      if (!banner || !window.globalData || !globalData.rows || !globalData.rows.length) {
-        if (label) label.textContent = "Estado GSM: OFFLINE";
-        if (detail) detail.textContent = "Sin datos recientes del ESP32.";
-        if (dot) dot.style.background = "var(--danger)";
-        return;
-      }
-
-      const rows = globalData.rows;
-      const cols = globalData.columns || [];
-      const timeCols = globalData.datetimeColumns || [];
-      const timeCol = timeCols.includes("timestamp") ? "timestamp" : (timeCols[0] || null);
-
-      if (!timeCol) {
-        if (label) label.textContent = "Estado GSM: Desconocido";
-        if (detail) detail.textContent = "No se encontró columna de tiempo.";
-        if (dot) dot.style.background = "var(--warn)";
-        return;
-      }
-
-      let lastRow = rows[rows.length - 1];
-      const tsRaw = lastRow[timeCol];
-      if (!tsRaw) {
-        if (label) label.textContent = "Estado GSM: Desconocido";
-        if (detail) detail.textContent = "Último registro sin timestamp.";
-        if (dot) dot.style.background = "var(--warn)";
-        return;
-      }
-
-      const lastDate = new Date(tsRaw);
-      const now = new Date();
-      const diffMs = now - lastDate;
-      const diffMin = diffMs / 60000;
-
-      if (diffMin <= 5) {
-        if (label) label.textContent = "Estado GSM: ONLINE";
-        if (detail) detail.textContent = "Último dato recibido hace " + diffMin.toFixed(1) + " min.";
-        if (dot) dot.style.background = "var(--success)";
-      } else {
-        if (label) label.textContent = "Estado GSM: OFFLINE";
-        if (detail) detail.textContent = "Último dato recibido hace " + diffMin.toFixed(1) + " min.";
-        if (dot) dot.style.background = "var(--danger)";
-      }
-    }
 
-      const tempCol = cols.find(c => ["temp_invernadero_C", "tempC", "temperatura"].includes(c));
-      const modeCol = cols.find(c => ["modo_control", "modo", "controlMode"].includes(c));
-      const stationCol = cols.find(c => ["estacion", "estación"].includes(c));
-      const wallCols = cols.filter(c => ["vent_pared_on", "relay_pared_on", "wallFansOn"].includes(c));
-      const colgCols = cols.filter(c => ["vent_colg_on", "n_colg_vent_on", "colgFansOn"].includes(c));
-      const vfdFreqCol = cols.find(c => ["vfd_freq_out_Hz", "freq_cmd_Hz"].includes(c));
-      const vfdVoltCol = cols.find(c => ["vfd_volt_out_V"].includes(c));
-      const vfdCurrCol = cols.find(c => ["vfd_curr_out_A"].includes(c));
-
-      const tempVal = tempCol ? Number(lastRow[tempCol]) : null;
-      document.getElementById("statusTemp").textContent =
-        (tempVal !== null && !isNaN(tempVal)) ? tempVal.toFixed(1) + " °C" : "-- °C";
-
-      const modeRaw = modeCol ? String(lastRow[modeCol] || "") : "";
-      let modeLabel = "—";
-      let modeDesc = "";
-      const modeUpper = modeRaw.toUpperCase();
-      if (modeUpper.includes("AUTO") || modeRaw === "0") {
-        modeLabel = "Automático";
-        modeDesc = "El sistema decide estación y frecuencia según la fecha y la temperatura.";
-      } else if (modeUpper.includes("MANUAL VER")) {
-        modeLabel = "Verano manual";
-        modeDesc = "Forzado a lógica de verano, sin importar el mes del RTC.";
-      } else if (modeUpper.includes("MANUAL INV")) {
-        modeLabel = "Invierno manual";
-        modeDesc = "Forzado a lógica de invierno, sin importar el mes del RTC.";
-      } else if (modeRaw) {
-        modeLabel = modeRaw;
-        modeDesc = "Modo personalizado desde el controlador.";
-      } else {
-        modeDesc = "Sin información del modo de control.";
-      }
-      document.getElementById("statusMode").textContent = modeLabel;
-      document.getElementById("statusModeDesc").textContent = modeDesc;
-
-      const stationVal = stationCol ? String(lastRow[stationCol] || "") : "";
-      const labelStation = document.getElementById("labelStation");
-      const dotStation = document.getElementById("dotStation");
-      const chipStation = document.getElementById("chipStation");
-      if (labelStation) {
-        labelStation.textContent = "Estación: " + (stationVal || "--");
-      }
-      if (chipStation && dotStation) {
-        chipStation.classList.add("on");
-        dotStation.classList.add("on");
-      }
-
-      const wallStateVal = wallCols.length ? Number(lastRow[wallCols[0]]) : null;
-      const wallOn = wallStateVal === 1 || wallStateVal === true;
-      document.getElementById("statusWall").textContent = wallOn ? "ON" : "OFF";
-      setOnOffChip("chipWall", "dotWall", "labelWall", wallOn, "Activados", "Apagados");
-
-      let colgOn = false;
-      let nColg = null;
-      if (colgCols.length) {
-        const base = Number(lastRow[colgCols[0]]);
-        if (!isNaN(base)) {
-          nColg = base;
-          colgOn = base > 0;
-        }
-      }
-      document.getElementById("statusColg").textContent = colgOn ? "ON" : "OFF";
-      const detail = document.getElementById("statusColgDetail");
-      if (detail) {
-        if (nColg !== null) {
-          detail.textContent = `Ventiladores activos: ${nColg} de 4 posibles.`;
-        } else {
-          detail.textContent = "Ventiladores colgantes sin dato de conteo.";
-        }
-      }
-      setOnOffChip("chipColg", "dotColg", "labelColg", colgOn, "Activados", "Apagados");
-
-      const vfdFreq = vfdFreqCol ? Number(lastRow[vfdFreqCol]) : null;
-      document.getElementById("statusVfdFreq").textContent =
-        (vfdFreq !== null && !isNaN(vfdFreq)) ? vfdFreq.toFixed(1) + " Hz" : "-- Hz";
-
-      const vfdVolt = vfdVoltCol ? Number(lastRow[vfdVoltCol]) : null;
-      document.getElementById("statusVfdVolt").textContent =
-        (vfdVolt !== null && !isNaN(vfdVolt)) ? vfdVolt.toFixed(0) + " V" : "-- V";
-
-      const vfdCurr = vfdCurrCol ? Number(lastRow[vfdCurrCol]) : null;
-      document.getElementById("statusVfdCurr").textContent =
-        (vfdCurr !== null && !isNaN(vfdCurr)) ? vfdCurr.toFixed(2) + " A" : "-- A";
-
-      // Estado de bomba / nebulización
-      const pumpCol = cols.find(c => ["pump_on"].includes(c));
-      if (pumpCol) {
-        const rawPump = lastRow[pumpCol];
-        const pumpOn = Number(rawPump) === 1 || rawPump === true;
-        const pumpLabel = document.getElementById("statusPump");
-        if (pumpLabel) {
-          pumpLabel.textContent = pumpOn ? "ON" : "OFF";
-        }
-        setOnOffChip("chipPump", "dotPump", "labelPump", pumpOn, "Encendida", "Apagada");
-      }
-
-      let tsText = "--";
-      if (timeCol && lastRow[timeCol]) {
-        const d = new Date(lastRow[timeCol]);
-        if (!isNaN(d.getTime())) {
-          tsText = d.toLocaleString();
-          const hour = d.getHours();
-          const isDay = hour >= 7 && hour < 19;
-          const chip = document.getElementById("chipDayNight");
-          const dot = document.getElementById("dotDayNight");
-          const label = document.getElementById("labelDayNight");
-          if (isDay) {
-            chip.classList.add("on");
-            dot.classList.add("on");
-            label.textContent = "Día (RTC)";
-          } else {
-            chip.classList.remove("on");
-            dot.classList.remove("on");
-            label.textContent = "Noche (RTC)";
-          }
-        }
-      }
-      document.getElementById("statusLastTs").textContent = tsText;
+# Se guarda sólo dentro del checkpoint, junto con los datos de los que sale;
+# las lecturas posteriores lo extienden al reaplicar el journal.
+ENERGY = EnergyLedger()
 
-      updateTemperatureVisuals();
-      updateSummaryWidgets();
-    }
 
+# ===================== Índice de cortes =====================
 
-    function updateControlStatusFromData() {
-      if (!globalData || !globalData.rows || !globalData.rows.length) return;
-      const rows = globalData.rows;
-      const cols = globalData.columns || [];
-      const timeCols = globalData.datetimeColumns || [];
-
-      const timeCol = timeCols.includes("timestamp")
-        ? "timestamp"
-        : (timeCols[0] || null);
-
-      let lastRow = rows[rows.length - 1];
-      if (timeCol) {
-        const sorted = [...rows].filter(r => r[timeCol]).sort((a, b) => {
-          return new Date(a[timeCol]) - new Date(b[timeCol]);
-        });
-        if (sorted.length) lastRow = sorted[sorted.length - 1];
-      }
-
-      const wallCol = cols.find(c => ["vent_pared_on", "relay_pared_on", "wallFansOn"].includes(c));
-      const colgStateCol = cols.find(c => ["vent_colg_on", "colgFansOn"].includes(c));
-      const colgCountCol = cols.find(c => ["n_colg_vent_on"].includes(c));
-      const colgRefCol = cols.find(c => ["colg_ref_unidades"].includes(c));
-      const pumpCol = cols.find(c => ["pump_on"].includes(c));
-      const freqCol = cols.find(c => ["freq_cmd_Hz", "vfd_freq_out_Hz"].includes(c));
-
-      const wallStateLabel = document.getElementById("ctrlWallState");
-      if (wallStateLabel) {
-        let txt = "Estado actual: --";
-        if (wallCol && lastRow[wallCol] !== undefined && lastRow[wallCol] !== null) {
-          const on = Number(lastRow[wallCol]) > 0;
-          txt = "Estado actual: " + (on ? "ON" : "OFF");
-        }
-        wallStateLabel.textContent = txt;
-      }
-
-      const colgStateLabel = document.getElementById("ctrlColgState");
-      const colgDetailLabel = document.getElementById("ctrlColgDetail");
-      if (colgStateLabel) {
-        let on = false;
-        if (colgStateCol && lastRow[colgStateCol] !== undefined && lastRow[colgStateCol] !== null) {
-          on = Number(lastRow[colgStateCol]) > 0;
-        }
-        colgStateLabel.textContent = "Estado actual: " + (on ? "ON" : "OFF");
-      }
-      if (colgDetailLabel) {
-        const ref = colgRefCol && lastRow[colgRefCol] != null ? Number(lastRow[colgRefCol]) : null;
-        const cnt = colgCountCol && lastRow[colgCountCol] != null ? Number(lastRow[colgCountCol]) : null;
-        const freq = freqCol && lastRow[freqCol] != null ? Number(lastRow[freqCol]) : null;
-        let txt = "Cantidad objetivo / real: --";
-        if (!isNaN(ref) || !isNaN(cnt)) {
-          txt = "Cantidad objetivo / real: " +
-            (isNaN(ref) ? "--" : ref.toFixed(1)) + " / " +
-            (isNaN(cnt) ? "--" : cnt.toFixed(0));
-        }
-        if (!isNaN(freq)) {
-          txt += ` · Frecuencia: ${freq.toFixed(1)} Hz`;
+# Un hueco entre lecturas mayor a GAP_FACTOR × intervalo esperado es un corte.
+# EXPECTED_INTERVAL_S fija el intervalo; sin él se estima de los propios datos.
+GAP_FACTOR = float(os.environ.get("GAP_FACTOR", "3"))
+EXPECTED_INTERVAL_S = float(os.environ.get("EXPECTED_INTERVAL_S", "0"))
+# Nunca se considera corte un hueco menor a esto (evita falsos cortes por jitter).
+GAP_MIN_S = float(os.environ.get("GAP_MIN_S", "60"))
+
+
+class GapIndex:
+    """
+    Cortes (huecos entre lecturas consecutivas) como intervalos [inicio, fin]
+    en ns locales, ordenados por inicio. Se detectan al ingresar cada lectura
+    comparando el delta con el intervalo esperado (media móvil de los deltas
+    normales), y se consultan por rango con búsqueda binaria.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.expected_ns: Optional[float] = None
+        self.last_t: Optional[int] = None
+
+    def threshold_ns(self) -> int:
+        expected = EXPECTED_INTERVAL_S * 1e9 if EXPECTED_INTERVAL_S > 0 else self.expected_ns
+        if expected is None:
+            return int(ENERGY_MAX_GAP_S * 1e9)
+        return int(max(GAP_FACTOR * expected, GAP_MIN_S * 1e9))
+
+    def rebuild(self, t_sorted) -> None:
+        """Recalcula los cortes para tiempos locales ya ordenados."""
+        self.__init__()
+        t = np.asarray(t_sorted, dtype=np.int64)
+        t = t[t != NAT_NS]
+        if not len(t):
+            return
+        dt = np.diff(t)
+        normal = dt[dt > 0]
+        if len(normal):
+            self.expected_ns = float(np.median(normal))
+        gap = dt > self.threshold_ns()
+        self.starts = t[:-1][gap].tolist()
+        self.ends = t[1:][gap].tolist()
+        self.last_t = int(t[-1])
+
+    def extend(self, t_new) -> None:
+        """Procesa lecturas nuevas; O(1) por lectura."""
+        for t in sorted(int(x) for x in t_new if x != NAT_NS):
+            if self.last_t is None:
+                self.last_t = t
+                continue
+            dt = t - self.last_t
+            if dt <= 0:
+                continue
+            if dt > self.threshold_ns():
+                self.starts.append(self.last_t)
+                self.ends.append(t)
+            else:
+                self.expected_ns = dt if self.expected_ns is None else 0.95 * self.expected_ns + 0.05 * dt
+            self.last_t = t
+
+    def to_json(self) -> dict:
+        return {"starts": list(self.starts), "ends": list(self.ends),
+                "expected_ns": self.expected_ns, "last_t": self.last_t}
+
+    def load_json(self, data: dict) -> None:
+        self.starts = list(data["starts"])
+        self.ends = list(data["ends"])
+        self.expected_ns = data["expected_ns"]
+        self.last_t = data["last_t"]
+
+    def mask(self, t):
+        """
+        Para tiempos locales ordenados `t`, qué intervalos (t[k], t[k+1])
+        contienen el inicio de un corte registrado.
+        """
+        t = np.asarray(t, dtype=np.int64)
+        if len(t) < 2:
+            return np.zeros(max(0, len(t) - 1), dtype=bool)
+        starts = np.array([s for s, _ in self.between(int(t[0]), int(t[-1]))], dtype=np.int64)
+        if not len(starts):
+            return np.zeros(len(t) - 1, dtype=bool)
+        return np.searchsorted(starts, t[1:], "left") > np.searchsorted(starts, t[:-1], "left")
+
+    def between(self, lo: Optional[int] = None, hi: Optional[int] = None):
+        """Cortes que se superponen con [lo, hi] como lista de (inicio, fin)."""
+        i = 0 if lo is None else max(0, bisect.bisect_left(self.ends, lo))
+        j = len(self.starts) if hi is None else bisect.bisect_right(self.starts, hi)
+        return list(zip(self.starts[i:j], self.ends[i:j]))
+
+
+GAPS = GapIndex()
+
+
+# ===================== Versiones de los datos =====================
+
+# Con más bloques que esto se unen los dos vecinos más chicos.
+SNAPSHOT_MAX_CHUNKS = int(os.environ.get("SNAPSHOT_MAX_CHUNKS", "64"))
+
+
+def _empty_union(frames):
+    """DataFrame vacío con la unión de columnas (y dtypes) de `frames`."""
+    if len(frames) == 1:
+        return frames[0].iloc[:0]
+    return pd.concat([f.iloc[:0] for f in frames], ignore_index=True)
+
+
+def _compact(chunks):
+    """
+    Une el par de bloques vecinos más chico. Se prefieren vecinos con las
+    mismas columnas, para no rellenar con nulos columnas que uno no tiene.
+    """
+    pairs = range(len(chunks) - 1)
+    same = [i for i in pairs if chunks[i].columns.equals(chunks[i + 1].columns)]
+    i = min(same or pairs, key=lambda i: len(chunks[i]) + len(chunks[i + 1]))
+    merged = pd.concat(chunks[i:i + 2], ignore_index=True)
+    return chunks[:i] + (merged,) + chunks[i + 2:]
+
+
+def _null_series(n: int, dtype):
+    """Serie de `n` nulos con el dtype de la columna (u object si no admite nulos)."""
+    try:
+        return pd.Series(np.nan, index=np.arange(n), dtype=dtype)
+    except (TypeError, ValueError):
+        return pd.Series(np.nan, index=np.arange(n), dtype=object)
+
+
+class DataSnapshot:
+    """
+    Versión inmutable de los datos: una tupla de bloques (DataFrames que no
+    se modifican nunca) compartidos con las versiones anteriores. Publicar
+    una versión es reemplazar la referencia SNAPSHOT; quien ya tomó la
+    anterior la sigue viendo completa y consistente, sin copiarla.
+
+    Cada bloque conserva sus propias columnas. Una columna nueva (un Excel
+    con otras columnas, un campo nuevo del firmware) existe desde el primer
+    bloque que la trae (`column_start`); en los bloques que no la tienen se
+    lee como nula, sin rellenar ni realinear la historia. Los lectores piden
+    sólo las columnas y filas que usan con `take`.
+    """
+
+    __slots__ = ("version", "chunks", "offsets", "n", "schema", "column_start", "_frame")
+
+    def __init__(self, version: int, chunks, schema=None, column_start=None):
+        self.version = version
+        self.chunks = tuple(chunks)
+        sizes = [len(c) for c in self.chunks]
+        self.offsets = np.cumsum([0] + sizes[:-1]).astype(np.int64)
+        self.n = sum(sizes)
+        self.schema = _empty_union(self.chunks) if schema is None else schema
+        if column_start is None:
+            column_start = {}
+            for offset, chunk in zip(self.offsets.tolist(), self.chunks):
+                for c in chunk.columns:
+                    column_start.setdefault(c, offset)
+        self.column_start: Dict[str, int] = column_start
+        self._frame = self.chunks[0] if len(self.chunks) == 1 else None
+
+    @property
+    def columns(self):
+        return self.schema.columns
+
+    @property
+    def frame(self):
+        """Todos los datos en un solo DataFrame (se arma una vez por versión)."""
+        if self._frame is None:
+            self._frame = pd.concat(self.chunks, ignore_index=True)
+        return self._frame
+
+    def appended(self, df_new) -> "DataSnapshot":
+        """Versión siguiente con `df_new` al final; comparte todos los bloques."""
+        chunks = self.chunks + (df_new,)
+        column_start = self.column_start
+        new_cols = [c for c in df_new.columns if c not in column_start]
+        if new_cols:
+            column_start = {**column_start, **{c: self.n for c in new_cols}}
+        if len(chunks) > SNAPSHOT_MAX_CHUNKS:
+            chunks = _compact(chunks)
+        return DataSnapshot(self.version + 1, chunks, _empty_union((self.schema, df_new)), column_start)
+
+    def take(self, columns, positions=None):
+        """
+        DataFrame con `columns` en las filas `positions` (todas si es None),
+        en ese orden y con índice 0..k-1. Sólo lee los bloques que contienen
+        esas filas; una columna que el bloque no tiene sale nula.
+        """
+        columns = list(columns)
+        if len(self.chunks) == 1:
+            chunk = self.chunks[0]
+            sub = chunk if positions is None else chunk.iloc[positions]
+            return sub.reindex(columns=columns).reset_index(drop=True)
+
+        positions = np.arange(self.n) if positions is None else np.asarray(positions, dtype=np.int64)
+        which = np.searchsorted(self.offsets, positions, side="right") - 1
+        order = np.argsort(which, kind="stable")
+        ks, starts = np.unique(which[order], return_index=True)
+        bounds = zip(ks.tolist(), starts.tolist(), starts[1:].tolist() + [len(order)])
+        blocks = [(self.chunks[k], order[a:b], positions[order[a:b]] - self.offsets[k]) for k, a, b in bounds]
+        out = {}
+        for c in columns:
+            parts = [chunk[c].iloc[local].set_axis(sel) for chunk, sel, local in blocks if c in chunk.columns]
+            if not parts:
+                out[c] = _null_series(len(positions), self.schema[c].dtype if c in self.schema else object)
+                continue
+            s = parts[0] if len(parts) == 1 else pd.concat(parts)
+            out[c] = s.reindex(np.arange(len(positions)))
+        return pd.DataFrame(out, columns=columns)
+
+    def blocks(self, columns):
+        """Recorre los bloques con las columnas `columns` (nulas donde falten)."""
+        for chunk in self.chunks:
+            yield chunk if chunk.columns.equals(pd.Index(columns)) else chunk.reindex(columns=columns)
+
+    def last_row(self):
+        """Última fila (como DataFrame de una fila) sin materializar `frame`."""
+        return self.chunks[-1].iloc[[-1]].reindex(columns=self.columns)
+
+
+# Versión publicada (None sin datos). DATA_VERSION es su número y sirve
+# como clave de las cachés derivadas.
+SNAPSHOT: Optional[DataSnapshot] = None
+DATA_VERSION = 0
+TIME_INDEX = TimeIndex()
+
+
+def _publish(snap: Optional[DataSnapshot]) -> None:
+    global SNAPSHOT, DATA_VERSION
+    SNAPSHOT = snap
+    DATA_VERSION = DATA_VERSION + 1 if snap is None else snap.version
+    DATASETS.evict()
+
+
+def replace_data(df):
+    """Reemplaza por completo los datos en memoria (None los borra) y reconstruye el índice."""
+    snap = None if df is None else DataSnapshot(DATA_VERSION + 1, (df,))
+    TIME_INDEX.rebuild(df)
+    rebuild_derived(snap)
+    _publish(snap)
+
+
+def rebuild_time_index(snap: DataSnapshot):
+    """Reconstruye el índice temporal leyendo sólo la columna de tiempo."""
+    column = find_time_column(snap.schema)
+    TIME_INDEX.rebuild(None if column is None else snap.take([column]))
+
+
+# Cortes y energía atrasados respecto de los datos: el importador agrega
+# bloques con datos anteriores sin recalcularlos (append_data con
+# defer=True) y los pone al día una vez por archivo con refresh_derived.
+DERIVED_STALE = False
+# Cuenta los recálculos completos; refresh_derived descarta su resultado si
+# hubo uno mientras calculaba en el hilo.
+_DERIVED_EPOCH = 0
+
+
+def build_derived(snap: Optional[DataSnapshot], index: TimeIndex):
+    """Cortes y libro de energía nuevos para `snap` y su índice (no toca los globales)."""
+    gaps = GapIndex()
+    gaps.rebuild(index.local_times(index.order()) if index.column is not None else [])
+    energy = EnergyLedger()
+    df = None if snap is None else snap.take([c for c in ENERGY_COLUMNS if c in snap.column_start])
+    energy.rebuild(df, index, gaps)
+    return gaps, energy
+
+
+def rebuild_derived(snap: Optional[DataSnapshot]):
+    """Recalcula cortes y energía a partir de `snap` y su índice temporal."""
+    global GAPS, ENERGY, DERIVED_STALE, _DERIVED_EPOCH
+    GAPS, ENERGY = build_derived(snap, TIME_INDEX)
+    DERIVED_STALE = False
+    _DERIVED_EPOCH += 1
+
+
+async def refresh_derived() -> None:
+    """
+    Pone al día cortes y energía después de append_data(defer=True). El
+    recálculo corre en un hilo sobre la versión actual (con una copia de
+    sólo lectura del índice) y al terminar se le agregan las lecturas que
+    entraron mientras tanto, igual que en el ingreso.
+    """
+    global GAPS, ENERGY, DERIVED_STALE
+    while DERIVED_STALE:
+        DERIVED_STALE = False
+        snap, start, epoch = SNAPSHOT, TIME_INDEX.n, _DERIVED_EPOCH
+        index = TimeIndex()
+        index.restore(TIME_INDEX.state(), TIME_INDEX.arrays())
+        gaps, energy = await asyncio.to_thread(build_derived, snap, index)
+        if epoch != _DERIVED_EPOCH:
+            continue  # otro recálculo completo ya los dejó al día
+        if TIME_INDEX.n > start:
+            positions = np.arange(start, TIME_INDEX.n)
+            t_new = TIME_INDEX.local_times(positions)
+            gaps.extend(t_new)
+            cols = [c for c in ENERGY_COLUMNS if c in SNAPSHOT.column_start]
+            energy.extend(t_new, energy.power_kw(SNAPSHOT.take(cols, positions)), gaps)
+        GAPS, ENERGY = gaps, energy
+
+
+def append_data(df_new, stream: bool = False, defer: bool = False, times=None):
+    """
+    Publica una versión con `df_new` al final, manteniendo el índice
+    incrementalmente.
+    stream=True indica lecturas en vivo (lotes de la cola de ingreso): una
+    lectura atrasada no fuerza el recálculo, igual que si llegara sola.
+    defer=True (importador): un bloque con datos anteriores no recalcula
+    cortes y energía, sólo los marca atrasados (DERIVED_STALE); el que llama
+    hace un solo refresh_derived al terminar.
+    times: tiempos de `df_new` ya calculados con block_times para el índice
+    actual (se ignoran si hay que rehacer el índice).
+    """
+    global DERIVED_STALE
+    base = SNAPSHOT
+    start = TIME_INDEX.n
+    snap = DataSnapshot(DATA_VERSION + 1, (df_new,)) if base is None else base.appended(df_new)
+    if base is None or find_time_column(snap.schema) != TIME_INDEX.column:
+        rebuild_time_index(snap)
+        rebuild_derived(snap)
+    else:
+        TIME_INDEX.extend(df_new, times)
+        t_new = TIME_INDEX.local_times(np.arange(start, TIME_INDEX.n))
+        if not stream and len(df_new) > 1 and GAPS.last_t is not None and np.any((t_new != NAT_NS) & (t_new < GAPS.last_t)):
+            # un bloque con datos anteriores (p. ej. un Excel viejo): se recalcula
+            if defer:
+                DERIVED_STALE = True
+            else:
+                rebuild_derived(snap)
+        elif DERIVED_STALE:
+            pass  # el recálculo pendiente ya incluye estas filas
+        else:
+            GAPS.extend(t_new)
+            ENERGY.extend(t_new, ENERGY.power_kw(df_new), GAPS)
+    _publish(snap)
+
+
+def select_positions(from_ts=None, to_ts=None, day_filter: str = "all", ds=None):
+    """
+    Posiciones de los datos de `ds` (por defecto, los en vivo) dentro de
+    [from_ts, to_ts] y del horario pedido (all/day/night), ordenadas por tiempo.
+    """
+    ds = LIVE if ds is None else ds
+    index = ds.index
+    if index.column is None:
+        snap = ds.snap
+        n = 0 if snap is None else snap.n
+        return np.arange(n) if day_filter == "all" else np.arange(0)
+    positions = index.range_positions(from_ts, to_ts)
+    return index.filter_positions(positions, day_filter)
+
+
+def frame_to_rows(snap, positions, columns):
+    """Filas `positions` como listas de valores serializables, en el orden de `columns`."""
+    sub = snap.take(columns, positions)
+    out = []
+    for c in columns:
+        s = sub[c]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            out.append([None if pd.isna(v) else v.isoformat() for v in s])
+        else:
+            out.append([serialize_value(v, False) for v in s.astype(object)])
+    return [list(r) for r in zip(*out)] if out else [[] for _ in range(len(sub))]
+
+
+# Órdenes por columna ya calculados: (conjunto, versión, columna, from, to) → posiciones.
+_SORT_CACHE: Dict[Any, Any] = {}
+_SORT_CACHE_SIZE = 16
+
+
+# ===================== Conjuntos de datos =====================
+
+# Además de los datos en vivo (ESP32, /upload sin `dataset`) puede haber
+# conjuntos con nombre subidos para comparar, p. ej. otra temporada; los
+# endpoints de lectura los eligen con ?dataset=<nombre>. Todos comparten
+# DATASET_MEMORY_MB: los conjuntos menos usados que no entran quedan sólo en
+# disco (DATA_DIR/datasets/<nombre>.pkl) y se vuelven a cargar al pedirlos.
+LIVE_DATASET = "live"
+DATASET_MEMORY_BYTES = int(os.environ.get("DATASET_MEMORY_MB", "1024")) * 1024 * 1024
+DATASETS_DIR = "datasets"
+DATASETS_FILE = "datasets.json"
+DATASET_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Memoria ya medida de cada bloque, por id (los bloques no cambian nunca);
+# la entrada se borra cuando el bloque deja de existir.
+_CHUNK_BYTES: Dict[int, tuple] = {}
+
+
+def chunk_bytes(chunk) -> int:
+    """Memoria de un bloque, contando el contenido de los textos."""
+    key = id(chunk)
+    entry = _CHUNK_BYTES.get(key)
+    if entry is None or entry[0]() is not chunk:
+        size = int(chunk.memory_usage(index=True, deep=True).sum())
+        entry = (weakref.ref(chunk, lambda _, key=key: _CHUNK_BYTES.pop(key, None)), size)
+        _CHUNK_BYTES[key] = entry
+    return entry[1]
+
+
+def snapshot_bytes(snap: Optional[DataSnapshot]) -> int:
+    return 0 if snap is None else sum(chunk_bytes(c) for c in snap.chunks)
+
+
+class Dataset:
+    """
+    Un conjunto con nombre, con la misma forma que los datos en vivo:
+    versión (DataSnapshot), índice temporal, cortes y libro de energía, todo
+    calculado al cargarlo. No cambia: volver a subirlo crea otro Dataset.
+    """
+
+    def __init__(self, name: str, version: int, df):
+        self.name = name
+        self.snap = DataSnapshot(version, (df,))
+        self.index = TimeIndex()
+        self.index.rebuild(df)
+        self.gaps, self.energy = build_derived(self.snap, self.index)
+        self.nbytes = chunk_bytes(df)
+
+
+class LiveDataset:
+    """Los datos en vivo con la interfaz de Dataset (lee las variables globales)."""
+
+    name = LIVE_DATASET
+
+    @property
+    def snap(self) -> Optional[DataSnapshot]:
+        return SNAPSHOT
+
+    @property
+    def index(self) -> TimeIndex:
+        return TIME_INDEX
+
+    @property
+    def gaps(self) -> GapIndex:
+        return GAPS
+
+    @property
+    def energy(self) -> EnergyLedger:
+        return ENERGY
+
+
+LIVE = LiveDataset()
+
+
+class DatasetStore:
+    """
+    Conjuntos con nombre. El índice (datasets.json) tiene los metadatos de
+    todos y cada uno está guardado en disco; en memoria quedan sólo los
+    usados más recientemente mientras, sumados a los datos en vivo, no pasen
+    de DATASET_MEMORY_BYTES. Sin DATA_DIR no hay dónde bajarlos y quedan
+    todos en memoria.
+
+    Leer, armar (índice, cortes, energía) y guardar un conjunto corre en un
+    hilo; un candado por nombre hace que dos pedidos del mismo conjunto lo
+    carguen una sola vez.
+    """
+
+    def __init__(self):
+        self._meta: Dict[str, dict] = {}
+        self._resident: "OrderedDict[str, Dataset]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._version = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _root(self) -> Optional[str]:
+        root = data_path(DATASETS_DIR)
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+        return root
+
+    def _file(self, name: str) -> Optional[str]:
+        root = self._root()
+        return None if root is None else os.path.join(root, name + ".pkl")
+
+    def load(self) -> None:
+        """Lee el índice guardado; los datos se cargan recién al pedirlos."""
+        root = self._root()
+        if root is None or not os.path.exists(os.path.join(root, DATASETS_FILE)):
+            return
+        try:
+            with open(os.path.join(root, DATASETS_FILE), encoding="utf-8") as fh:
+                saved = json.load(fh)
+        except (OSError, ValueError) as e:
+            print(f"No se pudo leer el índice de conjuntos de datos: {e}")
+            return
+        self._meta = {name: meta for name, meta in saved.items() if os.path.exists(self._file(name))}
+        self._version = max([meta["version"] for meta in self._meta.values()], default=0)
+
+    def _save_index(self) -> None:
+        root = self._root()
+        if root is not None:
+            save_json_atomic(os.path.join(root, DATASETS_FILE), self._meta)
+
+    def version(self, name: str) -> Optional[int]:
+        """Versión publicada de `name` sin cargarlo (None si no existe)."""
+        if name == LIVE_DATASET:
+            return DATA_VERSION
+        meta = self._meta.get(name)
+        return None if meta is None else meta["version"]
+
+    def _lock(self, name: str) -> asyncio.Lock:
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = self._locks[name] = asyncio.Lock()
+        return lock
+
+    def _load(self, name: str, version: int) -> Dataset:
+        return Dataset(name, version, pd.read_pickle(self._file(name)))
+
+    def _build(self, name: str, version: int, df) -> Dataset:
+        ds = Dataset(name, version, df)
+        path = self._file(name)
+        if path is not None:
+            _replace_with(path, df.to_pickle)
+        return ds
+
+    async def get(self, name: Optional[str]):
+        """El conjunto `name` (None o "live": los datos en vivo); None si no existe."""
+        if not name or name == LIVE_DATASET:
+            return LIVE
+        ds = self._resident.get(name)
+        if ds is not None:
+            self._resident.move_to_end(name)
+            return ds
+        async with self._lock(name):
+            # otro pedido pudo haberlo cargado mientras se esperaba
+            ds = self._resident.get(name)
+            if ds is not None:
+                return ds
+            meta = self._meta.get(name)
+            if meta is None:
+                return None
+            try:
+                with stage("dataset_load"):
+                    ds = await asyncio.to_thread(self._load, name, meta["version"])
+            except Exception as e:
+                print(f"No se pudo cargar el conjunto de datos {name}: {e}")
+                return None
+            if self._meta.get(name) is not meta:
+                return ds  # se borró mientras tanto: sirve para este pedido, no se guarda
+            self.loads += 1
+            return self._admit(ds)
+
+    async def put(self, name: str, df, filename: Optional[str] = None) -> Dataset:
+        """Crea o reemplaza el conjunto `name` con `df` y lo guarda en disco."""
+        async with self._lock(name):
+            self._version += 1
+            version = self._version
+            ds = await asyncio.to_thread(self._build, name, version, df)
+            return self._register(ds, filename)
+
+    def _register(self, ds: Dataset, filename: Optional[str]) -> Dataset:
+        name = ds.name
+        self._meta[name] = {
+            "version": ds.snap.version,
+            "rows": int(ds.snap.n),
+            "columns": len(ds.snap.columns),
+            "bytes": ds.nbytes,
+            "filename": filename,
+            "updated": datetime.now().isoformat(timespec="seconds"),
         }
-        colgDetailLabel.textContent = txt;
-      }
-
-      const pumpStateLabel = document.getElementById("ctrlPumpState");
-      if (pumpStateLabel) {
-        let txt = "Estado actual: --";
-        if (pumpCol && lastRow[pumpCol] !== undefined && lastRow[pumpCol] !== null) {
-          const on = Number(lastRow[pumpCol]) > 0;
-          txt = "Estado actual: " + (on ? "ON" : "OFF");
+        self._save_index()
+        return self._admit(ds)
+
+    def delete(self, name: str) -> bool:
+        if self._meta.pop(name, None) is None:
+            return False
+        self._resident.pop(name, None)
+        path = self._file(name)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        self._save_index()
+        return True
+
+    def _admit(self, ds: Dataset) -> Dataset:
+        self._resident[ds.name] = ds
+        self._resident.move_to_end(ds.name)
+        self.evict(keep=ds.name)
+        return ds
+
+    def resident_bytes(self) -> int:
+        return snapshot_bytes(SNAPSHOT) + sum(ds.nbytes for ds in self._resident.values())
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Saca de memoria los conjuntos menos usados hasta entrar en el
+        presupuesto (ya están en disco). Quien ya tomó uno lo sigue viendo.
+        """
+        if not self._resident or self._root() is None:
+            return
+        total = self.resident_bytes()
+        for name in list(self._resident):
+            if total <= DATASET_MEMORY_BYTES:
+                break
+            if name != keep:
+                total -= self._resident.pop(name).nbytes
+                self.evictions += 1
+
+    def to_json(self) -> dict:
+        live = SNAPSHOT
+        datasets = [{
+            "name": LIVE_DATASET,
+            "live": True,
+            "resident": True,
+            "version": DATA_VERSION,
+            "rows": 0 if live is None else int(live.n),
+            "columns": 0 if live is None else len(live.columns),
+            "bytes": snapshot_bytes(live),
+        }]
+        for name, meta in sorted(self._meta.items()):
+            datasets.append({"name": name, "live": False, "resident": name in self._resident, **meta})
+        return {
+            "memoryBudgetBytes": DATASET_MEMORY_BYTES,
+            "residentBytes": self.resident_bytes(),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "datasets": datasets,
         }
-        pumpStateLabel.textContent = txt;
-      }
-    }
 
-    async function loadControlState() {
-      try {
-        const resp = await fetch("/api/control_state");
-        if (!resp.ok) return;
-        const data = await resp.json();
-        const map = {
-          ctrlWallManual: "wall_manual",
-          ctrlWallOn: "wall_on",
-          ctrlColgManual: "colg_manual",
-          ctrlColgOn: "colg_on",
-          ctrlPumpManual: "pump_manual",
-          ctrlPumpOn: "pump_on",
-        };
-        Object.keys(map).forEach(id => {
-          const el = document.getElementById(id);
-          if (el && typeof data[map[id]] === "boolean") {
-            el.checked = data[map[id]];
-          }
-        });
-      } catch (e) {
-        console.error("Error al cargar control_state", e);
-      }
-    }
 
-    async function applyControlState() {
-      const statusMsg = document.getElementById("ctrlStatusMsg");
-      const payload = {
-        wall_manual: document.getElementById("ctrlWallManual")?.checked || false,
-        wall_on: document.getElementById("ctrlWallOn")?.checked || false,
-        colg_manual: document.getElementById("ctrlColgManual")?.checked || false,
-        colg_on: document.getElementById("ctrlColgOn")?.checked || false,
-        pump_manual: document.getElementById("ctrlPumpManual")?.checked || false,
-        pump_on: document.getElementById("ctrlPumpOn")?.checked || false,
-      };
-      try {
-        const resp = await fetch("/api/control_state", {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify(payload),
-        });
-        if (!resp.ok) {
-          if (statusMsg) statusMsg.textContent = "Error al enviar el control.";
-          return;
-        }
-        await resp.json();
-        if (statusMsg) statusMsg.textContent = "Control enviado correctamente.";
-      } catch (e) {
-        console.error("Error al aplicar control", e);
-        if (statusMsg) statusMsg.textContent = "Error de red al enviar el control.";
-      }
-    }
+DATASETS = DatasetStore()
 
-    function renderTable() {
-      const wrapper = document.getElementById("tableWrapper");
-      wrapper.innerHTML = "";
-      if (!globalData || !globalData.rows || !globalData.rows.length) {
-        wrapper.innerHTML = '<div class="empty-state" style="padding:16px;">Sin datos para mostrar.</div>';
-        return;
-      }
-      const cols = globalData.columns || [];
-      const labels = globalData.fieldFriendlyLabels || {};
-      const rows = globalData.rows;
-      const maxRows = Math.min(rows.length, 300);
-
-      let html = "<table><thead><tr>";
-      cols.forEach(c => {
-        html += "<th>" + (labels[c] || c) + "</th>";
-      });
-      html += "</tr></thead><tbody>";
-
-      for (let i = 0; i < maxRows; i++) {
-        const r = rows[i];
-        html += "<tr>";
-        cols.forEach(c => {
-          let v = r[c];
-          if (v === null || v === undefined) v = "";
-          html += "<td>" + v + "</td>";
-        });
-        html += "</tr>";
-      }
-      if (rows.length > maxRows) {
-        html += '<tr><td colspan="' + cols.length + '">… (' + (rows.length - maxRows) + ' filas adicionales no mostradas)</td></tr>';
-      }
-      html += "</tbody></table>";
-      wrapper.innerHTML = html;
-    }
 
-    function renderFieldsDictionary() {
-      const container = document.getElementById("fieldsGrid");
-      container.innerHTML = "";
-      if (!globalData || !globalData.columns) return;
-      const cols = globalData.columns;
-      const labels = globalData.fieldFriendlyLabels || {};
-      const descs = globalData.fieldDescriptions || {};
-
-      cols.forEach(c => {
-        const card = document.createElement("div");
-        card.className = "field-card";
-        const label = labels[c] || c;
-        const desc = descs[c] || ("Campo registrado: " + label);
-        card.innerHTML = `
-          <div class="field-name">${c}</div>
-          <div class="field-label">${label}</div>
-          <div class="field-desc">${desc}</div>
-        `;
-        container.appendChild(card);
-      });
-    }
+async def resolve_dataset(name: Optional[str]):
+    """Conjunto pedido con ?dataset= (por defecto, los datos en vivo) o la JSONResponse 404."""
+    ds = await DATASETS.get(name)
+    if ds is None:
+        return JSONResponse({"detail": f"Conjunto de datos desconocido: {name}"}, status_code=404)
+    return ds
 
-    function resetFilters() {
-      const from = document.getElementById("fromDate");
-      const to = document.getElementById("toDate");
-      if (from) from.value = "";
-      if (to) to.value = "";
-      currentFilter = "all";
-      applyFilterButtons();
-      if (globalData) {
-        initControls();
-        updateChart();
-      }
-    }
 
-    function setupTabs() {
-      const tabs = document.querySelectorAll(".tab");
-      const panels = document.querySelectorAll(".tab-panel");
-      tabs.forEach(tab => {
-        tab.addEventListener("click", () => {
-          const target = tab.getAttribute("data-tab");
-          tabs.forEach(t => t.classList.remove("active"));
-          tab.classList.add("active");
-          panels.forEach(p => {
-            if (p.id === "tab-" + target) p.classList.add("active");
-            else p.classList.remove("active");
-          });
-        });
-      });
-    }
+# ===================== Esquema =====================
+
+def column_class(dtype) -> str:
+    """Clase de una columna para el dashboard: numeric, datetime o text."""
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "numeric"
+    return "text"
+
+
+class SchemaRegistry:
+    """
+    Metadatos de columnas (clase, etiqueta y descripción) calculados una vez
+    por esquema distinto. Un esquema es el conjunto ordenado de columnas con
+    su clase más la columna de tiempo; su versión es un hash de eso, estable
+    entre reinicios, por lo que /api/schema?v=<versión> nunca cambia.
+    """
+
+    def __init__(self):
+        self._by_version: Dict[str, dict] = {}
+        self._current: Dict[str, tuple] = {}  # conjunto → (versión de los datos, esquema)
+
+    def register(self, schema_df, time_column: Optional[str]) -> dict:
+        classes = {str(c): column_class(schema_df[c].dtype) for c in schema_df.columns}
+        key = json.dumps([list(classes.items()), time_column], ensure_ascii=False)
+        version = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+        entry = self._by_version.get(version)
+        if entry is None:
+            columns = list(classes)
+            datetime_cols = [c for c in columns if classes[c] == "datetime"]
+            # el timestamp de texto del ESP32 también es la columna de tiempo
+            if time_column is not None and time_column not in datetime_cols:
+                datetime_cols.append(time_column)
+            labels, descriptions = build_field_metadata(columns)
+            entry = {
+                "schemaVersion": version,
+                "columns": columns,
+                "columnClasses": classes,
+                "timeColumn": time_column,
+                "numericColumns": [c for c in columns if classes[c] == "numeric"],
+                "datetimeColumns": datetime_cols,
+                "fieldFriendlyLabels": labels,
+                "fieldDescriptions": descriptions,
+            }
+            self._by_version[version] = entry
+        return entry
+
+    def current(self, ds=None) -> Optional[dict]:
+        """Esquema de la versión publicada de `ds` (por defecto, los datos en vivo; None sin datos)."""
+        ds = LIVE if ds is None else ds
+        snap = ds.snap
+        if snap is None:
+            return None
+        version, entry = self._current.get(ds.name, (None, None))
+        if version != snap.version:
+            entry = self.register(snap.schema, ds.index.column)
+            self._current[ds.name] = (snap.version, entry)
+        return entry
+
+    def get(self, version: str) -> Optional[dict]:
+        return self._by_version.get(version)
+
+
+SCHEMAS = SchemaRegistry()
+
+
+# ===================== Recursos estáticos =====================
+
+# El dashboard vive en static/: index.html (el cascarón: encabezado y
+# pestañas; los paneles los agrega panels.js) más CSS, JS y las librerías
+# copiadas en static/vendor/. Al arrancar se leen una vez, se les
+# agrega al nombre un hash del contenido y se comprimen con cada codificación
+# disponible (ENCODINGS); después se sirven desde memoria. Como la
+# URL cambia con el contenido, los recursos se cachean como inmutables; sólo
+# el cascarón se revalida (ETag) en cada carga.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "/static/"
+# Las librerías de static/vendor/ las copia vendor.py al armar la
+# instalación (verificadas contra vendor.lock.json); nunca se usa una CDN.
+STATIC_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".json": "application/json",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".ico": "image/x-icon",
+}
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+class StaticAsset:
+    """Un recurso en memoria, con sus versiones comprimidas."""
+
+    __slots__ = ("name", "url", "content_type", "etag", "bodies")
+
+    def __init__(self, name: str, url: str, body: bytes):
+        self.name = name
+        self.url = url
+        self.content_type = STATIC_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        self.bodies = {None: body}
+        if self.content_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                packed = compress_body(body, encoding, static=True)
+                if len(packed) < len(body):
+                    self.bodies[encoding] = packed
+
+    def response(self, request: Request, cache_control: str) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=304, headers=headers)
+        encoding = choose_encoding(request.headers.get("accept-encoding"), [e for e in self.bodies if e])
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(self.bodies[encoding], media_type=self.content_type, headers=headers)
+
+
+class AssetStore:
+    """
+    Recursos de static/ por nombre con hash ("dashboard.3f9a0c1e2b4d.js") y
+    por nombre simple, más el cascarón con las referencias ya reescritas.
+    """
+
+    SHELL = "index.html"
+    # src="/static/..." y href="/static/..." del cascarón
+    _REF = re.compile(r'(src|href)="/static/([^"]+)"')
+
+    def __init__(self, root: str):
+        self.root = root
+        self.shell: Optional[StaticAsset] = None
+        self._by_url: Dict[str, StaticAsset] = {}
+        self._by_name: Dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+
+    def _read(self, name: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.root, name), "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def load(self) -> None:
+        """Lee y comprime todo static/ (idempotente; la primera llamada hace el trabajo)."""
+        with self._lock:
+            if self.shell is not None:
+                return
+            by_url, by_name = {}, {}
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in sorted(filenames):
+                    name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                    if name == self.SHELL or name.startswith("."):
+                        continue
+                    body = self._read(name)
+                    if body is None:
+                        continue
+                    stem, ext = os.path.splitext(name)
+                    digest = hashlib.sha256(body).hexdigest()[:12]
+                    asset = StaticAsset(name, f"{STATIC_URL}{stem}.{digest}{ext}", body)
+                    by_url[asset.url] = asset
+                    by_name[name] = asset
+
+            def rewrite(match):
+                name = match.group(2)
+                if name not in by_name:
+                    hint = " (correr python vendor.py)" if name.startswith("vendor/") else ""
+                    print(f"Recurso estático faltante: static/{name}{hint}")
+                    return match.group(0)
+                return f'{match.group(1)}="{by_name[name].url}"'
+
+            html = (self._read(self.SHELL) or b"").decode("utf-8")
+            self._by_url, self._by_name = by_url, by_name
+            self.shell = StaticAsset(self.SHELL, "/", self._REF.sub(rewrite, html).encode("utf-8"))
+
+    def get(self, path: str):
+        """(recurso, inmutable) para /static/<path>, o (None, False)."""
+        self.load()
+        asset = self._by_url.get(STATIC_URL + path)
+        if asset is not None:
+            return asset, True
+        return self._by_name.get(path), False
+
+
+ASSETS = AssetStore(STATIC_DIR)
 
-    document.addEventListener("DOMContentLoaded", () => {
-      document.getElementById("btnUpload").addEventListener("click", uploadFile);
-      document.getElementById("btnReset").addEventListener("click", resetFilters);
-
-      const btnExport = document.getElementById("btnExportXlsx");
-      if (btnExport) btnExport.addEventListener("click", exportXlsx);
-      const btnApplyControl = document.getElementById("btnApplyControl");
-      if (btnApplyControl) btnApplyControl.addEventListener("click", function(e) { e.preventDefault(); applyControlState(); });
-      loadControlState();
-
-      const selY1 = document.getElementById("selectY1");
-      const selY2 = document.getElementById("selectY2");
-      const selTime = document.getElementById("selectTime");
-      const from = document.getElementById("fromDate");
-      const to = document.getElementById("toDate");
-      const rangePreset = document.getElementById("selectRangePreset");
-
-      if (selY1) selY1.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); });
-      if (selY2) selY2.addEventListener("change", updateChart);
-      if (selTime) selTime.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); });
-      if (from) from.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); });
-      if (to) to.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); });
-
-      if (rangePreset) rangePreset.addEventListener("change", () => {
-        applyRangePreset(rangePreset.value);
-        updateChart();
-        updateTemperatureVisuals();
-      });
-
-      ["fltAll","fltDay","fltNight"].forEach(id => {
-        const btn = document.getElementById(id);
-        if (!btn) return;
-        btn.addEventListener("click", () => {
-          const filter = btn.getAttribute("data-filter");
-          currentFilter = filter;
-          applyFilterButtons();
-          updateChart();
-        });
-      });
-
-      setupTabs();
-      setEmptyState(true);
-      applyFilterButtons();
-      loadData();
-    });
-  </script>
-</body>
-</html>
-"""
 
 @app.get("/", response_class=HTMLResponse)
-async def index():
-    return HTMLResponse(DASHBOARD_HTML)
+def index(request: Request):
+    ASSETS.load()
+    return ASSETS.shell.response(request, "no-cache")
+
+
+@app.get("/static/{path:path}")
+def static_asset(path: str, request: Request):
+    """Recursos del dashboard: con hash en el nombre son inmutables; sin hash, se revalidan."""
+    asset, immutable = ASSETS.get(path)
+    if asset is None:
+        return JSONResponse({"detail": "Recurso no encontrado."}, status_code=404)
+    return asset.response(request, IMMUTABLE_CACHE if immutable else "no-cache")
+
+
+# Excel ya parseados, por hash del contenido: DATA_DIR/upload_cache/<sha256>.pkl.
+# Se descartan los menos usados cuando pasan UPLOAD_CACHE_MAX_MB en total.
+UPLOAD_CACHE_DIR = "upload_cache"
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("UPLOAD_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+class UploadCache:
+    """
+    Resultado de pd.read_excel + parse_datetime_columns por hash del archivo,
+    guardado como pickle (columnar y binario, el mismo formato que los
+    bloques del checkpoint). Volver a subir el mismo archivo no lo parsea.
+    """
+
+    def _path(self, digest: str) -> Optional[str]:
+        root = data_path(UPLOAD_CACHE_DIR)
+        if root is None:
+            return None
+        os.makedirs(root, exist_ok=True)
+        return os.path.join(root, digest + ".pkl")
+
+    def get(self, digest: str):
+        path = self._path(digest)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_pickle(path)
+        except Exception as e:
+            print(f"Entrada de la caché de subidas ilegible ({digest}): {e}")
+            return None
+        os.utime(path)  # la fecha de modificación ordena el LRU
+        return df
+
+    def put(self, digest: str, df) -> None:
+        path = self._path(digest)
+        if path is None:
+            return
+        _replace_with(path, df.to_pickle)
+        self._evict()
+
+    def _evict(self) -> None:
+        root = data_path(UPLOAD_CACHE_DIR)
+        entries = []
+        for name in os.listdir(root):
+            if name.endswith(".pkl"):
+                st = os.stat(os.path.join(root, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= UPLOAD_CACHE_MAX_BYTES:
+                break
+            os.remove(os.path.join(root, name))
+            total -= size
+
+
+UPLOAD_CACHE = UploadCache()
+# (hash, versión de los datos) del último reemplazo: volver a subir el mismo
+# archivo sin que nada haya cambiado desde entonces no hace nada.
+_LAST_REPLACE: Optional[tuple] = None
+
+
+def drop_present_rows(df, ds=None):
+    """
+    Filas de `df` cuyo tiempo no está ya en los datos de `ds` (por defecto,
+    los en vivo), según el índice de tiempo. Si todo `df` queda fuera del
+    rango cargado (el caso común: datos más nuevos) no se compara nada; si
+    no, búsqueda binaria por fila.
+    """
+    ds = LIVE if ds is None else ds
+    index = ds.index
+    column = index.column
+    if ds.snap is None or column is None or column not in df.columns or not index.valid:
+        return df
+    present = present_times(_times_ns(df, column, index.tz), index)
+    return df if present is None else df[~present]
+
+
+def present_times(new, index):
+    """Máscara de los tiempos `new` (como en el índice) que ya están en `index`; None si ninguno."""
+    if not index.valid:
+        return None
+    sorted_times = index.times[index.order()]
+    inside = (new != NAT_NS) & (new >= sorted_times[0]) & (new <= sorted_times[-1])
+    if not inside.any():
+        return None
+    candidates = new[inside]
+    idx = np.minimum(np.searchsorted(sorted_times, candidates), len(sorted_times) - 1)
+    present = np.zeros(len(new), dtype=bool)
+    present[np.flatnonzero(inside)] = sorted_times[idx] == candidates
+    return present if present.any() else None
 
 
 @app.post("/upload")
 async def upload_excel(
     file: UploadFile = File(...),
-    mode: str = Query("replace", regex="^(replace|append)$")
+    mode: str = Query("replace", regex="^(replace|append)$"),
+    dataset: Optional[str] = None,
 ):
     """
     Sube un Excel y lo guarda en memoria.
-    mode = replace → reemplaza LAST_DF
-    mode = append  → concatena con LAST_DF
+    mode = replace → reemplaza los datos en memoria
+    mode = append  → agrega las filas cuyo tiempo no está ya en los datos
+    dataset = conjunto con nombre donde cargarlo (por defecto, los datos en
+              vivo); los datos en vivo no se tocan al subir a otro conjunto
+
+    El parseo se guarda por hash del contenido: un archivo ya subido no se
+    vuelve a leer ("cached": true en la respuesta).
     """
-    global LAST_DF
+    global _LAST_REPLACE
+    if dataset == LIVE_DATASET:
+        dataset = None
+    if dataset is not None and not DATASET_NAME.match(dataset):
+        return JSONResponse(
+            {"detail": "Nombre de conjunto inválido: letras, números, '_', '-' o '.', hasta 64."},
+            status_code=400,
+        )
     try:
         content = await file.read()
-        excel_bytes = BytesIO(content)
-        df_new = pd.read_excel(excel_bytes)
-
-        # Parseo automático de columnas fecha/hora
-        for col in df_new.columns:
-            if df_new[col].dtype == object:
+        digest = hashlib.sha256(content).hexdigest()
+        skipped = 0
+
+        with stage("cache"):
+            df_new = UPLOAD_CACHE.get(digest)
+        cached = df_new is not None
+        if not cached:
+            excel_bytes = BytesIO(content)
+            with stage("read_excel"):
+                df_new = pd.read_excel(excel_bytes)
+
+            # Parseo automático de columnas fecha/hora
+            with stage("to_datetime"):
+                parse_datetime_columns(df_new)
+
+            with stage("cache"):
                 try:
-                    parsed = pd.to_datetime(df_new[col])
-                    if parsed.notna().mean() > 0.5:
-                        df_new[col] = parsed
-                except Exception:
-                    continue
-
-        if LAST_DF is None or mode == "replace":
-            LAST_DF = df_new
+                    UPLOAD_CACHE.put(digest, df_new)
+                except OSError as e:
+                    print(f"No se pudo guardar en la caché de subidas: {e}")
+
+        if dataset is not None:
+            current = await DATASETS.get(dataset) if mode == "append" else None
+            with stage("concat"):
+                if current is None:
+                    snap = (await DATASETS.put(dataset, df_new, file.filename)).snap
+                else:
+                    with stage("overlap"):
+                        df_add = drop_present_rows(df_new, current)
+                    skipped = len(df_new) - len(df_add)
+                    snap = current.snap
+                    if len(df_add):
+                        merged = pd.concat([snap.frame, df_add], ignore_index=True)
+                        snap = (await DATASETS.put(dataset, merged, file.filename)).snap
         else:
-            LAST_DF = pd.concat([LAST_DF, df_new], ignore_index=True)
+            # sobre los datos retomados, nunca antes (el checkpoint los pisaría)
+            await wait_restored()
+            with stage("concat"):
+                if mode == "replace":
+                    if _LAST_REPLACE != (digest, DATA_VERSION):
+                        replace_data(df_new)
+                        _LAST_REPLACE = (digest, DATA_VERSION)
+                else:
+                    with stage("overlap"):
+                        df_add = drop_present_rows(df_new)
+                    skipped = len(df_new) - len(df_add)
+                    if len(df_add):
+                        append_data(df_add)
+
+            # las subidas no pasan por el journal: se guardan con un checkpoint
+            with stage("checkpoint"):
+                await checkpoint()
+            snap = SNAPSHOT
 
         return {
             "status": "ok",
+            "dataset": dataset or LIVE_DATASET,
             "filename": file.filename,
-            "rows": int(len(LAST_DF)),
-            "columns": list(LAST_DF.columns),
+            "rows": int(snap.n),
+            "columns": list(snap.columns),
+            "cached": cached,
+            "skipped": skipped,
         }
     except Exception as e:
         return JSONResponse(
@@ -2061,55 +2170,873 @@ async def upload_excel(
 
 
 @app.get("/api/data")
-async def get_data():
-    global LAST_DF
-    if LAST_DF is None:
+async def get_data(
+    filter: str = Query("all", pattern="^(all|day|night)$"),
+    hours: Optional[float] = Query(None, gt=0),
+    dataset: Optional[str] = None,
+):
+    """
+    Filas completas. hours = sólo las últimas N horas hasta la última
+    lectura (lo que usan las tarjetas de estado); la tabla y el gráfico
+    tienen sus propios endpoints y no necesitan toda la historia.
+    """
+    ds = await resolve_dataset(dataset)
+    if isinstance(ds, JSONResponse):
+        return ds
+    # versión fijada: inmutable, no hace falta copiarla
+    snap = ds.snap
+    index = ds.index
+    if snap is None:
         return JSONResponse(
             {"detail": "No hay datos cargados aún."},
             status_code=404,
         )
 
-    df = LAST_DF.copy()
+    with stage("select"):
+        positions = None
+        if hours is not None and index.column is not None and index.valid:
+            order = index.order()
+            sorted_times = index.times[order]
+            since = sorted_times[-1] - int(hours * NS_PER_HOUR)
+            positions = index.filter_positions(order[np.searchsorted(sorted_times, since, "left"):], filter)
+        elif filter != "all":
+            positions = select_positions(day_filter=filter, ds=ds)
+
+    with stage("schema"):
+        schema = SCHEMAS.current(ds)
+        columns = schema["columns"]
+
+    with stage("serialize"):
+        # bloque por bloque: una columna que el bloque no tiene sale nula
+        frames = snap.blocks(columns) if positions is None else [snap.take(columns, positions)]
+        data_rows = []
+        for df in frames:
+            datetime_cols = [c for c in columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+            data_rows.extend(dataframe_to_records(df, datetime_cols))
+        is_day = None
+        if index.column is not None:
+            mask = index.day_mask(positions)
+            has_time = (index.minutes if positions is None else index.minutes[positions]) >= 0
+            is_day = [bool(d) if ok else None for d, ok in zip(mask.tolist(), has_time.tolist())]
+
+    # las columnas, clases y etiquetas están en /api/schema?v=<schemaVersion>
+    return {
+        "schemaVersion": schema["schemaVersion"],
+        "rows": data_rows,
+        "isDay": is_day,
+    }
 
-    numeric_cols = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
-    datetime_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
 
-    field_labels = {}
-    field_descriptions = {}
+@app.get("/api/schema")
+async def api_schema(request: Request, v: Optional[str] = None, dataset: Optional[str] = None):
+    """
+    Columnas, clases, etiquetas y descripciones del esquema actual del
+    conjunto `dataset`, o del esquema `v` (schemaVersion de /api/data). Con
+    `v` la respuesta no cambia nunca y se cachea como inmutable; sin `v` se
+    revalida con ETag.
+    """
+    if v:
+        entry = SCHEMAS.get(v)
+    else:
+        ds = await resolve_dataset(dataset)
+        if isinstance(ds, JSONResponse):
+            return ds
+        entry = SCHEMAS.current(ds)
+    if entry is None:
+        return JSONResponse({"detail": "Esquema desconocido."}, status_code=404)
+    headers = {
+        "ETag": f'"{entry["schemaVersion"]}"',
+        "Cache-Control": "public, max-age=31536000, immutable" if v else "no-cache",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(entry, headers=headers)
 
-    for c in df.columns:
-        pretty = prettify_column_name(c)
-        field_labels[c] = pretty
-        desc = KNOWN_FIELD_DESCRIPTIONS.get(c)
-        if desc is None:
-            desc = f"Campo registrado: {pretty}."
-        field_descriptions[c] = desc
 
-    data_rows = []
-    for _, row in df.iterrows():
-        record = {}
-        for c in df.columns:
-            val = row[c]
-            if pd.isna(val):
-                record[c] = None
-            elif c in datetime_cols:
-                record[c] = val.isoformat()
-            else:
-                record[c] = val.item() if hasattr(val, "item") else val
-        data_rows.append(record)
+async def series_request(columns: Optional[str], from_: Optional[str], to: Optional[str], dataset: Optional[str]):
+    """
+    Valida los parámetros comunes de /api/series y /api/series.bin.
+    Devuelve (conjunto, snap, columnas, from_ts, to_ts) o la JSONResponse de error.
+    """
+    ds = await resolve_dataset(dataset)
+    if isinstance(ds, JSONResponse):
+        return ds
+    snap = ds.snap
+    if snap is None or ds.index.column is None:
+        return JSONResponse({"detail": "No hay datos con columna de tiempo."}, status_code=404)
+
+    try:
+        from_ts = parse_time_param(from_)
+        to_ts = parse_time_param(to)
+    except ValueError as e:
+        return JSONResponse({"detail": f"Parámetro de fecha inválido: {e}"}, status_code=400)
+
+    if columns:
+        cols = [c for c in columns.split(",") if c]
+        missing = [c for c in cols if c not in snap.columns]
+        if missing:
+            return JSONResponse({"detail": f"Columnas desconocidas: {missing}"}, status_code=400)
+    else:
+        cols = SCHEMAS.current(ds)["numericColumns"]
+    return ds, snap, cols, from_ts, to_ts
+
+
+def series_breaks(positions, times, ds):
+    """
+    Cortes del índice de `ds` dentro de `positions` (ordenadas por tiempo):
+    índices antes de los que va un punto nulo, para que el gráfico no una los
+    dos lados de un corte, y el tiempo (epoch-ns) de cada punto nulo.
+    """
+    starts = ds.gaps.starts
+    local = ds.index.local_times(positions)
+    breaks = np.flatnonzero(np.isin(local[:-1], starts)) + 1 if starts else np.arange(0)
+    return breaks, (times[breaks - 1] + times[breaks]) // 2
+
+
+def epoch_ms(times, tz=None):
+    """
+    epoch-ns de un índice con zona `tz` → epoch-ms UTC en float64 (exacto:
+    cabe en 53 bits). Las horas sin zona son hora local del invernadero; en
+    los cambios de horario se toma la primera ocurrencia y las inexistentes
+    se corren.
+    """
+    index = pd.DatetimeIndex(times.view("datetime64[ns]"))
+    if tz is None:
+        index = index.tz_localize(GREENHOUSE_TZ, ambiguous=np.ones(len(index), dtype=bool),
+                                  nonexistent="shift_forward")
+    return (index.asi8 // 1_000_000).astype(np.float64)
+
+
+@app.get("/api/series")
+async def api_series(
+    columns: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    filter: str = Query("all", pattern="^(all|day|night)$"),
+    dataset: Optional[str] = None,
+):
+    """
+    Series para graficar, en formato columnar y ordenadas por tiempo:
+    {"time": [...], "series": {columna: [...]}}.
+    columns = lista separada por comas (por defecto, todas las numéricas).
+    """
+    req = await series_request(columns, from_, to, dataset)
+    if isinstance(req, JSONResponse):
+        return req
+    ds, snap, cols, from_ts, to_ts = req
+    index = ds.index
+
+    with stage("select"):
+        positions = select_positions(from_ts, to_ts, filter, ds)
+
+    with stage("serialize"):
+        times = index.times[positions]
+        breaks, break_times = series_breaks(positions, times, ds)
+        times = np.insert(times, breaks, break_times)
+        time_index = pd.DatetimeIndex(times.view("datetime64[ns]"))
+        if index.tz is not None:
+            time_index = time_index.tz_localize("UTC").tz_convert(index.tz)
+        sub = snap.take(cols, positions)
+        series = {}
+        for c in cols:
+            values = [serialize_value(v, False) for v in sub[c].astype(object)]
+            for k, b in enumerate(breaks.tolist()):
+                values.insert(b + k, None)
+            series[c] = values
 
     return {
-        "columns": list(df.columns),
-        "numericColumns": numeric_cols,
-        "datetimeColumns": datetime_cols,
-        "fieldFriendlyLabels": field_labels,
-        "fieldDescriptions": field_descriptions,
-        "rows": data_rows,
+        "timeColumn": index.column,
+        "filter": filter,
+        "time": [t.isoformat() for t in time_index],
+        "series": series,
+        "breaks": (breaks + np.arange(len(breaks))).tolist(),
+    }
+
+
+SERIES_BIN_MAGIC = b"SER1"
+
+
+@app.get("/api/series.bin")
+async def api_series_bin(
+    columns: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    filter: str = Query("all", pattern="^(all|day|night)$"),
+    dataset: Optional[str] = None,
+):
+    """
+    Las mismas series que /api/series, en binario para que el navegador las
+    use sin parsear texto:
+
+        "SER1" | uint32 LE largo del encabezado | encabezado JSON (relleno a 8 bytes)
+        | n float64 LE: tiempo en epoch-ms UTC | n float64 LE por columna ...
+
+    Las columnas van en el orden de header["columns"]; nulos y cortes del
+    índice son NaN. Sólo admite columnas numéricas.
+    """
+    req = await series_request(columns, from_, to, dataset)
+    if isinstance(req, JSONResponse):
+        return req
+    ds, snap, cols, from_ts, to_ts = req
+    index = ds.index
+    numeric = set(SCHEMAS.current(ds)["numericColumns"])
+    not_numeric = [c for c in cols if c not in numeric]
+    if not_numeric:
+        return JSONResponse({"detail": f"Columnas no numéricas: {not_numeric}"}, status_code=400)
+
+    with stage("select"):
+        positions = select_positions(from_ts, to_ts, filter, ds)
+
+    with stage("serialize"):
+        times = index.times[positions]
+        breaks, break_times = series_breaks(positions, times, ds)
+        buffers = [epoch_ms(np.insert(times, breaks, break_times), index.tz)]
+        sub = snap.take(cols, positions)
+        for c in cols:
+            values = pd.to_numeric(sub[c], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            buffers.append(np.insert(values, breaks, np.nan))
+        header = json.dumps({
+            "version": snap.version,
+            "n": len(buffers[0]),
+            "timeColumn": index.column,
+            "timeZone": GREENHOUSE_TZ,
+            "filter": filter,
+            "columns": cols,
+            "breaks": (breaks + np.arange(len(breaks))).tolist(),
+            "dtype": "float64",
+            "byteOrder": "little",
+        }, ensure_ascii=False).encode("utf-8")
+        # los buffers tienen que empezar alineados a 8 bytes para Float64Array
+        header += b" " * (-len(header) % 8)
+        body = b"".join([
+            SERIES_BIN_MAGIC,
+            len(header).to_bytes(4, "little"),
+            header,
+            np.concatenate(buffers).astype("<f8", copy=False).tobytes(),
+        ])
+
+    return Response(body, media_type="application/octet-stream", headers={"Cache-Control": "no-store"})
+
+@app.get("/api/export")
+async def api_export(
+    format: str = Query("xlsx", pattern="^(xlsx|csv|parquet)$"),
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    columns: Optional[str] = None,
+    filter: str = Query("all", pattern="^(all|day|night)$"),
+    dataset: Optional[str] = None,
+):
+    """
+    Exporta en streaming el rango filtrado a XLSX, CSV o Parquet.
+    columns = lista separada por comas (por defecto todas las columnas).
+    filter  = all | day | night
+    """
+    ds = await resolve_dataset(dataset)
+    if isinstance(ds, JSONResponse):
+        return ds
+    snap = ds.snap
+    if snap is None:
+        return JSONResponse({"detail": "No hay datos cargados aún."}, status_code=404)
+
+    try:
+        from_ts = parse_time_param(from_)
+        to_ts = parse_time_param(to)
+    except ValueError as e:
+        return JSONResponse({"detail": f"Parámetro de fecha inválido: {e}"}, status_code=400)
+
+    if columns:
+        cols = [c for c in columns.split(",") if c]
+        missing = [c for c in cols if c not in snap.columns]
+        if missing:
+            return JSONResponse({"detail": f"Columnas desconocidas: {missing}"}, status_code=400)
+    else:
+        cols = list(snap.columns)
+
+    if format == "parquet":
+        try:
+            import pyarrow
+        except ImportError:
+            return JSONResponse(
+                {"detail": "Exportar a Parquet requiere instalar pyarrow en el servidor."},
+                status_code=400,
+            )
+
+    with stage("select"):
+        positions = select_positions(from_ts, to_ts, filter, ds)
+
+    writer, media_type = EXPORT_FORMATS[format]
+    if format == "parquet":
+        # el esquema y el primer bloque se validan antes de responder 200
+        try:
+            with stage("schema"):
+                body = writer(snap, positions, cols, ds.index)
+        except (pyarrow.lib.ArrowException, TypeError, ValueError) as e:
+            return JSONResponse({"detail": f"No se pudo convertir a Parquet: {e}"}, status_code=500)
+    else:
+        body = writer(snap, positions, cols)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="invernadero_export.{format}"'},
+    )
+
+@app.get("/api/table")
+async def api_table(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    sort: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    filter: str = Query("all", pattern="^(all|day|night)$"),
+    dataset: Optional[str] = None,
+):
+    """
+    Página de la tabla de datos. El rango from/to se resuelve con el índice
+    temporal; ordenar por tiempo (por defecto) no requiere ordenar nada.
+    """
+    ds = await resolve_dataset(dataset)
+    if isinstance(ds, JSONResponse):
+        return ds
+    snap = ds.snap
+    if snap is None:
+        return JSONResponse({"detail": "No hay datos cargados aún."}, status_code=404)
+
+    try:
+        from_ts = parse_time_param(from_)
+        to_ts = parse_time_param(to)
+    except ValueError as e:
+        return JSONResponse({"detail": f"Parámetro de fecha inválido: {e}"}, status_code=400)
+
+    if sort is not None and sort not in snap.columns:
+        return JSONResponse({"detail": f"Columna desconocida: {sort}"}, status_code=400)
+
+    time_col = ds.index.column
+    with stage("select"):
+        positions = select_positions(from_ts, to_ts, filter, ds)
+
+        if sort is not None and sort != time_col:
+            key = (ds.name, snap.version, sort, from_, to, filter)
+            sorted_positions = _SORT_CACHE.get(key)
+            if sorted_positions is None:
+                values = snap.take([sort], positions)[sort]
+                sorted_positions = positions[np.argsort(values.to_numpy(), kind="stable")] \
+                    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values) \
+                    else positions[values.astype(str).argsort(kind="stable").to_numpy()]
+                if len(_SORT_CACHE) >= _SORT_CACHE_SIZE:
+                    _SORT_CACHE.pop(next(iter(_SORT_CACHE)))
+                _SORT_CACHE[key] = sorted_positions
+            positions = sorted_positions
+
+        total = len(positions)
+        if order == "desc":
+            stop = max(0, total - offset)
+            page = positions[max(0, stop - limit):stop][::-1]
+        else:
+            page = positions[offset:offset + limit]
+
+    columns = list(snap.columns)
+    with stage("serialize"):
+        rows = frame_to_rows(snap, page, columns)
+
+    return {
+        "total": int(total),
+        "offset": offset,
+        "limit": limit,
+        "sort": sort or time_col,
+        "order": order,
+        "columns": columns,
+        "rows": rows,
+    }
+
+def _local_param_ns(ts) -> Optional[int]:
+    """Parámetro de fecha → ns en hora local del invernadero (como el libro de energía)."""
+    if ts is None:
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(GREENHOUSE_TZ).tz_localize(None)
+    return ts.value
+
+
+@app.get("/api/outages")
+async def api_outages(
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    dataset: Optional[str] = None,
+):
+    """Cortes de datos (huecos mayores al umbral) que se superponen con el rango."""
+    ds = await resolve_dataset(dataset)
+    if isinstance(ds, JSONResponse):
+        return ds
+    try:
+        from_ns = _local_param_ns(parse_time_param(from_))
+        to_ns = _local_param_ns(parse_time_param(to))
+    except ValueError as e:
+        return JSONResponse({"detail": f"Parámetro de fecha inválido: {e}"}, status_code=400)
+    gaps = ds.gaps
+    outages = gaps.between(from_ns, to_ns)
+    return {
+        "expectedIntervalS": round(gaps.expected_ns / 1e9, 3) if gaps.expected_ns else None,
+        "thresholdS": round(gaps.threshold_ns() / 1e9, 3),
+        "outages": [
+            {
+                "start": pd.Timestamp(s).isoformat(),
+                "end": pd.Timestamp(e).isoformat(),
+                "durationS": round((e - s) / 1e9, 1),
+            }
+            for s, e in outages
+        ],
+        "totalDowntimeS": round(sum(e - s for s, e in outages) / 1e9, 1),
+    }
+
+
+# Columnas de estado para las horas de funcionamiento (primera presente).
+RUNTIME_COLUMNS = {
+    "wall": ["vent_pared_on", "relay_pared_on", "wallFansOn"],
+    "colg": ["vent_colg_on", "n_colg_vent_on", "colgFansOn"],
+    "pump": ["pump_on"],
+}
+# Columna del modo de control (primera presente), para las horas por modo.
+MODE_COLUMNS = ["modo_control", "modo", "controlMode"]
+
+
+@app.get("/api/runtime")
+async def api_runtime(
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    hours: Optional[float] = Query(None, gt=0),
+    dataset: Optional[str] = None,
+):
+    """
+    Horas de funcionamiento de ventiladores de pared, colgantes y bomba en el
+    rango, y horas en cada modo de control (modeHours, por valor del modo):
+    cada estado dura hasta la lectura siguiente, salvo si hay un corte.
+    hours = últimas N horas hasta la última lectura.
+    """
+    ds = await resolve_dataset(dataset)
+    if isinstance(ds, JSONResponse):
+        return ds
+    snap = ds.snap
+    index = ds.index
+    if snap is None or index.column is None:
+        return JSONResponse({"detail": "No hay datos con columna de tiempo."}, status_code=404)
+    try:
+        from_ts = parse_time_param(from_)
+        to_ts = parse_time_param(to)
+    except ValueError as e:
+        return JSONResponse({"detail": f"Parámetro de fecha inválido: {e}"}, status_code=400)
+
+    positions = index.range_positions(from_ts, to_ts)
+    local = index.local_times(positions)
+    if hours is not None and len(local):
+        keep = local >= local[-1] - int(hours * NS_PER_HOUR)
+        positions, local = positions[keep], local[keep]
+
+    # los intervalos con un corte registrado (los de /api/outages) no cuentan
+    dt = np.diff(local)
+    dt[ds.gaps.mask(local)] = 0
+    result = {"samples": int(len(positions)), "coveredHours": round(float(dt.sum()) / NS_PER_HOUR, 4)}
+    for key, candidates in RUNTIME_COLUMNS.items():
+        col = next((c for c in candidates if c in snap.column_start), None)
+        if col is None or len(positions) < 2:
+            result[key + "Hours"] = None
+            continue
+        on = pd.to_numeric(snap.take([col], positions[:-1])[col], errors="coerce").to_numpy() > 0
+        result[key + "Hours"] = round(float(dt[on].sum()) / NS_PER_HOUR, 4)
+    mode_col = next((c for c in MODE_COLUMNS if c in snap.column_start), None)
+    result["modeHours"] = None
+    if mode_col is not None and len(positions) >= 2:
+        modes = snap.take([mode_col], positions[:-1])[mode_col]
+        by_mode = pd.Series(dt).groupby(modes.astype("string").to_numpy(), dropna=True).sum()
+        result["modeHours"] = {str(m): round(float(h) / NS_PER_HOUR, 4) for m, h in by_mode.items()}
+    return result
+
+
+@app.get("/api/energy")
+async def api_energy(
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    hours: Optional[float] = Query(None, gt=0),
+    granularity: Optional[str] = Query(None, pattern="^(hour|day)$"),
+    dataset: Optional[str] = None,
+):
+    """
+    Energía consumida por el variador en un período (kWh), calculada con el
+    libro incremental. hours = últimas N horas hasta la última lectura.
+    granularity = hour | day agrega el desglose por hora o por día.
+    """
+    ds = await resolve_dataset(dataset)
+    if isinstance(ds, JSONResponse):
+        return ds
+    energy = ds.energy
+    if energy.last_t is None:
+        return JSONResponse({"detail": "No hay datos de energía aún."}, status_code=404)
+    try:
+        from_ns = _local_param_ns(parse_time_param(from_))
+        to_ns = _local_param_ns(parse_time_param(to))
+    except ValueError as e:
+        return JSONResponse({"detail": f"Parámetro de fecha inválido: {e}"}, status_code=400)
+
+    if hours is not None:
+        to_ns = energy.last_t if to_ns is None else to_ns
+        from_ns = to_ns - int(hours * NS_PER_HOUR)
+
+    kwh, covered = energy.energy_between(from_ns, to_ns)
+    result = {
+        "from": None if from_ns is None else pd.Timestamp(from_ns).isoformat(),
+        "to": pd.Timestamp(energy.last_t if to_ns is None else to_ns).isoformat(),
+        "kWh": round(kwh, 6),
+        "coveredHours": round(covered, 4),
+        "meanPowerKW": round(kwh / covered, 4) if covered > 0 else None,
+        "powerFactor": energy.power_factor,
+        "totalKWh": round(energy.total_kwh, 6),
+        "gaps": energy.gaps,
+        "lastSample": pd.Timestamp(energy.last_t).isoformat(),
+    }
+    if granularity:
+        size = 1 if granularity == "hour" else 24
+        lo = -np.inf if from_ns is None else from_ns - size * NS_PER_HOUR
+        hi = np.inf if to_ns is None else to_ns
+        result["buckets"] = [
+            {"start": pd.Timestamp(ns).isoformat(), "kWh": round(e, 6)}
+            for ns, e in energy.buckets(size) if lo < ns <= hi
+        ]
+    return result
+
+# ===================== Alertas =====================
+
+# Reglas por defecto; ALERT_RULES_FILE puede apuntar a un JSON con otra lista.
+#   threshold: condición sobre uno o más campos ("all": [...])
+#   rate:      variación de `field` por `per_s` segundos comparada con `value`
+#   duration:  condición sostenida durante al menos `for_s` segundos
+#   stuck:     `field` sin cambiar (± tolerance) durante `for_s` segundos
+DEFAULT_ALERT_RULES = [
+    {"id": "temp_alta", "type": "threshold", "severity": "critical",
+     "field": "temp_invernadero_C", "op": ">=", "value": 38.0,
+     "message": "Temperatura del invernadero muy alta."},
+    {"id": "temp_subida_rapida", "type": "rate", "severity": "warning",
+     "field": "temp_invernadero_C", "op": ">=", "value": 3.0, "per_s": 600,
+     "message": "La temperatura sube más de 3 °C en 10 minutos."},
+    {"id": "vfd_sin_corriente", "type": "threshold", "severity": "critical",
+     "all": [{"field": "vfd_curr_out_A", "op": "<=", "value": 0.1},
+             {"field": "freq_cmd_Hz", "op": ">=", "value": 20.0}],
+     "message": "El variador no entrega corriente con frecuencia comandada alta."},
+    {"id": "bomba_prolongada", "type": "duration", "severity": "warning",
+     "field": "pump_on", "op": "==", "value": 1, "for_s": 3 * 3600,
+     "message": "La bomba lleva más de 3 horas encendida."},
+    {"id": "sensor_temp_trabado", "type": "stuck", "severity": "warning",
+     "field": "temp_invernadero_C", "tolerance": 0.0, "for_s": 1800,
+     "message": "El sensor de temperatura no cambia hace 30 minutos."},
+]
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES_FILE")
+ALERT_HISTORY_SIZE = int(os.environ.get("ALERT_HISTORY_SIZE", "500"))
+
+_OPERATORS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt,
+    "<=": operator.le, "==": operator.eq, "!=": operator.ne,
+}
+
+
+def _compile_condition(clauses):
+    """Convierte [{"field","op","value"}, ...] en una función rec → True/False/None."""
+    compiled = [(c["field"], _OPERATORS[c["op"]], c["value"]) for c in clauses]
+
+    def check(rec):
+        for field, op, value in compiled:
+            v = rec.get(field)
+            if v is None or v != v:  # ausente o NaN: no se puede evaluar
+                return None
+            if not op(v, value):
+                return False
+        return True
+
+    return check
+
+
+class ThresholdRule:
+    __slots__ = ("cond",)
+
+    def __init__(self, spec):
+        self.cond = _compile_condition(spec.get("all") or [spec])
+
+    def check(self, rec, t):
+        return self.cond(rec)
+
+
+class RateRule:
+    __slots__ = ("field", "op", "value", "per_s", "prev_v", "prev_t")
+
+    def __init__(self, spec):
+        self.field = spec["field"]
+        self.op = _OPERATORS[spec["op"]]
+        self.value = spec["value"]
+        self.per_s = spec.get("per_s", 60)
+        self.prev_v = None
+        self.prev_t = None
+
+    def check(self, rec, t):
+        v = rec.get(self.field)
+        if v is None or v != v:
+            return None
+        prev_v, prev_t = self.prev_v, self.prev_t
+        self.prev_v, self.prev_t = v, t
+        if prev_t is None or t <= prev_t:
+            return None
+        return self.op((v - prev_v) / (t - prev_t) * self.per_s, self.value)
+
+
+class DurationRule:
+    __slots__ = ("cond", "for_s", "since")
+
+    def __init__(self, spec):
+        self.cond = _compile_condition(spec.get("all") or [spec])
+        self.for_s = spec["for_s"]
+        self.since = None
+
+    def check(self, rec, t):
+        ok = self.cond(rec)
+        if ok is None:
+            return None
+        if not ok:
+            self.since = None
+            return False
+        if self.since is None:
+            self.since = t
+        return t - self.since >= self.for_s
+
+
+class StuckRule:
+    __slots__ = ("field", "tolerance", "for_s", "value", "since")
+
+    def __init__(self, spec):
+        self.field = spec["field"]
+        self.tolerance = spec.get("tolerance", 0.0)
+        self.for_s = spec["for_s"]
+        self.value = None
+        self.since = None
+
+    def check(self, rec, t):
+        v = rec.get(self.field)
+        if v is None or v != v:
+            return None
+        if self.value is None or abs(v - self.value) > self.tolerance:
+            self.value, self.since = v, t
+            return False
+        return t - self.since >= self.for_s
+
+
+_RULE_TYPES = {
+    "threshold": ThresholdRule,
+    "rate": RateRule,
+    "duration": DurationRule,
+    "stuck": StuckRule,
+}
+
+
+class AlertEngine:
+    """
+    Evalúa las reglas de forma incremental en cada lectura: cada regla
+    guarda O(1) de estado y se compila una sola vez al cargarlas.
+    """
+
+    def __init__(self, specs):
+        self.specs = {s["id"]: s for s in specs}
+        self.rules = [(s["id"], _RULE_TYPES[s["type"]](s)) for s in specs]
+        self.active: Dict[str, dict] = {}
+        self.history: deque = deque(maxlen=ALERT_HISTORY_SIZE)
+        self.evaluations = 0
+        self.cost_us_avg = 0.0
+        self.cost_us_max = 0.0
+
+    def evaluate(self, rec: dict, t: float, when: str) -> None:
+        """Evalúa todas las reglas para una lectura (t en segundos, `when` en ISO)."""
+        t0 = time.perf_counter()
+        for rule_id, rule in self.rules:
+            firing = rule.check(rec, t)
+            if firing is None:
+                continue
+            alert = self.active.get(rule_id)
+            if firing and alert is None:
+                spec = self.specs[rule_id]
+                self.active[rule_id] = {
+                    "rule": rule_id,
+                    "type": spec["type"],
+                    "severity": spec.get("severity", "warning"),
+                    "message": spec.get("message", rule_id),
+                    "started": when,
+                    "ended": None,
+                    "value": rec.get(spec.get("field")) if "field" in spec else None,
+                }
+            elif not firing and alert is not None:
+                alert["ended"] = when
+                self.history.append(self.active.pop(rule_id))
+        cost = (time.perf_counter() - t0) * 1e6
+        self.evaluations += 1
+        self.cost_us_avg += (cost - self.cost_us_avg) / min(self.evaluations, 1000)
+        self.cost_us_max = max(self.cost_us_max, cost)
+
+
+def load_alert_rules():
+    if ALERT_RULES_FILE:
+        with open(ALERT_RULES_FILE, encoding="utf-8") as fh:
+            return json.load(fh)
+    return DEFAULT_ALERT_RULES
+
+
+ALERTS = AlertEngine(load_alert_rules())
+
+
+def evaluate_alerts(rec: dict, local_ns: int) -> None:
+    """Evalúa las reglas para una lectura recién ingresada."""
+    if local_ns == NAT_NS:
+        local_ns = pd.Timestamp.now(GREENHOUSE_TZ).tz_localize(None).value
+    ALERTS.evaluate(rec, local_ns / 1e9, pd.Timestamp(local_ns).isoformat())
+
+
+@app.get("/api/alerts")
+async def api_alerts(limit: int = Query(100, ge=1, le=ALERT_HISTORY_SIZE)):
+    """Alertas activas y las últimas cerradas (la más reciente primero)."""
+    history = list(ALERTS.history)[-limit:]
+    history.reverse()
+    return {
+        "active": list(ALERTS.active.values()),
+        "history": history,
+        "rules": list(ALERTS.specs.values()),
+        "evaluations": ALERTS.evaluations,
+        "evalCostUs": {"avg": round(ALERTS.cost_us_avg, 2), "max": round(ALERTS.cost_us_max, 2)},
+    }
+
+# ===================== Salud de dispositivos =====================
+
+# Sin lecturas durante más de DEVICE_ONLINE_S el dispositivo pasa a "late" y
+# después de DEVICE_OFFLINE_S a "offline" (según el reloj del servidor).
+DEVICE_ONLINE_S = float(os.environ.get("DEVICE_ONLINE_S", "300"))
+DEVICE_OFFLINE_S = float(os.environ.get("DEVICE_OFFLINE_S", "900"))
+DEFAULT_DEVICE_ID = "esp32"
+
+
+class DeviceStats:
+    """Estadísticas de llegada de un dispositivo, actualizadas en O(1) por lectura."""
+
+    __slots__ = ("device_id", "first_seen", "last_seen", "last_timestamp", "count",
+                 "ia_n", "ia_mean", "ia_m2", "ia_min", "ia_max", "ia_ewma",
+                 "bytes_total", "bytes_last", "control_version", "control_polled")
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.first_seen = None
+        self.last_seen = None
+        self.last_timestamp = None
+        self.count = 0
+        self.ia_n = 0
+        self.ia_mean = 0.0
+        self.ia_m2 = 0.0
+        self.ia_min = None
+        self.ia_max = None
+        self.ia_ewma = None
+        self.bytes_total = 0
+        self.bytes_last = 0
+        # versión del estado de control que tiene el dispositivo y cuándo la recibió
+        self.control_version = None
+        self.control_polled = None
+
+    def observe(self, now: float, payload_bytes: int, timestamp: Optional[str]) -> None:
+        if self.last_seen is not None:
+            ia = now - self.last_seen
+            # media y varianza de Welford
+            self.ia_n += 1
+            delta = ia - self.ia_mean
+            self.ia_mean += delta / self.ia_n
+            self.ia_m2 += delta * (ia - self.ia_mean)
+            self.ia_min = ia if self.ia_min is None else min(self.ia_min, ia)
+            self.ia_max = ia if self.ia_max is None else max(self.ia_max, ia)
+            self.ia_ewma = ia if self.ia_ewma is None else 0.8 * self.ia_ewma + 0.2 * ia
+        else:
+            self.first_seen = now
+        self.last_seen = now
+        self.last_timestamp = timestamp
+        self.count += 1
+        self.bytes_total += payload_bytes
+        self.bytes_last = payload_bytes
+
+    def state(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_state(cls, data: dict) -> "DeviceStats":
+        stats = cls(data["device_id"])
+        for name in cls.__slots__:
+            if name in data:
+                setattr(stats, name, data[name])
+        return stats
+
+    def to_json(self, now: float) -> dict:
+        age = now - self.last_seen
+        if age <= DEVICE_ONLINE_S:
+            status = "online"
+        elif age <= DEVICE_OFFLINE_S:
+            status = "late"
+        else:
+            status = "offline"
+        std = (self.ia_m2 / (self.ia_n - 1)) ** 0.5 if self.ia_n > 1 else None
+        return {
+            "deviceId": self.device_id,
+            "status": status,
+            "lastSeen": datetime.fromtimestamp(self.last_seen, timezone.utc).isoformat(),
+            "ageS": round(age, 1),
+            "lastTimestamp": self.last_timestamp,
+            "readings": self.count,
+            "interArrivalS": {
+                "mean": round(self.ia_mean, 2) if self.ia_n else None,
+                "std": round(std, 2) if std is not None else None,
+                "min": round(self.ia_min, 2) if self.ia_min is not None else None,
+                "max": round(self.ia_max, 2) if self.ia_max is not None else None,
+                "ewma": round(self.ia_ewma, 2) if self.ia_ewma is not None else None,
+            },
+            # lecturas por minuto según el intervalo suavizado
+            "ratePerMin": round(60.0 / self.ia_ewma, 3) if self.ia_ewma else None,
+            "payloadBytes": {
+                "last": self.bytes_last,
+                "mean": round(self.bytes_total / self.count, 1),
+            },
+            "control": {
+                "version": self.control_version,
+                "pending": self.control_version != CONTROL_VERSION,
+                "lastPoll": (datetime.fromtimestamp(self.control_polled, timezone.utc).isoformat()
+                             if self.control_polled is not None else None),
+            },
+        }
+
+
+DEVICES: Dict[str, DeviceStats] = {}
+
+
+def track_device(device_id: str, payload_bytes: int, timestamp: Optional[str]) -> None:
+    stats = DEVICES.get(device_id)
+    if stats is None:
+        stats = DEVICES[device_id] = DeviceStats(device_id)
+    stats.observe(time.time(), payload_bytes, timestamp)
+
+
+@app.get("/api/health/devices")
+async def api_health_devices():
+    """Estado de enlace de cada dispositivo (barato: pensado para consultarse cada pocos segundos)."""
+    now = time.time()
+    return {
+        "serverTime": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+        "onlineS": DEVICE_ONLINE_S,
+        "offlineS": DEVICE_OFFLINE_S,
+        "devices": [s.to_json(now) for s in DEVICES.values()],
     }
 
 # ===================== API ESP32 / GSM =====================
 
 class Lectura(BaseModel):
+    device_id: Optional[str] = None
+    # última versión del estado de control que recibió el controlador (no se guarda)
+    control_version: Optional[int] = None
+    # número de secuencia del controlador, para reconocer reenvíos (no se guarda)
+    seq: Optional[int] = None
     timestamp: str
     dia_semana: str
     modo_control: str
@@ -2151,55 +3078,404 @@ class ControlUpdate(BaseModel):
     pump_on: Optional[bool] = None
 
 
+# Versión del estado de control: sube con cada cambio. La última emitida se
+# guarda en DATA_DIR/control.json con cada cambio y al arrancar se sigue desde
+# la siguiente: el estado no se guarda (vuelve a los valores por defecto), así
+# que un controlador con una versión anterior al reinicio recibe todos los
+# flags aunque el reloj del servidor haya ido para atrás. Sin archivo (primer
+# arranque o sin persistencia) se parte de la hora del servidor.
+CONTROL_FILE = "control.json"
+CONTROL_VERSION = int(time.time())
+# Primera versión de este proceso: una anterior (o una que nunca emitió) no
+# se compara flag por flag, se manda el estado completo.
+CONTROL_BASE = CONTROL_VERSION
+# Versión en la que cambió cada flag, para mandar sólo la diferencia.
+CONTROL_CHANGED: Dict[str, int] = {k: CONTROL_VERSION for k in CONTROL_STATE}
+
+
+def save_control_version() -> None:
+    path = data_path(CONTROL_FILE)
+    if path is None:
+        return
+    try:
+        save_json_atomic(path, {"version": CONTROL_VERSION})
+    except OSError as e:
+        print(f"No se pudo guardar la versión de control: {e}")
+
+
+def load_control_version() -> None:
+    """Sigue la numeración del proceso anterior (se llama al arrancar)."""
+    global CONTROL_VERSION, CONTROL_BASE
+    path = data_path(CONTROL_FILE)
+    if path is not None and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                CONTROL_VERSION = int(json.load(fh)["version"]) + 1
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"No se pudo leer la versión de control: {e}")
+    CONTROL_BASE = CONTROL_VERSION
+    for k in CONTROL_CHANGED:
+        CONTROL_CHANGED[k] = CONTROL_VERSION
+    save_control_version()
+
+
+def control_diff(since: Optional[int]) -> Dict[str, bool]:
+    """Flags que cambiaron después de la versión `since` (todos si no es de este proceso)."""
+    if since is None or since < CONTROL_BASE or since > CONTROL_VERSION:
+        return dict(CONTROL_STATE)
+    return {k: CONTROL_STATE[k] for k, v in CONTROL_CHANGED.items() if v > since}
+
+
+def note_control_poll(device_id: str) -> None:
+    """Registra que `device_id` (si ya envió lecturas) recibió el estado de control actual."""
+    stats = DEVICES.get(device_id)
+    if stats is None:
+        return
+    stats.control_version = CONTROL_VERSION
+    stats.control_polled = time.time()
+
+
+# Cola de ingreso: /api/ingreso valida y encola; un único appender en segundo
+# plano vacía la cola cada INGEST_FLUSH_MS (o al juntar INGEST_BATCH_MAX
+# lecturas) y aplica un solo append vectorizado por lote.
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_MAX = int(os.environ.get("INGEST_BATCH_MAX", "500"))
+INGEST_FLUSH_MS = float(os.environ.get("INGEST_FLUSH_MS", "20"))
+INGEST_RETRY_AFTER_S = int(os.environ.get("INGEST_RETRY_AFTER_S", "2"))
+
+# (lectura, clave de DEDUP): si el lote no se puede agregar, se olvidan sus claves.
+INGEST_QUEUE: "asyncio.Queue[Tuple[Dict[str, Any], str]]" = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+# Última lectura aceptada: /api/last la devuelve mientras no haya datos
+# publicados (p. ej. en el arranque, antes de que termine de cargar pandas).
+LAST_ACCEPTED: Optional[Dict[str, Any]] = None
+# Sin appender (p. ej. la app montada sin lifespan) se aplica en línea.
+INGEST_APPENDER: Optional[asyncio.Task] = None
+
+# Reenvíos: claves recientes en memoria y todas en DATA_DIR/dedup.sqlite, rotando
+# entre dos generaciones de DEDUP_DISK_KEYS claves cada una.
+DEDUP_WINDOW = int(os.environ.get("DEDUP_WINDOW", "100000"))
+DEDUP_DISK_KEYS = int(os.environ.get("DEDUP_DISK_KEYS", "500000"))
+DEDUP_FILE = "dedup.sqlite"
+# Un `seq` que cae más de esto por debajo de la marca de agua no es un
+# reenvío (esos llegan pocas lecturas tarde): el contador se reinició.
+DEDUP_SEQ_RESET = int(os.environ.get("DEDUP_SEQ_RESET", "1000"))
+
+
+class IngestDedup:
+    """
+    Lecturas ya aceptadas, para reconocer los reenvíos de un controlador
+    que no recibió la respuesta. La clave es (dispositivo, clave de
+    idempotencia, timestamp) si el controlador la manda y si no (dispositivo,
+    timestamp). Un reenvío repite las dos cosas; un ESP32 que se reinició
+    vuelve a contar `seq` desde 0 pero con timestamps nuevos, así que sus
+    lecturas no chocan con las de antes del reinicio.
+
+    Las claves recientes viven en una ventana acotada en memoria; además se
+    guardan en DATA_DIR/dedup.sqlite (tabla indexada) después de cada lote
+    del appender, en un hilo. El disco sólo se consulta para una clave que no
+    está en la ventana y que no es más nueva que la última vista del
+    dispositivo (su marca de agua): una lectura nueva, el caso normal, se
+    resuelve en O(1) sin tocar el disco. La marca es el `seq` si es numérico
+    y si no el timestamp. Un `seq` muy por debajo de la marca
+    (DEDUP_SEQ_RESET) es un contador reiniciado: no se busca en disco y la
+    marca vuelve a empezar desde ahí.
+
+    En disco quedan dos generaciones de hasta DEDUP_DISK_KEYS claves: al
+    llenarse una se empieza otra y se borra la anterior a ella.
+    """
+
+    def __init__(self):
+        self._window: "OrderedDict[str, None]" = OrderedDict()
+        self._marks: Dict[str, float] = {}
+        self._pending = []
+        self._dirty_marks = set()
+        self._lock = threading.Lock()
+        # lecturas desde el loop y escrituras desde un hilo (WAL: no se bloquean)
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._opened = False
+        self._gen = 0
+        self._count = 0
+
+    @staticmethod
+    def _key(device_id: str, timestamp: str, idempotency: Optional[str]) -> str:
+        if idempotency is None:
+            return f"{device_id}\x1ft\x1f{timestamp}"
+        return f"{device_id}\x1fk\x1f{idempotency}\x1f{timestamp}"
+
+    @staticmethod
+    def _order(timestamp: str, idempotency: Optional[str]):
+        """
+        (tipo de marca, posición de la lectura): "k" y el `seq` si la clave es
+        un entero; si no "t" y el timestamp (posición None si no se entiende).
+        """
+        if idempotency is not None:
+            try:
+                return "k", float(int(idempotency))
+            except ValueError:
+                pass  # clave opaca (p. ej. un UUID): se ordena por timestamp
+        try:
+            return "t", datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError, OverflowError):
+            return "t", None
+
+    @staticmethod
+    def _newer(kind: str, order: Optional[float], mark: Optional[float]) -> bool:
+        """¿La lectura va después de la marca de agua (nueva, o un `seq` reiniciado)?"""
+        if order is None:
+            return False
+        if mark is None or order > mark:
+            return True
+        return kind == "k" and mark - order > DEDUP_SEQ_RESET
+
+    def open(self) -> None:
+        """Abre (o crea) la base y carga las marcas de agua. Al arrancar, en un hilo."""
+        with self._lock:
+            if self._opened:
+                return
+            self._opened = True
+            path = data_path(DEDUP_FILE)
+            if path is None:
+                return
+            writer = sqlite3.connect(path, check_same_thread=False)
+            writer.execute("PRAGMA journal_mode=WAL")
+            writer.execute("PRAGMA synchronous=NORMAL")
+            writer.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, gen INTEGER NOT NULL) WITHOUT ROWID")
+            writer.execute("CREATE INDEX IF NOT EXISTS keys_gen ON keys (gen)")
+            writer.execute("CREATE TABLE IF NOT EXISTS marks (mark TEXT PRIMARY KEY, value REAL NOT NULL)")
+            writer.commit()
+            self._gen = writer.execute("SELECT COALESCE(MAX(gen), 0) FROM keys").fetchone()[0]
+            self._count = writer.execute("SELECT COUNT(*) FROM keys WHERE gen = ?", (self._gen,)).fetchone()[0]
+            for mark, value in writer.execute("SELECT mark, value FROM marks"):
+                self._marks.setdefault(mark, value)
+            self._writer = writer
+            self._reader = sqlite3.connect(path, check_same_thread=False)
+            # las versiones anteriores guardaban las claves con dbm
+            shutil.rmtree(data_path("dedup"), ignore_errors=True)
+
+    def seen(self, device_id: str, timestamp: str, idempotency: Optional[str] = None) -> bool:
+        key = self._key(device_id, timestamp, idempotency)
+        if key in self._window:
+            self._window.move_to_end(key)
+            return True
+        self.open()
+        kind, order = self._order(timestamp, idempotency)
+        if self._newer(kind, order, self._marks.get(f"{device_id}\x1f{kind}")):
+            return False
+        if self._reader is None:
+            return False
+        return self._reader.execute("SELECT 1 FROM keys WHERE key = ?", (key,)).fetchone() is not None
+
+    def add(self, device_id: str, timestamp: str, idempotency: Optional[str] = None) -> str:
+        """Registra una lectura aceptada. Devuelve su clave (para forget)."""
+        key = self._key(device_id, timestamp, idempotency)
+        self._window[key] = None
+        if len(self._window) > DEDUP_WINDOW:
+            self._window.popitem(last=False)
+        kind, order = self._order(timestamp, idempotency)
+        with self._lock:
+            self._pending.append(key)
+            mark_key = f"{device_id}\x1f{kind}"
+            if self._newer(kind, order, self._marks.get(mark_key)):
+                self._marks[mark_key] = order
+                self._dirty_marks.add(mark_key)
+        return key
+
+    def forget(self, keys) -> None:
+        """Olvida claves de lecturas que al final no se agregaron (su reintento se acepta)."""
+        drop = set(keys)
+        for key in drop:
+            self._window.pop(key, None)
+        with self._lock:
+            self._pending = [k for k in self._pending if k not in drop]
+
+    def persist(self) -> None:
+        """Guarda en disco las claves y marcas de agua nuevas (se puede llamar en un hilo)."""
+        with self._lock:
+            if not self._pending and not self._dirty_marks:
+                return
+            pending, self._pending = self._pending, []
+            marks = [(k, self._marks[k]) for k in self._dirty_marks]
+            self._dirty_marks = set()
+            db = self._writer
+            if db is None:
+                return
+            if self._count + len(pending) > DEDUP_DISK_KEYS:
+                self._gen += 1
+                self._count = 0
+                db.execute("DELETE FROM keys WHERE gen < ?", (self._gen - 1,))
+            db.executemany("INSERT OR IGNORE INTO keys VALUES (?, ?)", [(k, self._gen) for k in pending])
+            db.executemany("INSERT OR REPLACE INTO marks VALUES (?, ?)", marks)
+            db.commit()
+            self._count += len(pending)
+
+    def close(self) -> None:
+        self.persist()
+        with self._lock:
+            for db in (self._reader, self._writer):
+                if db is not None:
+                    db.close()
+            self._reader = self._writer = None
+            self._opened = False
+
+
+DEDUP = IngestDedup()
+
+
+def apply_ingest_batch(batch, journal: bool = True) -> None:
+    """
+    Agrega un lote de lecturas a los datos y evalúa las alertas de cada una.
+    journal=False al reaplicar el journal después de un reinicio.
+    """
+    if not batch:
+        return
+    if journal:
+        JOURNAL.append(batch)
+    start = TIME_INDEX.n
+    with stage("concat"):
+        append_data(pd.DataFrame(batch), stream=True)
+    with stage("alerts"):
+        if TIME_INDEX.column is None:
+            local = [NAT_NS] * len(batch)
+        else:
+            local = TIME_INDEX.local_times(np.arange(start, TIME_INDEX.n))
+        for rec, t in zip(batch, local):
+            evaluate_alerts(rec, int(t))
+
+
+def flush_ingest_queue() -> int:
+    """Aplica todo lo pendiente en la cola (al apagar). Devuelve cuántas lecturas."""
+    items = []
+    while not INGEST_QUEUE.empty():
+        items.append(INGEST_QUEUE.get_nowait())
+    apply_queued(items)
+    return len(items)
+
+
+def apply_queued(items) -> None:
+    """Aplica lecturas de la cola; si el lote falla, sus reintentos no son reenvíos."""
+    try:
+        apply_ingest_batch([rec for rec, _ in items])
+    except Exception as e:
+        DEDUP.forget(key for _, key in items)
+        print(f"No se pudo agregar un lote de {len(items)} lecturas: {e}")
+
+
+async def _ingest_loop():
+    # el primer lote necesita pandas y el estado del checkpoint: ambos se
+    # cargan en un hilo, sin bloquear las peticiones que ya se aceptan
+    await asyncio.to_thread(pd._load)
+    await warm_restart()
+    while True:
+        items = [await INGEST_QUEUE.get()]
+        try:
+            if INGEST_QUEUE.qsize() < INGEST_BATCH_MAX - 1:
+                await asyncio.sleep(INGEST_FLUSH_MS / 1000.0)
+        finally:
+            while len(items) < INGEST_BATCH_MAX and not INGEST_QUEUE.empty():
+                items.append(INGEST_QUEUE.get_nowait())
+            apply_queued(items)
+        # las claves del lote van a disco en un hilo
+        await asyncio.to_thread(DEDUP.persist)
+
+
+def ingest_reading(rec: Dict[str, Any], payload_bytes: int, idempotency: Optional[str] = None) -> str:
+    """
+    Acepta una lectura ya validada: la registra en la salud del dispositivo,
+    descarta los reenvíos y la encola (o la aplica en línea sin appender).
+    Devuelve "ok", "duplicate" o "full" (cola llena, la lectura no se tomó).
+    """
+    global LAST_ACCEPTED
+    if rec.get("device_id") is None:
+        # firmware sin identificador: no se agrega la columna
+        rec.pop("device_id", None)
+    device_id = rec.get("device_id") or DEFAULT_DEVICE_ID
+    timestamp = rec.get("timestamp")
+    track_device(device_id, payload_bytes, timestamp)
+    if DEDUP.seen(device_id, timestamp, idempotency):
+        return "duplicate"
+    if INGEST_APPENDER is None or INGEST_APPENDER.done():
+        # en línea: la clave se registra sólo si la lectura se agregó
+        apply_ingest_batch([rec])
+        DEDUP.add(device_id, timestamp, idempotency)
+        DEDUP.persist()
+        return "ok"
+    if INGEST_QUEUE.full():
+        return "full"
+    # encolada: se registra ya (un reenvío puede llegar antes del lote) y
+    # apply_queued la olvida si el lote falla
+    INGEST_QUEUE.put_nowait((rec, DEDUP.add(device_id, timestamp, idempotency)))
+    LAST_ACCEPTED = rec
+    return "ok"
+
+
 @app.post("/api/ingreso")
-async def api_ingreso(lectura: Lectura):
+async def api_ingreso(lectura: Lectura, request: Request):
     """
     Endpoint que usará el ESP32 (vía SIM/GSM) para enviar cada registro de telemetría.
-    Los datos se guardan en memoria en LAST_DF para visualización inmediata.
+    La lectura se valida y se encola; el appender la agrega a los datos en
+    pocos milisegundos. Con la cola llena responde 429 con Retry-After.
+
+    Si la lectura trae `control_version`, la respuesta sirve también como
+    consulta del estado de control: incluye `controlVersion` y, si cambió,
+    `control` con los flags modificados desde esa versión, así el
+    controlador no necesita un GET /api/control_state aparte.
+
+    Un reenvío de una lectura ya aceptada (mismo dispositivo y timestamp, y
+    mismo `seq` o cabecera Idempotency-Key si los manda) se confirma con
+    "duplicate": true sin volver a agregarse.
     """
-    global LAST_DF
     rec = lectura.dict()
-    new_df = pd.DataFrame([rec])
-    if LAST_DF is None:
-        LAST_DF = new_df
-    else:
-        LAST_DF = pd.concat([LAST_DF, new_df], ignore_index=True)
-    return {"status": "ok"}
+    since = rec.pop("control_version")
+    seq = rec.pop("seq")
+    idempotency = request.headers.get("idempotency-key") or (None if seq is None else str(seq))
+    device_id = lectura.device_id or DEFAULT_DEVICE_ID
+    status = ingest_reading(rec, int(request.headers.get("content-length") or 0), idempotency)
+    if status == "full":
+        return JSONResponse(
+            {"detail": "Cola de ingreso llena, reintentar más tarde."},
+            status_code=429,
+            headers={"Retry-After": str(INGEST_RETRY_AFTER_S)},
+        )
+
+    response = {"status": "ok"}
+    if status == "duplicate":
+        response["duplicate"] = True
+    if since is None:
+        return response
+    response["controlVersion"] = CONTROL_VERSION
+    if since != CONTROL_VERSION:
+        response["control"] = control_diff(since)
+    note_control_poll(device_id)
+    return response
 
 
 @app.get("/api/last")
 async def api_last():
     """
-    Devuelve el último registro disponible según el DataFrame in-memory LAST_DF.
+    Devuelve el último registro disponible de la versión publicada.
+    Una lectura recién aceptada aparece después del próximo vaciado de la cola.
     """
-    global LAST_DF
-    if LAST_DF is None or LAST_DF.empty:
+    snap = SNAPSHOT
+    if snap is None or snap.n == 0:
+        if LAST_ACCEPTED is not None:
+            return LAST_ACCEPTED
         return JSONResponse({"detail": "No hay datos aún"}, status_code=404)
 
-    df = LAST_DF
-    last_row = df.iloc[-1]
-    datetime_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
-
-    record = {}
-    for c in df.columns:
-        val = last_row[c]
-        if pd.isna(val):
-            record[c] = None
-        elif c in datetime_cols:
-            record[c] = val.isoformat()
-        else:
-            record[c] = val.item() if hasattr(val, "item") else val
-
-    return record
+    return last_record(snap.last_row())
 
 
 @app.get("/api/control_state")
-async def get_control_state():
+async def get_control_state(device_id: Optional[str] = None):
     """
     Devuelve el estado actual de los flags de control remoto
     (pared, colgantes, bomba), que el ESP32 consultará periódicamente.
+    La versión va en la cabecera X-Control-Version; con `device_id` cuenta
+    como consulta de ese controlador (el dashboard no lo manda).
     """
-    return CONTROL_STATE
+    if device_id is not None:
+        note_control_poll(device_id)
+    return JSONResponse(CONTROL_STATE, headers={"X-Control-Version": str(CONTROL_VERSION)})
 
 
 @app.post("/api/control_state")
@@ -2208,9 +3484,886 @@ async def update_control_state(update: ControlUpdate):
     Actualiza parcialmente el estado de control remoto.
     Sólo los campos presentes en el body son modificados.
     """
+    global CONTROL_VERSION
     data = update.dict(exclude_unset=True)
-    for k, v in data.items():
-        if k in CONTROL_STATE and isinstance(v, bool):
-            CONTROL_STATE[k] = v
-    return CONTROL_STATE
+    changed = [k for k, v in data.items()
+               if k in CONTROL_STATE and isinstance(v, bool) and CONTROL_STATE[k] != v]
+    if changed:
+        CONTROL_VERSION += 1
+        for k in changed:
+            CONTROL_STATE[k] = data[k]
+            CONTROL_CHANGED[k] = CONTROL_VERSION
+        save_control_version()
+    return JSONResponse(CONTROL_STATE, headers={"X-Control-Version": str(CONTROL_VERSION)})
+
+
+# ===================== Ingreso por línea (UDP/TCP) =====================
+
+# Alternativa liviana a POST /api/ingreso para controladores en GSM: una
+# lectura por línea de texto, por UDP o TCP, con un token por dispositivo.
+#
+#     <device_id> <token> campo=valor campo=valor ...
+#
+# Los campos son los de `Lectura` (o sus alias cortos de LINE_ALIASES);
+# `seq=` sirve como clave de idempotencia y `cv=` es la versión de control
+# que tiene el controlador. Cada línea recibe una línea de respuesta:
+#
+#     ok | dup [cv=<versión> flag=0|1 ...]   aceptada / reenvío ya aceptado
+#     busy <segundos>                        cola llena, reintentar
+#     error <motivo> | denied                inválida / token incorrecto
+#
+# Las lecturas siguen el mismo camino que /api/ingreso (ingest_reading).
+# Se activa con LINE_UDP_PORT y/o LINE_TCP_PORT; los tokens van en
+# LINE_TOKENS="dispositivo:token,dispositivo:token".
+LINE_HOST = os.environ.get("LINE_HOST", "0.0.0.0")
+LINE_UDP_PORT = int(os.environ.get("LINE_UDP_PORT", "0"))
+LINE_TCP_PORT = int(os.environ.get("LINE_TCP_PORT", "0"))
+LINE_TOKENS: Dict[str, str] = dict(
+    item.split(":", 1) for item in os.environ.get("LINE_TOKENS", "").split(",") if ":" in item
+)
+LINE_MAX_BYTES = 4096
+
+LINE_ALIASES = {
+    "ts": "timestamp",
+    "dia": "dia_semana",
+    "modo": "modo_control",
+    "est": "estacion",
+    "t": "temp_invernadero_C",
+    "h": "hum_invernadero_rel",
+    "fr": "freq_ref_Hz",
+    "fc": "freq_cmd_Hz",
+    "cr": "colg_ref_unidades",
+    "nc": "n_colg_vent_on",
+    "rp": "relay_pared_on",
+    "rc1": "relay_colg_1_on",
+    "rc2": "relay_colg_2_on",
+    "vp": "vent_pared_on",
+    "vc": "vent_colg_on",
+    "vf": "vfd_freq_out_Hz",
+    "vv": "vfd_volt_out_V",
+    "vi": "vfd_curr_out_A",
+    "p": "pump_on",
+    "pa": "pump_auto_mode",
+}
+
+# Campos de `Lectura` que no son columnas.
+_LINE_META = ("device_id", "control_version", "seq")
+
 
+def _line_schema():
+    """(conversor por campo, campos obligatorios) según las anotaciones de `Lectura`."""
+    casters, required = {}, set()
+    for name, hint in get_type_hints(Lectura).items():
+        if name in _LINE_META:
+            continue
+        args = [a for a in getattr(hint, "__args__", ()) if a is not type(None)]
+        casters[name] = args[0] if args else hint
+        if not args:
+            required.add(name)
+    return casters, required
+
+
+LINE_CASTERS, LINE_REQUIRED = _line_schema()
+
+
+def parse_line(line: str):
+    """
+    Parsea una línea del protocolo. Devuelve (lectura, seq, cv); lanza
+    PermissionError si el token no corresponde y ValueError si es inválida.
+    """
+    parts = line.split()
+    if len(parts) < 3:
+        raise ValueError("faltan campos")
+    device_id, token = parts[0], parts[1]
+    expected = LINE_TOKENS.get(device_id)
+    if expected is None or not hmac.compare_digest(expected.encode(), token.encode()):
+        raise PermissionError(device_id)
+    rec: Dict[str, Any] = {"device_id": device_id}
+    seq = cv = None
+    for item in parts[2:]:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"campo sin valor: {key}")
+        key = LINE_ALIASES.get(key, key)
+        if key == "seq":
+            seq = value
+        elif key == "cv":
+            cv = int(value)
+        elif key in LINE_CASTERS:
+            rec[key] = LINE_CASTERS[key](value)
+        else:
+            raise ValueError(f"campo desconocido: {key}")
+    missing = LINE_REQUIRED - rec.keys()
+    if missing:
+        raise ValueError(f"faltan {','.join(sorted(missing))}")
+    return rec, seq, cv
+
+
+def handle_line(raw: bytes) -> bytes:
+    """Procesa una línea del protocolo y devuelve la línea de respuesta."""
+    try:
+        rec, seq, since = parse_line(raw.decode("utf-8"))
+    except PermissionError:
+        return b"denied\n"
+    except (UnicodeDecodeError, ValueError) as e:
+        return f"error {e}\n".encode("utf-8", "replace")
+    status = ingest_reading(rec, len(raw), seq)
+    if status == "full":
+        return f"busy {INGEST_RETRY_AFTER_S}\n".encode()
+    reply = ["dup" if status == "duplicate" else "ok"]
+    if since is not None:
+        reply.append(f"cv={CONTROL_VERSION}")
+        if since != CONTROL_VERSION:
+            reply.extend(f"{k}={int(v)}" for k, v in control_diff(since).items())
+        note_control_poll(rec["device_id"])
+    return (" ".join(reply) + "\n").encode()
+
+
+class LineDatagramProtocol(asyncio.DatagramProtocol):
+    """UDP: un datagrama puede traer varias líneas; se responde en uno solo."""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        replies = [handle_line(line) if len(line) <= LINE_MAX_BYTES else b"error linea demasiado larga\n"
+                   for line in data.splitlines() if line.strip()]
+        if replies:
+            self.transport.sendto(b"".join(replies), addr)
+
+
+async def _line_stream(reader, writer):
+    """TCP: líneas en secuencia sobre la misma conexión, una respuesta por línea."""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                writer.write(handle_line(line))
+            # sin esperar por cada línea: sólo si el cliente no está leyendo
+            if writer.transport.get_write_buffer_size() > 64 * 1024:
+                await writer.drain()
+    except (ConnectionError, ValueError):
+        pass  # conexión cortada o línea más larga que LINE_MAX_BYTES
+    finally:
+        writer.close()
+
+
+# Servidores activos (se cierran al apagar).
+LINE_SERVERS = []
+
+
+async def start_line_listeners() -> None:
+    if not (LINE_UDP_PORT or LINE_TCP_PORT):
+        return
+    if not LINE_TOKENS:
+        print("LINE_TOKENS vacío: no se inicia el ingreso por línea.")
+        return
+    loop = asyncio.get_running_loop()
+    if LINE_UDP_PORT:
+        transport, _ = await loop.create_datagram_endpoint(
+            LineDatagramProtocol, local_addr=(LINE_HOST, LINE_UDP_PORT))
+        LINE_SERVERS.append(transport)
+    if LINE_TCP_PORT:
+        server = await asyncio.start_server(_line_stream, LINE_HOST, LINE_TCP_PORT, limit=LINE_MAX_BYTES)
+        LINE_SERVERS.append(server)
+
+
+async def stop_line_listeners() -> None:
+    for server in LINE_SERVERS:
+        server.close()
+        if isinstance(server, asyncio.AbstractServer):
+            await server.wait_closed()
+    LINE_SERVERS.clear()
+
+
+# ===================== Importación desde carpeta =====================
+
+# Las exportaciones de la SD del ESP32 (CSV) y los Excel que se copien a
+# WATCH_DIR se importan solos: cada WATCH_POLL_S se revisa la carpeta y los
+# archivos nuevos o modificados se parsean en un pool de hilos (el parser
+# C de pandas libera el GIL) y se agregan en orden a los datos.
+#
+# Lo importado se recuerda en DATA_DIR/imports.json:
+#   - por archivo, hasta qué byte se leyó: de un CSV que crece sólo se leen
+#     las líneas completas nuevas; un hash del comienzo detecta si el
+#     archivo fue reemplazado por otro con el mismo nombre;
+#   - la huella del archivo leído hasta el final, para no volver a importar
+#     una copia con otro nombre.
+# El avance se guarda sólo después de un checkpoint, así un reinicio retoma
+# donde quedó sin perder ni repetir filas.
+WATCH_DIR = os.environ.get("WATCH_DIR", "")
+WATCH_POLL_S = float(os.environ.get("WATCH_POLL_S", "5"))
+WATCH_WORKERS = int(os.environ.get("WATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Tamaño de cada bloque de CSV que se parsea de una vez.
+WATCH_BLOCK_BYTES = int(os.environ.get("WATCH_BLOCK_MB", "32")) * 1024 * 1024
+# Cada cuántos bytes importados se hace un checkpoint en medio de un archivo.
+WATCH_CHECKPOINT_BYTES = 8 * WATCH_BLOCK_BYTES
+WATCH_STATE_FILE = "imports.json"
+WATCH_EXTENSIONS = {".csv": "csv", ".txt": "csv", ".xlsx": "excel", ".xls": "excel"}
+# Bytes del comienzo y del final que entran en la huella de un archivo.
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def file_fingerprint(path: str, size: int) -> str:
+    """Huella barata de un archivo: tamaño + primeros y últimos FINGERPRINT_BYTES."""
+    h = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as fh:
+        h.update(fh.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            fh.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            h.update(fh.read(FINGERPRINT_BYTES))
+    return h.hexdigest()
+
+
+def _head_hash(path: str, length: int) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read(length)).hexdigest()
+
+
+def _csv_separator(header: bytes) -> str:
+    return max([",", ";", "\t"], key=lambda sep: header.count(sep.encode()))
+
+
+def block_times(df, column: Optional[str], tz):
+    """Tiempos de `df` como los guarda un índice con esa columna y tz (None si no la tiene)."""
+    if column is None or column not in df.columns:
+        return None
+    return _times_ns(df, column, tz)
+
+
+def _parse_csv_block(path: str, header: bytes, start: int, end: int, sep: str, column, tz):
+    """
+    Filas del CSV entre los bytes [start, end) (líneas completas), con su
+    encabezado, sus tiempos para el índice y la huella del comienzo hasta `end`.
+    """
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    df = parse_datetime_columns(pd.read_csv(BytesIO(header + data), sep=sep))
+    return df, block_times(df, column, tz), _head_hash(path, min(FINGERPRINT_BYTES, end))
+
+
+def _parse_excel(path: str, column, tz):
+    df = parse_datetime_columns(pd.read_excel(path))
+    return df, block_times(df, column, tz)
+
+
+def _csv_blocks(path: str, start: int, size: int):
+    """
+    Rangos [inicio, fin) de a ~WATCH_BLOCK_BYTES desde `start`, cortados en
+    fin de línea. La última línea sin terminar (el logger sigue escribiendo)
+    queda afuera.
+    """
+    with open(path, "rb") as fh:
+        fh.seek(max(start, size - FINGERPRINT_BYTES))
+        tail = fh.read(size)
+        cut = tail.rfind(b"\n")
+        complete = size - len(tail) + cut + 1 if cut >= 0 else start
+        blocks = []
+        pos = start
+        while pos < complete:
+            end = min(pos + WATCH_BLOCK_BYTES, complete)
+            if end < complete:
+                fh.seek(end)
+                end = min(end + len(fh.readline()), complete)
+            blocks.append((pos, end))
+            pos = end
+    return blocks
+
+
+class FolderImporter:
+    """Estado del importador de WATCH_DIR (ver el comentario de la sección)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files: Dict[str, dict] = {}
+        self.errors: Dict[str, str] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending_bytes = 0
+        self._dirty = False
+
+    def load(self) -> None:
+        path = data_path(WATCH_STATE_FILE)
+        if path is None or not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as fh:
+                state = json.load(fh)
+            self.files = state.get("files", {})
+        except (OSError, ValueError) as e:
+            print(f"No se pudo leer el estado del importador: {e}")
+
+    def save(self) -> None:
+        path = data_path(WATCH_STATE_FILE)
+        if path is not None:
+            save_json_atomic(path, {"files": self.files})
+
+    async def commit(self) -> None:
+        """Checkpoint de los datos y después el avance (nunca al revés)."""
+        await refresh_derived()
+        await checkpoint()
+        self.save()
+        self._pending_bytes = 0
+        self._dirty = False
+
+    def imported(self, fingerprint: str) -> bool:
+        """¿Ya se importó completo un archivo con esta huella (con cualquier nombre)?"""
+        return any(e.get("fingerprint") == fingerprint for e in self.files.values())
+
+    def scan(self):
+        """Archivos de la carpeta que cambiaron desde la última vez: [(ruta, tipo, stat)]."""
+        changed = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                kind = WATCH_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+                if kind is None or filename.startswith((".", "~$")):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entry = self.files.get(path)
+                if entry is None or entry["size"] != st.st_size or entry["mtimeNs"] != st.st_mtime_ns:
+                    changed.append((path, kind, st))
+        return changed
+
+    async def run_once(self) -> int:
+        """Importa lo nuevo de la carpeta. Devuelve cuántas filas se agregaron."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=WATCH_WORKERS, thread_name_prefix="import")
+        rows = 0
+        for path, kind, st in await asyncio.to_thread(self.scan):
+            try:
+                if kind == "csv":
+                    rows += await self._import_csv(path, st)
+                else:
+                    rows += await self._import_excel(path, st)
+                self.errors.pop(path, None)
+            except Exception as e:
+                # se reintenta en la próxima vuelta si el archivo cambia
+                self.errors[path] = str(e)
+                print(f"No se pudo importar {path}: {e}")
+            # un solo recálculo de cortes y energía por archivo, fuera del loop
+            await refresh_derived()
+        if self._dirty:
+            await self.commit()
+        return rows
+
+    @staticmethod
+    def _append(df, times, column, tz) -> int:
+        """
+        Agrega las filas cuyo tiempo no está ya en los datos en vivo (lo
+        mismo que /upload en modo append). Devuelve cuántas se agregaron.
+        """
+        if times is None or TIME_INDEX.column != column or TIME_INDEX.tz != tz:
+            # el índice cambió mientras se parseaba: se calcula acá
+            df = drop_present_rows(df)
+            times = None
+        else:
+            present = present_times(times, TIME_INDEX)
+            if present is not None:
+                df, times = df[~present], times[~present]
+        if len(df):
+            append_data(df, defer=True, times=times)
+        return len(df)
+
+    def _entry(self, path: str, st, **fields) -> dict:
+        entry = self.files.setdefault(path, {"offset": 0, "rows": 0})
+        entry.update(size=st.st_size, mtimeNs=st.st_mtime_ns, **fields)
+        self._dirty = True
+        return entry
+
+    async def _import_csv(self, path: str, st) -> int:
+        loop = asyncio.get_running_loop()
+        size = st.st_size
+        entry = self.files.get(path)
+        if entry is not None and entry["offset"] and size >= entry["offset"]:
+            head_len = min(FINGERPRINT_BYTES, entry["offset"])
+            if await asyncio.to_thread(_head_hash, path, head_len) != entry["head"]:
+                entry = None  # mismo nombre, otro archivo
+        elif entry is not None and size < entry["offset"]:
+            entry = None  # se truncó: se lo trata como nuevo
+        if entry is None:
+            self.files.pop(path, None)
+            fingerprint = await asyncio.to_thread(file_fingerprint, path, size)
+            if self.imported(fingerprint):
+                self._entry(path, st, kind="csv", offset=size, fingerprint=fingerprint,
+                            head=await asyncio.to_thread(_head_hash, path, min(FINGERPRINT_BYTES, size)))
+                return 0
+
+        with open(path, "rb") as fh:
+            header = fh.readline()
+        if not header.endswith(b"\n"):
+            return 0  # todavía no hay ni una línea completa
+        offset = max(entry["offset"] if entry is not None else 0, len(header))
+        sep = _csv_separator(header)
+        blocks = await asyncio.to_thread(_csv_blocks, path, offset, size)
+        # todos los bloques se parsean en paralelo (con sus tiempos para el
+        # índice y su huella) y se agregan en orden
+        column, tz = TIME_INDEX.column, TIME_INDEX.tz
+        futures = [loop.run_in_executor(self._pool, _parse_csv_block, path, header, start, end, sep, column, tz)
+                   for start, end in blocks]
+        rows = 0
+        end = offset
+        head = None
+        try:
+            for (start, end), future in zip(blocks, futures):
+                df, times, head = await future
+                added = self._append(df, times, column, tz)
+                rows += added
+                entry = self._entry(path, st, kind="csv", offset=end, sep=sep, head=head)
+                entry["rows"] += added
+                self._pending_bytes += end - start
+                if self._pending_bytes >= WATCH_CHECKPOINT_BYTES:
+                    await self.commit()
+        finally:
+            for future in futures:
+                future.cancel()
+        fingerprint = await asyncio.to_thread(file_fingerprint, path, size) if end == size else None
+        if head is None:
+            head = await asyncio.to_thread(_head_hash, path, min(FINGERPRINT_BYTES, end))
+        self._entry(path, st, kind="csv", offset=end, sep=sep, fingerprint=fingerprint, head=head)
+        return rows
+
+    async def _import_excel(self, path: str, st) -> int:
+        loop = asyncio.get_running_loop()
+        fingerprint = await asyncio.to_thread(file_fingerprint, path, st.st_size)
+        if self.imported(fingerprint):
+            self._entry(path, st, kind="excel", fingerprint=fingerprint)
+            return 0
+        column, tz = TIME_INDEX.column, TIME_INDEX.tz
+        df, block = await loop.run_in_executor(self._pool, _parse_excel, path, column, tz)
+        entry = self.files.get(path) or {}
+        # un Excel que se volvió a guardar con más filas: sólo las posteriores
+        # a la última importada de ese archivo
+        time_col = find_time_column(df)
+        if entry.get("lastTime") and time_col is not None:
+            times = time_values(df, time_col)
+            last = pd.Timestamp(entry["lastTime"])
+            if times.dt.tz is not None and last.tzinfo is None:
+                last = last.tz_localize(times.dt.tz)
+            keep = (times > last).to_numpy()
+            df, block = df[keep], None if block is None else block[keep]
+        added = self._append(df, block, column, tz)
+        entry = self._entry(path, st, kind="excel", fingerprint=fingerprint)
+        entry["rows"] += added
+        if time_col is not None and len(df):
+            last_time = time_values(df, time_col).max()
+            if not pd.isna(last_time):
+                entry["lastTime"] = last_time.isoformat()
+        return added
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def to_json(self) -> dict:
+        return {
+            "watchDir": self.root,
+            "files": [{"path": p, "kind": e.get("kind"), "bytes": e["size"],
+                       "importedBytes": e["offset"] if e.get("kind") == "csv" else None,
+                       "rows": e["rows"], "error": self.errors.get(p)}
+                      for p, e in sorted(self.files.items())],
+            "errors": {p: msg for p, msg in self.errors.items() if p not in self.files},
+        }
+
+
+IMPORTER = FolderImporter(WATCH_DIR) if WATCH_DIR else None
+
+
+async def _watch_loop():
+    # espera a que se retome el checkpoint: lo importado va sobre esos datos
+    await wait_restored()
+    IMPORTER.load()
+    while True:
+        try:
+            await IMPORTER.run_once()
+        except Exception as e:
+            print(f"Error en el importador de {WATCH_DIR}: {e}")
+        await asyncio.sleep(WATCH_POLL_S)
+
+
+@app.get("/api/imports")
+async def api_imports():
+    """Estado del importador de la carpeta vigilada (WATCH_DIR)."""
+    if IMPORTER is None:
+        return JSONResponse({"detail": "No hay carpeta vigilada (WATCH_DIR)."}, status_code=404)
+    return IMPORTER.to_json()
+
+
+# ===================== Diagnóstico =====================
+
+@app.get("/api/datasets")
+async def api_datasets():
+    """Conjuntos de datos (los en vivo primero), cuáles están en memoria y el presupuesto."""
+    return DATASETS.to_json()
+
+
+@app.delete("/api/datasets/{name}")
+async def delete_dataset(name: str):
+    if name == LIVE_DATASET:
+        return JSONResponse({"detail": "Los datos en vivo no se pueden borrar."}, status_code=400)
+    if not DATASETS.delete(name):
+        return JSONResponse({"detail": f"Conjunto de datos desconocido: {name}"}, status_code=404)
+    return {"status": "ok", "deleted": name}
+
+
+@app.get("/debug/slow")
+async def debug_slow(limit: int = Query(50, ge=1, le=1000)):
+    """
+    Devuelve las peticiones más recientes que superaron SLOW_REQUEST_MS,
+    con el desglose de etapas medido en cada una (la más reciente primero).
+    """
+    entries = list(SLOW_LOG)[-limit:]
+    entries.reverse()
+    return {
+        "threshold_ms": SLOW_REQUEST_MS,
+        "capacity": SLOW_LOG.maxlen,
+        "entries": entries,
+    }
+
+
+# ===================== Checkpoint =====================
+
+# Los bloques de datos y el estado derivado (índice temporal, cortes,
+# energía, dispositivos) se guardan en DATA_DIR/checkpoint cada
+# CHECKPOINT_INTERVAL_S, después de cada subida y al apagar. Las lecturas
+# posteriores quedan en el journal. Al arrancar se carga el checkpoint (los
+# arreglos del índice con mmap) y se reaplica sólo el journal, así el tiempo
+# de reinicio no depende del largo de la historia.
+CHECKPOINT_DIR = "checkpoint"
+CHECKPOINT_FORMAT = 1
+CHECKPOINT_INTERVAL_S = float(os.environ.get("CHECKPOINT_INTERVAL_S", "300"))
+JOURNAL_FILE = "journal.jsonl"
+
+
+class Journal:
+    """
+    Lotes de lecturas ingresados desde el último checkpoint: una línea JSON
+    por lote, con número de secuencia. El checkpoint guarda la última
+    secuencia que incluye; al arrancar se reaplican sólo las posteriores.
+
+    Mientras se escribe un checkpoint los lotes siguen llegando: el archivo
+    actual se aparta como journal.jsonl.<secuencia> y se borra recién cuando
+    el checkpoint que lo cubre quedó en disco.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self._fh = None
+
+    def append(self, rows) -> None:
+        path = data_path(JOURNAL_FILE)
+        if path is None:
+            return
+        if self._fh is None:
+            self._fh = open(path, "a", encoding="utf-8")
+        self.seq += 1
+        self._fh.write(json.dumps({"seq": self.seq, "rows": rows}, ensure_ascii=False, default=str) + "\n")
+        self._fh.flush()
+
+    def _rotated(self):
+        """Archivos apartados por rotate(): [(secuencia, ruta)] en orden."""
+        path = data_path(JOURNAL_FILE)
+        if path is None:
+            return []
+        folder, base = os.path.split(path)
+        out = []
+        for name in os.listdir(folder):
+            suffix = name[len(base) + 1:]
+            if name.startswith(base + ".") and suffix.isdigit():
+                out.append((int(suffix), os.path.join(folder, name)))
+        return sorted(out)
+
+    def read_after(self, seq: int):
+        """Lotes con secuencia mayor a `seq`, en orden."""
+        path = data_path(JOURNAL_FILE)
+        batches = []
+        if path is None:
+            return batches
+        paths = [p for _, p in self._rotated()] + ([path] if os.path.exists(path) else [])
+        for p in paths:
+            with open(p, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # última línea cortada por un apagado brusco
+                    self.seq = max(self.seq, entry["seq"])
+                    if entry["seq"] > seq:
+                        batches.append(entry["rows"])
+        return batches
+
+    def rotate(self) -> int:
+        """Aparta el archivo actual (los lotes siguientes van a uno nuevo). Devuelve la secuencia."""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        path = data_path(JOURNAL_FILE)
+        if path is not None and os.path.exists(path):
+            os.replace(path, f"{path}.{self.seq}")
+        return self.seq
+
+    def discard(self, seq: int) -> None:
+        """Borra los archivos apartados hasta la secuencia `seq` (ya están en un checkpoint)."""
+        for last, path in self._rotated():
+            if last <= seq:
+                os.remove(path)
+
+
+JOURNAL = Journal()
+
+# Bloque ya guardado → nombre de archivo (id del bloque → (bloque, nombre)).
+_CHUNK_FILES: Dict[int, Any] = {}
+# Versión de los datos del último checkpoint; None hasta retomar el anterior
+# (antes de eso no se escribe, para no pisarlo con un estado vacío).
+_CHECKPOINT_VERSION: Optional[int] = None
+# Se marca al terminar warm_restart: las subidas y el importador esperan a
+# que se retomen los datos anteriores. Un checkpoint a la vez (captura y
+# escritura juntas). Ambos se crean en on_startup, en el loop del servidor.
+RESTORED: Optional[asyncio.Event] = None
+_CHECKPOINT_LOCK: Optional[asyncio.Lock] = None
+
+
+async def wait_restored() -> None:
+    """Espera a que warm_restart retome checkpoint y journal (sin servidor, no espera)."""
+    if RESTORED is not None:
+        await RESTORED.wait()
+
+
+def _replace_with(path: str, write) -> None:
+    """Escribe con `write(tmp)` y renombra, para no dejar archivos a medias."""
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def checkpoint_state() -> Optional[dict]:
+    """
+    Lo que va al checkpoint, tomado en el loop de una vez (None si no hay
+    cambios). Los bloques son inmutables y los arreglos del índice sólo
+    crecen al final: el hilo que escribe ve este estado aunque sigan
+    llegando lecturas.
+    """
+    root = data_path(CHECKPOINT_DIR)
+    if root is None or _CHECKPOINT_VERSION is None or _CHECKPOINT_VERSION == DATA_VERSION:
+        return None
+    snap = SNAPSHOT
+    return {
+        "root": root,
+        "snap": snap,
+        "arrays": {} if snap is None else TIME_INDEX.arrays(),
+        "manifest": {
+            "format": CHECKPOINT_FORMAT,
+            "version": DATA_VERSION,
+            "rows": 0 if snap is None else snap.n,
+            "journalSeq": JOURNAL.rotate(),
+            "timeIndex": TIME_INDEX.state(),
+            "gaps": GAPS.to_json(),
+            "energy": ENERGY.to_json(),
+            "derivedStale": DERIVED_STALE,
+            "devices": [stats.state() for stats in DEVICES.values()],
+        },
+    }
+
+
+def write_checkpoint(state: dict) -> None:
+    """Escribe lo capturado por checkpoint_state (se llama en un hilo)."""
+    global _CHECKPOINT_VERSION
+    root = state["root"]
+    snap = state["snap"]
+    os.makedirs(root, exist_ok=True)
+    names = []
+    if snap is not None:
+        # los bloques son inmutables: sólo se escriben los nuevos
+        for i, chunk in enumerate(snap.chunks):
+            known = _CHUNK_FILES.get(id(chunk))
+            if known is None or known[0] is not chunk:
+                name = f"chunk-{snap.version}-{i}.pkl"
+                _replace_with(os.path.join(root, name), chunk.to_pickle)
+                known = _CHUNK_FILES[id(chunk)] = (chunk, name)
+            names.append(known[1])
+        for key, values in state["arrays"].items():
+            def write_array(tmp, values=values):
+                with open(tmp, "wb") as fh:
+                    np.save(fh, values)
+            _replace_with(os.path.join(root, f"{key}.npy"), write_array)
+
+    manifest = state["manifest"]
+    save_json_atomic(os.path.join(root, "manifest.json"), dict(manifest, chunks=names))
+    JOURNAL.discard(manifest["journalSeq"])
+
+    keep = set(names)
+    for key, (chunk, name) in list(_CHUNK_FILES.items()):
+        if name not in keep:
+            del _CHUNK_FILES[key]
+    for name in os.listdir(root):
+        if name.startswith("chunk-") and name not in keep:
+            os.remove(os.path.join(root, name))
+    _CHECKPOINT_VERSION = manifest["version"]
+
+
+async def checkpoint() -> bool:
+    """Guarda el checkpoint si los datos cambiaron desde el último, sin bloquear el loop."""
+    global _CHECKPOINT_LOCK
+    if _CHECKPOINT_LOCK is None:
+        _CHECKPOINT_LOCK = asyncio.Lock()
+    async with _CHECKPOINT_LOCK:
+        state = checkpoint_state()
+        if state is None:
+            return False
+        write = asyncio.ensure_future(asyncio.to_thread(write_checkpoint, state))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # el hilo sigue escribiendo: se lo espera antes de soltar el lock
+            await write
+            raise
+        return True
+
+
+def read_checkpoint() -> Optional[dict]:
+    """Lee el checkpoint de disco (se llama en un hilo). None si no hay uno válido."""
+    root = data_path(CHECKPOINT_DIR)
+    if root is None or not os.path.exists(os.path.join(root, "manifest.json")):
+        return None
+    with open(os.path.join(root, "manifest.json"), encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("format") != CHECKPOINT_FORMAT:
+        print(f"Checkpoint con formato {manifest.get('format')} ignorado (se espera {CHECKPOINT_FORMAT}).")
+        return None
+    chunks = [pd.read_pickle(os.path.join(root, name)) for name in manifest["chunks"]]
+    arrays = {}
+    if chunks:
+        arrays = {key: np.load(os.path.join(root, f"{key}.npy"), mmap_mode="c")
+                  for key in ("times", "minutes", "days")}
+    return {"manifest": manifest, "chunks": chunks, "arrays": arrays}
+
+
+def discard_checkpoint() -> None:
+    """Aparta un checkpoint que no se pudo leer (queda para revisarlo a mano)."""
+    root = data_path(CHECKPOINT_DIR)
+    if root is None or not os.path.exists(root):
+        return
+    bad = f"{root}.bad-{datetime.now():%Y%m%d-%H%M%S}"
+    try:
+        os.replace(root, bad)
+        print(f"Checkpoint apartado en {bad}")
+    except OSError as e:
+        print(f"No se pudo apartar el checkpoint: {e}")
+
+
+def restore_checkpoint(state: dict) -> int:
+    """Publica el estado leído por read_checkpoint. Devuelve su secuencia del journal."""
+    manifest = state["manifest"]
+    chunks = state["chunks"]
+    if chunks:
+        snap = DataSnapshot(manifest["version"], chunks)
+        index = manifest["timeIndex"]
+        if index["greenhouseTz"] == GREENHOUSE_TZ and all(len(a) == snap.n for a in state["arrays"].values()):
+            TIME_INDEX.restore(index, state["arrays"])
+            if manifest.get("derivedStale"):
+                # guardado en medio de una importación: cortes y energía atrasados
+                rebuild_derived(snap)
+            else:
+                GAPS.load_json(manifest["gaps"])
+                ENERGY.load_json(manifest["energy"])
+        else:
+            # cambió la zona horaria (o los arreglos no coinciden): se recalcula
+            rebuild_time_index(snap)
+            rebuild_derived(snap)
+        for chunk, name in zip(chunks, manifest["chunks"]):
+            _CHUNK_FILES[id(chunk)] = (chunk, name)
+        _publish(snap)
+    for data in manifest["devices"]:
+        DEVICES.setdefault(data["device_id"], DeviceStats.from_state(data))
+    JOURNAL.seq = max(JOURNAL.seq, manifest["journalSeq"])
+    return manifest["journalSeq"]
+
+
+async def warm_restart() -> None:
+    """Retoma checkpoint + journal al arrancar (antes del primer lote nuevo)."""
+    global _CHECKPOINT_VERSION
+    seq = 0
+    try:
+        if SNAPSHOT is None:
+            try:
+                state = await asyncio.to_thread(read_checkpoint)
+                if state is not None:
+                    seq = restore_checkpoint(state)
+            except Exception as e:
+                # cortado o de otro formato (pickle, numpy, manifest): se aparta
+                # y se sigue sin él, con lo que haya en el journal
+                print(f"No se pudo retomar el checkpoint: {e!r}")
+                seq = 0
+                _CHUNK_FILES.clear()
+                replace_data(None)
+                discard_checkpoint()
+        _CHECKPOINT_VERSION = DATA_VERSION
+        for batch in JOURNAL.read_after(seq):
+            try:
+                apply_ingest_batch(batch, journal=False)
+            except Exception as e:
+                print(f"No se pudo reaplicar un lote del journal: {e}")
+    finally:
+        if RESTORED is not None:
+            RESTORED.set()
+    # si se reaplicó algo, queda en un checkpoint nuevo y el journal se vacía
+    try:
+        await checkpoint()
+    except OSError as e:
+        print(f"No se pudo guardar el checkpoint: {e}")
+
+
+async def _checkpoint_loop():
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL_S)
+        try:
+            await checkpoint()
+        except OSError as e:
+            print(f"No se pudo guardar el checkpoint: {e}")
+
+
+# ===================== Ciclo de vida =====================
+
+_BACKGROUND_TASKS = []
+
+
+async def on_startup():
+    global INGEST_APPENDER, RESTORED, _CHECKPOINT_LOCK
+    RESTORED = asyncio.Event()
+    _CHECKPOINT_LOCK = asyncio.Lock()
+    load_control_version()
+    await asyncio.to_thread(DEDUP.open)
+    DATASETS.load()
+    _BACKGROUND_TASKS.append(asyncio.create_task(_checkpoint_loop()))
+    # los recursos se comprimen en segundo plano; el primer GET / espera si hace falta
+    _BACKGROUND_TASKS.append(asyncio.create_task(asyncio.to_thread(ASSETS.load)))
+    INGEST_APPENDER = asyncio.create_task(_ingest_loop())
+    _BACKGROUND_TASKS.append(INGEST_APPENDER)
+    await start_line_listeners()
+    if IMPORTER is not None:
+        _BACKGROUND_TASKS.append(asyncio.create_task(_watch_loop()))
+
+
+async def on_shutdown():
+    global INGEST_APPENDER
+    await stop_line_listeners()
+    for task in _BACKGROUND_TASKS:
+        task.cancel()
+    await asyncio.gather(*_BACKGROUND_TASKS, return_exceptions=True)
+    _BACKGROUND_TASKS.clear()
+    INGEST_APPENDER = None
+    if IMPORTER is not None:
+        IMPORTER.shutdown()
+    # lo que quedó en la cola se aplica antes de guardar
+    flush_ingest_queue()
+    DEDUP.close()
+    try:
+        await checkpoint()
+    except OSError as e:
+        print(f"No se pudo guardar el checkpoint: {e}")
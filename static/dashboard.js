@@ -0,0 +1,1363 @@
+let globalData = null;
+let globalChart = null;
+let globalChartWide = null;
+let currentFilter = "all";
+// Conjunto que se está viendo: "live" (datos del ESP32) o uno subido con
+// nombre. Se elige con ?dataset= en la URL o con el selector del encabezado.
+let currentDataset = new URLSearchParams(location.search).get("dataset") || "live";
+
+function setDatasetInfo(text) {
+  document.getElementById("datasetInfo").textContent = text;
+}
+
+function withDataset(url) {
+  if (currentDataset === "live") return url;
+  return url + (url.includes("?") ? "&" : "?") + "dataset=" + encodeURIComponent(currentDataset);
+}
+
+async function loadDatasets() {
+  const select = document.getElementById("datasetSelect");
+  if (!select) return;
+  try {
+    const resp = await fetch("/api/datasets");
+    if (!resp.ok) return;
+    const datasets = (await resp.json()).datasets || [];
+    select.innerHTML = "";
+    datasets.forEach(d => {
+      const opt = document.createElement("option");
+      opt.value = d.name;
+      opt.textContent = d.live ? "En vivo" : d.name;
+      select.appendChild(opt);
+    });
+    if (!datasets.some(d => d.name === currentDataset)) {
+      await selectDataset("live");
+    }
+    select.value = currentDataset;
+  } catch (err) {
+    console.error(err);
+  }
+}
+
+function selectDataset(name) {
+  currentDataset = name || "live";
+  const url = new URL(location.href);
+  if (currentDataset === "live") url.searchParams.delete("dataset");
+  else url.searchParams.set("dataset", currentDataset);
+  history.replaceState(null, "", url);
+  const select = document.getElementById("datasetSelect");
+  if (select) select.value = currentDataset;
+  return loadData();
+}
+
+function setEmptyState(visible) {
+  const empty = document.getElementById("emptyState");
+  const meta = document.getElementById("chartMeta");
+  if (empty) empty.style.display = visible ? "block" : "none";
+  if (meta) meta.style.display = visible ? "none" : "flex";
+  // Los controles del laboratorio de gráficos permanecen visibles siempre,
+  // aunque no haya datos todavía.
+}
+
+function accentChip(el, on) {
+  if (!el) return;
+  if (on) el.classList.add("active"); else el.classList.remove("active");
+}
+
+function applyFilterButtons() {
+  accentChip(document.getElementById("fltAll"), currentFilter === "all");
+  accentChip(document.getElementById("fltDay"), currentFilter === "day");
+  accentChip(document.getElementById("fltNight"), currentFilter === "night");
+}
+
+async function uploadFile() {
+  const input = document.getElementById("fileInput");
+  const mode = document.getElementById("uploadMode").value || "replace";
+  const target = (document.getElementById("uploadDataset")?.value || "").trim() || "live";
+  if (!input.files || !input.files.length) {
+    alert("Selecciona un archivo Excel primero.");
+    return;
+  }
+  const formData = new FormData();
+  formData.append("file", input.files[0]);
+  setDatasetInfo("Subiendo archivo...");
+  try {
+    let url = "/upload?mode=" + encodeURIComponent(mode);
+    if (target !== "live") url += "&dataset=" + encodeURIComponent(target);
+    const resp = await fetch(url, {
+      method: "POST",
+      body: formData
+    });
+    if (!resp.ok) {
+      const txt = await resp.text();
+      alert("Error al subir el archivo: " + txt);
+      setDatasetInfo("Error en subida");
+      return;
+    }
+    const json = await resp.json();
+    const skipped = json.skipped ? ` (${json.skipped} ya estaban cargadas)` : "";
+    setDatasetInfo(`Archivo: ${json.filename} · ${json.rows} filas, ${json.columns.length} columnas${skipped}`);
+    await loadDatasets();
+    await selectDataset(json.dataset);
+  } catch (err) {
+    console.error(err);
+    alert("Error de red al subir el archivo.");
+    setDatasetInfo("Error de red");
+  }
+}
+
+// Esquemas por versión: /api/schema?v=... es inmutable y el navegador
+// también lo cachea, así que sólo se descarga cuando cambian las columnas.
+const schemaCache = {};
+
+async function fetchSchema(version) {
+  if (!schemaCache[version]) {
+    const resp = await fetch(`/api/schema?v=${encodeURIComponent(version)}`);
+    if (!resp.ok) throw new Error("No se pudo obtener el esquema");
+    schemaCache[version] = await resp.json();
+  }
+  return schemaCache[version];
+}
+
+// Las tarjetas de estado sólo miran el último día de lecturas.
+const STATUS_WINDOW_HOURS = 24;
+
+async function loadData() {
+  // El esquema alcanza para armar los controles, el gráfico (/api/series.bin)
+  // y la tabla (/api/table, por páginas): no se descarga la historia.
+  try {
+    const resp = await fetch(withDataset("/api/schema"));
+    if (!resp.ok) {
+      globalData = null;
+      setEmptyState(true);
+      renderTable();
+      return;
+    }
+    const schema = await resp.json();
+    schemaCache[schema.schemaVersion] = schema;
+    globalData = Object.assign({ rows: [] }, schema);
+    initControls();
+    updateChart();
+    renderTable();
+    renderFieldsDictionary();
+    setEmptyState(false);
+    await loadRecentRows();
+  } catch (err) {
+    console.error(err);
+    setEmptyState(true);
+  }
+}
+
+async function loadRecentRows() {
+  const resp = await fetch(withDataset(`/api/data?hours=${STATUS_WINDOW_HOURS}`));
+  if (!resp.ok || !globalData) return;
+  const json = await resp.json();
+  const isDay = json.isDay || [];
+  json.rows.forEach((r, i) => { r.__isDay = isDay[i]; });
+  globalData.rows = json.rows;
+  updateStatusFromData();
+  updateGsmStatusFromData();
+}
+
+function findPreferredColumn(candidates, inList) {
+  for (const c of candidates) {
+    if (inList.includes(c)) return c;
+  }
+  return inList[0] || null;
+}
+
+function initControls() {
+  if (!globalData) return;
+  const numericCols = globalData.numericColumns || [];
+  const timeCols = globalData.datetimeColumns || [];
+  const labels = globalData.fieldFriendlyLabels || {};
+
+  const selectY1 = document.getElementById("selectY1");
+  const selectY2 = document.getElementById("selectY2");
+  const selectTime = document.getElementById("selectTime");
+
+  if (!selectY1 || !selectY2 || !selectTime) return;
+
+  selectY1.innerHTML = "";
+  selectY2.innerHTML = '<option value="">(sin eje secundario)</option>';
+  selectTime.innerHTML = "";
+
+  numericCols.forEach(col => {
+    const label = labels[col] || col;
+    const opt1 = document.createElement("option");
+    opt1.value = col;
+    opt1.textContent = label;
+    selectY1.appendChild(opt1);
+
+    const opt2 = document.createElement("option");
+    opt2.value = col;
+    opt2.textContent = label;
+    selectY2.appendChild(opt2);
+  });
+
+  timeCols.forEach(col => {
+    const label = labels[col] || col;
+    const opt = document.createElement("option");
+    opt.value = col;
+    opt.textContent = label;
+    selectTime.appendChild(opt);
+  });
+
+  const preferredY1 = findPreferredColumn(
+    ["temp_invernadero_C", "tempC", "temperatura"],
+    numericCols
+  );
+  const preferredY2 = findPreferredColumn(
+    ["vfd_freq_out_Hz", "freq_cmd_Hz", "freq_ref_Hz"],
+    numericCols
+  );
+  const preferredTime = findPreferredColumn(
+    ["timestamp", "FechaHora", "fecha_hora"],
+    timeCols
+  );
+
+  if (preferredY1) selectY1.value = preferredY1;
+  if (preferredY2) selectY2.value = preferredY2;
+  if (preferredTime) selectTime.value = preferredTime;
+
+  document.getElementById("fromDate").value = "";
+  document.getElementById("toDate").value = "";
+}
+
+function parseDateFromRow(row, timeCol) {
+  if (!timeCol || !row[timeCol]) return null;
+  const d = new Date(row[timeCol]);
+  if (isNaN(d.getTime())) return null;
+  return d;
+}
+
+function filterRows() {
+  if (!globalData) return [];
+  const rows = globalData.rows || [];
+  const timeCol = document.getElementById("selectTime").value;
+
+  const fromStr = document.getElementById("fromDate").value;
+  const toStr = document.getElementById("toDate").value;
+  const fromDate = fromStr ? new Date(fromStr) : null;
+  const toDate = toStr ? new Date(toStr) : null;
+
+  return rows.filter(row => {
+    const d = parseDateFromRow(row, timeCol);
+    if (d) {
+      if (fromDate && d < fromDate) return false;
+      if (toDate && d > toDate) return false;
+    }
+    if (currentFilter === "day" || currentFilter === "night") {
+      // día/noche viene precalculado por el servidor (zona horaria y
+      // ventana diurna del invernadero), no según el reloj del navegador
+      const isDay = row.__isDay;
+      if (isDay === null || isDay === undefined) return false;
+      if (currentFilter === "day" && !isDay) return false;
+      if (currentFilter === "night" && isDay) return false;
+    }
+    return true;
+  });
+}
+
+function formatForDateTimeLocal(d) {
+  if (!d) return "";
+  const pad = (n) => String(n).padStart(2, "0");
+  const yyyy = d.getFullYear();
+  const MM = pad(d.getMonth() + 1);
+  const dd = pad(d.getDate());
+  const hh = pad(d.getHours());
+  const mm = pad(d.getMinutes());
+  return `${yyyy}-${MM}-${dd}T${hh}:${mm}`;
+}
+
+function applyRangePreset(preset) {
+  const fromInput = document.getElementById("fromDate");
+  const toInput = document.getElementById("toDate");
+  if (preset === "all") {
+    // sin límites: toda la historia, que el navegador no tiene descargada
+    if (fromInput) fromInput.value = "";
+    if (toInput) toInput.value = "";
+    return;
+  }
+  const selectTime = document.getElementById("selectTime");
+  const timeCol = selectTime ? selectTime.value : null;
+  if (!globalData || !globalData.rows || !globalData.rows.length || !timeCol) return;
+
+  const rows = globalData.rows || [];
+  const times = rows
+    .map(r => parseDateFromRow(r, timeCol))
+    .filter(d => d !== null)
+    .sort((a, b) => a - b);
+
+  if (!times.length) return;
+  const last = times[times.length - 1];
+  let from;
+
+  if (preset === "last_day") {
+    from = new Date(last.getTime() - 24 * 60 * 60 * 1000);
+  } else if (preset === "last_7") {
+    from = new Date(last.getTime() - 7 * 24 * 60 * 60 * 1000);
+  } else if (preset === "last_30") {
+    from = new Date(last.getTime() - 30 * 24 * 60 * 60 * 1000);
+  } else {
+    return;
+  }
+
+  if (fromInput) fromInput.value = formatForDateTimeLocal(from);
+  if (toInput) toInput.value = formatForDateTimeLocal(last);
+}
+
+
+
+function exportXlsx() {
+  // El archivo se genera en el servidor en streaming; el navegador sólo
+  // descarga el resultado del rango y la vista seleccionados.
+  if (!globalData) {
+    alert("No hay datos para exportar.");
+    return;
+  }
+  const format = document.getElementById("exportFormat")?.value || "xlsx";
+  const params = new URLSearchParams({ format });
+  const fromStr = document.getElementById("fromDate").value;
+  const toStr = document.getElementById("toDate").value;
+  if (fromStr) params.set("from", fromStr);
+  if (toStr) params.set("to", toStr);
+  if (currentFilter === "day" || currentFilter === "night") params.set("filter", currentFilter);
+  const cols = globalData.columns || [];
+  if (cols.length) params.set("columns", cols.join(","));
+
+  const link = document.createElement("a");
+  link.href = withDataset("/api/export?" + params.toString());
+  link.download = "invernadero_export." + format;
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+}
+
+async function fetchSeriesBinary(columns) {
+  // /api/series.bin: "SER1" | uint32 largo del encabezado | encabezado JSON
+  // | buffers float64 little-endian (tiempo en epoch-ms y cada columna).
+  // Los buffers se usan tal cual como Float64Array, sin parsear texto.
+  const params = new URLSearchParams();
+  params.set("columns", columns.join(","));
+  const fromStr = document.getElementById("fromDate").value;
+  const toStr = document.getElementById("toDate").value;
+  if (fromStr) params.set("from", fromStr);
+  if (toStr) params.set("to", toStr);
+  if (currentFilter === "day" || currentFilter === "night") params.set("filter", currentFilter);
+
+  const resp = await fetch(withDataset("/api/series.bin?" + params.toString()));
+  if (!resp.ok) return null;
+  const buf = await resp.arrayBuffer();
+  const view = new DataView(buf);
+  const headerLen = view.getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, headerLen)));
+  const n = header.n;
+  let offset = 8 + headerLen;
+  const time = new Float64Array(buf, offset, n);
+  offset += n * 8;
+  const series = {};
+  header.columns.forEach(c => {
+    series[c] = new Float64Array(buf, offset, n);
+    offset += n * 8;
+  });
+  return { header, time, series };
+}
+
+function seriesPoints(time, values) {
+  // Chart.js con parsing: false toma {x, y} tal cual; NaN corta la línea
+  const points = new Array(time.length);
+  for (let i = 0; i < time.length; i++) {
+    points[i] = { x: time[i], y: values[i] };
+  }
+  return points;
+}
+
+function buildDatasets(data, y1, y2, labelsDict) {
+  const datasets = [];
+  if (y1) {
+    datasets.push({
+      label: labelsDict[y1] || y1,
+      data: seriesPoints(data.time, data.series[y1]),
+      borderColor: "rgba(56,189,248,0.9)",
+      backgroundColor: "rgba(56,189,248,0.2)",
+      borderWidth: 2,
+      tension: 0.25,
+      yAxisID: "y1",
+      pointRadius: 0
+    });
+  }
+  if (y2) {
+    datasets.push({
+      label: labelsDict[y2] || y2,
+      data: seriesPoints(data.time, data.series[y2]),
+      borderColor: "rgba(168,85,247,0.9)",
+      backgroundColor: "rgba(168,85,247,0.18)",
+      borderWidth: 2,
+      tension: 0.25,
+      yAxisID: "y2",
+      pointRadius: 0
+    });
+  }
+  return datasets;
+}
+
+let chartRequestSeq = 0;
+
+async function updateChart() {
+  if (!globalData) return;
+
+  const y1 = document.getElementById("selectY1")?.value;
+  const y2 = document.getElementById("selectY2")?.value;
+  const labelsDict = globalData.fieldFriendlyLabels || {};
+  const columns = [y1, y2].filter(Boolean);
+
+  // sólo se dibuja la respuesta del último pedido
+  const seq = ++chartRequestSeq;
+  let data = null;
+  if (columns.length) {
+    try {
+      data = await fetchSeriesBinary(columns);
+    } catch (e) {
+      console.error("Error cargando series:", e);
+    }
+  }
+  if (seq !== chartRequestSeq) return;
+  if (!data) {
+    data = { header: { n: 0, breaks: [], timeZone: undefined }, time: new Float64Array(0), series: {} };
+    columns.forEach(c => { data.series[c] = new Float64Array(0); });
+  }
+
+  const ctxMain = document.getElementById("chart").getContext("2d");
+  const ctxWide = document.getElementById("chartWide").getContext("2d");
+  const datasets = buildDatasets(data, y1, y2, labelsDict);
+
+  const timeFormat = new Intl.DateTimeFormat(undefined, {
+    timeZone: data.header.timeZone,
+    year: "numeric", month: "2-digit", day: "2-digit",
+    hour: "2-digit", minute: "2-digit"
+  });
+  const formatTime = (ms) => timeFormat.format(new Date(ms));
+
+  const baseOptions = {
+    responsive: true,
+    maintainAspectRatio: false,
+    animation: false,
+    parsing: false,
+    normalized: true,
+    interaction: { mode: "nearest", axis: "x", intersect: false },
+    scales: {
+      x: {
+        type: "linear",
+        ticks: {
+          color: "rgba(148,163,184,0.9)",
+          maxRotation: 0,
+          autoSkip: true,
+          callback: (value) => formatTime(value)
+        },
+        grid: { color: "rgba(31,41,55,0.8)" }
+      },
+      y1: {
+        position: "left",
+        ticks: { color: "rgba(56,189,248,0.9)" },
+        grid: { color: "rgba(31,41,55,0.7)" }
+      },
+      y2: {
+        position: "right",
+        ticks: { color: "rgba(168,85,247,0.9)" },
+        grid: { drawOnChartArea: false }
+      }
+    },
+    plugins: {
+      legend: {
+        labels: { color: "rgba(209,213,219,0.9)" }
+      },
+      tooltip: {
+        callbacks: {
+          title: (items) => items.length ? formatTime(items[0].parsed.x) : ""
+        }
+      }
+    }
+  };
+
+  if (globalChart) globalChart.destroy();
+  globalChart = new Chart(ctxMain, {
+    type: "line",
+    data: { datasets },
+    options: baseOptions
+  });
+
+  if (globalChartWide) globalChartWide.destroy();
+  globalChartWide = new Chart(ctxWide, {
+    type: "line",
+    data: { datasets },
+    options: baseOptions
+  });
+
+  document.getElementById("metaY1").textContent = y1 ? (labelsDict[y1] || y1) : "—";
+  document.getElementById("metaY2").textContent = y2 ? (labelsDict[y2] || y2) : "—";
+  // los cortes del índice son puntos nulos, no registros
+  document.getElementById("metaCount").textContent = data.header.n - data.header.breaks.length;
+}
+
+function setOnOffChip(chipId, dotId, labelId, isOn, textIfOn, textIfOff) {
+  const chip = document.getElementById(chipId);
+  const dot = document.getElementById(dotId);
+  const label = document.getElementById(labelId);
+  if (!chip || !dot || !label) return;
+  if (isOn) {
+    chip.classList.add("on");
+    dot.classList.add("on");
+    label.textContent = textIfOn || "ON";
+  } else {
+    chip.classList.remove("on");
+    dot.classList.remove("on");
+    label.textContent = textIfOff || "OFF";
+  }
+}
+
+function tempColorForValue(t) {
+  if (t === null || isNaN(t)) return "#6b7280";
+  if (t < 18) return "#0ea5e9";
+  if (t < 26) return "#22c55e";
+  if (t < 32) return "#f59e0b";
+  return "#ef4444";
+}
+
+function drawTempSparkline(dayTemps) {
+  const canvas = document.getElementById("tempSparkline");
+  if (!canvas) return;
+  const ctx = canvas.getContext("2d");
+  const w = canvas.width = canvas.clientWidth;
+  const h = canvas.height = canvas.clientHeight;
+
+  ctx.clearRect(0, 0, w, h);
+
+  if (!dayTemps || !dayTemps.length) return;
+  const minT = Math.min(...dayTemps);
+  const maxT = Math.max(...dayTemps);
+  const color = tempColorForValue(dayTemps[dayTemps.length - 1]);
+
+  ctx.beginPath();
+  dayTemps.forEach((t, idx) => {
+    const x = (idx / (dayTemps.length - 1 || 1)) * (w - 4) + 2;
+    let y = h / 2;
+    if (maxT > minT) {
+      const norm = (t - minT) / (maxT - minT);
+      y = (1 - norm) * (h - 6) + 3;
+    }
+    if (idx === 0) ctx.moveTo(x, y);
+    else ctx.lineTo(x, y);
+  });
+  ctx.strokeStyle = color;
+  ctx.lineWidth = 1.5;
+  ctx.stroke();
+}
+
+function computeStd(values) {
+  if (!values || values.length === 0) return null;
+  const mean = values.reduce((a, b) => a + b, 0) / values.length;
+  const variance = values.reduce((acc, v) => acc + Math.pow(v - mean, 2), 0) / values.length;
+  return Math.sqrt(variance);
+}
+
+function updateTemperatureVisuals() {
+  if (!globalData || !globalData.rows || !globalData.rows.length) return;
+  const rows = globalData.rows;
+  const cols = globalData.columns || [];
+  const timeCols = globalData.datetimeColumns || [];
+
+  const timeCol = timeCols.includes("timestamp")
+    ? "timestamp"
+    : (timeCols[0] || null);
+
+  const tempCol = cols.find(c => ["temp_invernadero_C", "tempC", "temperatura"].includes(c));
+  if (!tempCol) return;
+
+  let lastRow = rows[rows.length - 1];
+  if (timeCol) {
+    const sorted = [...rows].filter(r => r[timeCol]).sort((a, b) => {
+      return new Date(a[timeCol]) - new Date(b[timeCol]);
+    });
+    if (sorted.length) lastRow = sorted[sorted.length - 1];
+  }
+
+  const lastTemp = lastRow[tempCol] !== undefined ? Number(lastRow[tempCol]) : null;
+
+  let refDate = null;
+  if (timeCol && lastRow[timeCol]) {
+    const d = new Date(lastRow[timeCol]);
+    if (!isNaN(d.getTime())) refDate = d;
+  }
+
+  let dayTemps = [];
+  if (refDate && timeCol) {
+    const day = refDate.getDate();
+    const month = refDate.getMonth();
+    const year = refDate.getFullYear();
+    rows.forEach(r => {
+      if (!r[timeCol]) return;
+      const d = new Date(r[timeCol]);
+      if (isNaN(d.getTime())) return;
+      if (d.getDate() === day && d.getMonth() === month && d.getFullYear() === year) {
+        const tv = Number(r[tempCol]);
+        if (!isNaN(tv)) dayTemps.push(tv);
+      }
+    });
+  }
+
+  if (!dayTemps.length) {
+    dayTemps = rows
+      .map(r => Number(r[tempCol]))
+      .filter(v => !isNaN(v));
+  }
+
+  let minT = null;
+  let maxT = null;
+  let meanT = null;
+  let stdT = null;
+  if (dayTemps.length) {
+    minT = Math.min(...dayTemps);
+    maxT = Math.max(...dayTemps);
+    meanT = dayTemps.reduce((a, b) => a + b, 0) / dayTemps.length;
+    stdT = computeStd(dayTemps);
+  }
+
+  const rangeLabel = document.getElementById("statusTempRange");
+  if (rangeLabel) {
+    if (minT !== null && maxT !== null) {
+      rangeLabel.textContent = `Mín: ${minT.toFixed(1)} °C · Máx: ${maxT.toFixed(1)} °C`;
+    } else {
+      rangeLabel.textContent = "Mín: -- °C · Máx: -- °C";
+    }
+  }
+
+  const tempValueLabel = document.getElementById("statusTemp");
+  if (tempValueLabel) {
+    tempValueLabel.textContent =
+      (lastTemp !== null && !isNaN(lastTemp)) ? `${lastTemp.toFixed(1)} °C` : "-- °C";
+  }
+
+  const barFill = document.getElementById("tempBarFill");
+  if (barFill) {
+    let pct = 50;
+    if (minT !== null && maxT !== null && maxT > minT && lastTemp !== null && !isNaN(lastTemp)) {
+      pct = ((lastTemp - minT) / (maxT - minT)) * 100;
+      if (pct < 0) pct = 0;
+      if (pct > 100) pct = 100;
+    }
+    barFill.style.width = pct + "%";
+    barFill.style.backgroundColor = tempColorForValue(lastTemp);
+  }
+
+  const tempCard = document.getElementById("statusTempCard");
+  if (tempCard) {
+    const color = tempColorForValue(lastTemp);
+    tempCard.style.boxShadow = `0 0 24px ${color}40`;
+    tempCard.style.borderColor = `${color}80`;
+  }
+
+  const stdLabel = document.getElementById("statusTempStd");
+  const meanLabel = document.getElementById("statusTempMean");
+  if (stdLabel) {
+    if (stdT !== null) {
+      stdLabel.textContent = stdT.toFixed(2) + " °C";
+    } else {
+      stdLabel.textContent = "--";
+    }
+  }
+  if (meanLabel) {
+    if (meanT !== null) {
+      meanLabel.textContent = `Promedio: ${meanT.toFixed(1)} °C`;
+    } else {
+      meanLabel.textContent = "Promedio: -- °C";
+    }
+  }
+
+  drawTempSparkline(dayTemps);
+}
+
+async function loadRuntimeSummary() {
+  // Horas de ventiladores de las últimas 24 h calculadas en el servidor
+  // con los tiempos reales entre lecturas, sin contar los cortes de GSM.
+  const ventHoursLabel = document.getElementById("statusVentHours");
+  const ventSamplesLabel = document.getElementById("statusVentSamples");
+  try {
+    const resp = await fetch(withDataset("/api/runtime?hours=24"));
+    if (!resp.ok) throw new Error("sin datos");
+    const json = await resp.json();
+    const fmt = (v) => (v === null || v === undefined) ? "--" : v.toFixed(1);
+    if (ventHoursLabel) ventHoursLabel.textContent = `Pared: ${fmt(json.wallHours)} h · Colg.: ${fmt(json.colgHours)} h`;
+    if (ventSamplesLabel) ventSamplesLabel.textContent = `Muestras analizadas: ${json.samples}`;
+  } catch (err) {
+    if (ventHoursLabel) ventHoursLabel.textContent = "Pared: -- h · Colg.: -- h";
+    if (ventSamplesLabel) ventSamplesLabel.textContent = "Muestras analizadas: --";
+  }
+}
+
+async function loadEnergySummary() {
+  // Energía de las últimas 24 h según el libro incremental del servidor
+  // (trapecios sobre los tiempos reales, sin integrar los cortes).
+  const energyLabel = document.getElementById("statusEnergy");
+  const powerLabel = document.getElementById("statusPowerMean");
+  try {
+    const resp = await fetch(withDataset("/api/energy?hours=24"));
+    if (!resp.ok) throw new Error("sin datos");
+    const json = await resp.json();
+    if (energyLabel) {
+      energyLabel.textContent = json.kWh > 0 ? json.kWh.toFixed(2) + " kWh" : "-- kWh";
+    }
+    if (powerLabel) {
+      powerLabel.textContent = json.meanPowerKW !== null
+        ? "Potencia media: " + json.meanPowerKW.toFixed(2) + " kW"
+        : "Potencia media: -- kW";
+    }
+  } catch (err) {
+    if (energyLabel) energyLabel.textContent = "-- kWh";
+    if (powerLabel) powerLabel.textContent = "Potencia media: -- kW";
+  }
+}
+
+async function loadModeLoad(lastDate) {
+  // Horas por modo de control del día de la última lectura, calculadas en
+  // el servidor con los tiempos reales entre lecturas (sin los cortes).
+  const modeLoadLabel = document.getElementById("statusModeLoad");
+  if (!modeLoadLabel) return;
+  const dayStart = new Date(lastDate.getFullYear(), lastDate.getMonth(), lastDate.getDate());
+  const dayEnd = new Date(dayStart.getTime() + 24 * 60 * 60 * 1000);
+  const url = "/api/runtime?from=" + encodeURIComponent(formatForDateTimeLocal(dayStart)) +
+    "&to=" + encodeURIComponent(formatForDateTimeLocal(dayEnd));
+  let autoHours = 0, verHours = 0, invHours = 0;
+  try {
+    const resp = await fetch(withDataset(url));
+    if (!resp.ok) throw new Error("sin datos");
+    const modeHours = (await resp.json()).modeHours;
+    if (!modeHours) throw new Error("sin columna de modo");
+    Object.entries(modeHours).forEach(([mode, hours]) => {
+      const raw = mode.toUpperCase();
+      if (raw.includes("AUTO") || raw === "0") autoHours += hours;
+      else if (raw.includes("MANUAL VER")) verHours += hours;
+      else if (raw.includes("MANUAL INV")) invHours += hours;
+    });
+  } catch (err) {
+    modeLoadLabel.textContent = "Auto: -- h · Verano man.: -- h · Invierno man.: -- h";
+    return;
+  }
+  modeLoadLabel.textContent =
+    `Auto: ${autoHours.toFixed(1)} h · Verano man.: ${verHours.toFixed(1)} h · Invierno man.: ${invHours.toFixed(1)} h`;
+}
+
+function updateSummaryWidgets() {
+  if (!globalData || !globalData.rows || !globalData.rows.length) return;
+  const rows = globalData.rows;
+  const cols = globalData.columns || [];
+  const timeCols = globalData.datetimeColumns || [];
+
+  const timeCol = timeCols.includes("timestamp")
+    ? "timestamp"
+    : (timeCols[0] || null);
+
+  if (!timeCol) {
+    document.getElementById("statusVentHours").textContent = "Pared: -- h · Colg.: -- h";
+    document.getElementById("statusVentSamples").textContent = "Muestras analizadas: --";
+    document.getElementById("statusEnergy").textContent = "-- kWh";
+    document.getElementById("statusPowerMean").textContent = "Potencia media: -- kW";
+    document.getElementById("statusModeLoad").textContent = "Auto: -- h · Verano man.: -- h · Invierno man.: -- h";
+    return;
+  }
+
+  let sorted = rows.filter(r => r[timeCol]).slice();
+  sorted.sort((a, b) => new Date(a[timeCol]) - new Date(b[timeCol]));
+  if (!sorted.length) return;
+
+  const lastDate = new Date(sorted[sorted.length - 1][timeCol]);
+  if (isNaN(lastDate.getTime())) return;
+
+  loadRuntimeSummary();
+
+  loadEnergySummary();
+
+  loadModeLoad(lastDate);
+
+  // HUMEDAD INTERNA (hum_invernadero_rel)
+  const humCol = cols.find(c => ["hum_invernadero_rel", "humedad", "humidity"].includes(c));
+  if (humCol) {
+    let lastHum = null;
+    const humVals = [];
+    rows.forEach(r => {
+      const raw = r[humCol];
+      if (raw === undefined || raw === null) return;
+      const v = Number(raw);
+      if (!isNaN(v)) {
+        humVals.push(v);
+        lastHum = v;
+      }
+    });
+
+    const humValueLabel = document.getElementById("statusHum");
+    const humRangeLabel = document.getElementById("statusHumRange");
+    const humBarFill = document.getElementById("humBarFill");
+
+    if (humValueLabel) {
+      humValueLabel.textContent =
+        (lastHum !== null && !isNaN(lastHum)) ? lastHum.toFixed(1) + " %" : "-- %";
+    }
+
+    if (humRangeLabel) {
+      if (humVals.length) {
+        const minH = Math.min(...humVals);
+        const maxH = Math.max(...humVals);
+        humRangeLabel.textContent =
+          `Mín: ${minH.toFixed(1)} % · Máx: ${maxH.toFixed(1)} %`;
+      } else {
+        humRangeLabel.textContent = "Mín: -- % · Máx: -- %";
+      }
+    }
+
+    if (humBarFill) {
+      let pct = (lastHum !== null && !isNaN(lastHum)) ? lastHum : 0;
+      if (pct < 0) pct = 0;
+      if (pct > 100) pct = 100;
+      humBarFill.style.width = pct + "%";
+    }
+  }
+
+}
+
+async function updateGsmStatusFromData() {
+  // El servidor lleva la hora de la última lectura de cada dispositivo,
+  // así que el estado no depende del reloj del navegador ni de descargar datos.
+  const dot = document.getElementById("gsmStatusDot");
+  const label = document.getElementById("gsmStatusLabel");
+  const detail = document.getElementById("gsmStatusDetail");
+  let devices = [];
+  try {
+    const resp = await fetch("/api/health/devices");
+    if (resp.ok) devices = (await resp.json()).devices || [];
+  } catch (err) {
+    console.error(err);
+  }
+  if (!devices.length) {
+    if (label) label.textContent = "Estado GSM: OFFLINE";
+    if (detail) detail.textContent = "Sin datos recientes del ESP32.";
+    if (dot) dot.style.background = "var(--danger)";
+    return;
+  }
+  const dev = devices.reduce((a, b) => (a.ageS <= b.ageS ? a : b));
+  const ageMin = dev.ageS / 60;
+  const rate = dev.ratePerMin !== null ? " · " + dev.ratePerMin.toFixed(1) + " lect./min" : "";
+  if (detail) detail.textContent = "Último dato recibido hace " + ageMin.toFixed(1) + " min" + rate + ".";
+  if (dev.status === "online") {
+    if (label) label.textContent = "Estado GSM: ONLINE";
+    if (dot) dot.style.background = "var(--success)";
+  } else if (dev.status === "late") {
+    if (label) label.textContent = "Estado GSM: RETRASADO";
+    if (dot) dot.style.background = "var(--warn)";
+  } else {
+    if (label) label.textContent = "Estado GSM: OFFLINE";
+    if (dot) dot.style.background = "var(--danger)";
+  }
+}
+
+function updateStatusFromData() {
+  if (!globalData || !globalData.rows || !globalData.rows.length) return;
+  const rows = globalData.rows;
+  const cols = globalData.columns || [];
+  const timeCols = globalData.datetimeColumns || [];
+
+  const timeCol = timeCols.includes("timestamp")
+    ? "timestamp"
+    : (timeCols[0] || null);
+
+  let lastRow = rows[rows.length - 1];
+  if (timeCol) {
+    const sorted = [...rows].filter(r => r[timeCol]).sort((a, b) => {
+      return new Date(a[timeCol]) - new Date(b[timeCol]);
+    });
+    if (sorted.length) lastRow = sorted[sorted.length - 1];
+  }
+
+
+  const tempCol = cols.find(c => ["temp_invernadero_C", "tempC", "temperatura"].includes(c));
+  const modeCol = cols.find(c => ["modo_control", "modo", "controlMode"].includes(c));
+  const stationCol = cols.find(c => ["estacion", "estación"].includes(c));
+  const wallCols = cols.filter(c => ["vent_pared_on", "relay_pared_on", "wallFansOn"].includes(c));
+  const colgCols = cols.filter(c => ["vent_colg_on", "n_colg_vent_on", "colgFansOn"].includes(c));
+  const vfdFreqCol = cols.find(c => ["vfd_freq_out_Hz", "freq_cmd_Hz"].includes(c));
+  const vfdVoltCol = cols.find(c => ["vfd_volt_out_V"].includes(c));
+  const vfdCurrCol = cols.find(c => ["vfd_curr_out_A"].includes(c));
+
+  const tempVal = tempCol ? Number(lastRow[tempCol]) : null;
+  document.getElementById("statusTemp").textContent =
+    (tempVal !== null && !isNaN(tempVal)) ? tempVal.toFixed(1) + " °C" : "-- °C";
+
+  const modeRaw = modeCol ? String(lastRow[modeCol] || "") : "";
+  let modeLabel = "—";
+  let modeDesc = "";
+  const modeUpper = modeRaw.toUpperCase();
+  if (modeUpper.includes("AUTO") || modeRaw === "0") {
+    modeLabel = "Automático";
+    modeDesc = "El sistema decide estación y frecuencia según la fecha y la temperatura.";
+  } else if (modeUpper.includes("MANUAL VER")) {
+    modeLabel = "Verano manual";
+    modeDesc = "Forzado a lógica de verano, sin importar el mes del RTC.";
+  } else if (modeUpper.includes("MANUAL INV")) {
+    modeLabel = "Invierno manual";
+    modeDesc = "Forzado a lógica de invierno, sin importar el mes del RTC.";
+  } else if (modeRaw) {
+    modeLabel = modeRaw;
+    modeDesc = "Modo personalizado desde el controlador.";
+  } else {
+    modeDesc = "Sin información del modo de control.";
+  }
+  document.getElementById("statusMode").textContent = modeLabel;
+  document.getElementById("statusModeDesc").textContent = modeDesc;
+
+  const stationVal = stationCol ? String(lastRow[stationCol] || "") : "";
+  const labelStation = document.getElementById("labelStation");
+  const dotStation = document.getElementById("dotStation");
+  const chipStation = document.getElementById("chipStation");
+  if (labelStation) {
+    labelStation.textContent = "Estación: " + (stationVal || "--");
+  }
+  if (chipStation && dotStation) {
+    chipStation.classList.add("on");
+    dotStation.classList.add("on");
+  }
+
+  const wallStateVal = wallCols.length ? Number(lastRow[wallCols[0]]) : null;
+  const wallOn = wallStateVal === 1 || wallStateVal === true;
+  document.getElementById("statusWall").textContent = wallOn ? "ON" : "OFF";
+  setOnOffChip("chipWall", "dotWall", "labelWall", wallOn, "Activados", "Apagados");
+
+  let colgOn = false;
+  let nColg = null;
+  if (colgCols.length) {
+    const base = Number(lastRow[colgCols[0]]);
+    if (!isNaN(base)) {
+      nColg = base;
+      colgOn = base > 0;
+    }
+  }
+  document.getElementById("statusColg").textContent = colgOn ? "ON" : "OFF";
+  const detail = document.getElementById("statusColgDetail");
+  if (detail) {
+    if (nColg !== null) {
+      detail.textContent = `Ventiladores activos: ${nColg} de 4 posibles.`;
+    } else {
+      detail.textContent = "Ventiladores colgantes sin dato de conteo.";
+    }
+  }
+  setOnOffChip("chipColg", "dotColg", "labelColg", colgOn, "Activados", "Apagados");
+
+  const vfdFreq = vfdFreqCol ? Number(lastRow[vfdFreqCol]) : null;
+  document.getElementById("statusVfdFreq").textContent =
+    (vfdFreq !== null && !isNaN(vfdFreq)) ? vfdFreq.toFixed(1) + " Hz" : "-- Hz";
+
+  const vfdVolt = vfdVoltCol ? Number(lastRow[vfdVoltCol]) : null;
+  document.getElementById("statusVfdVolt").textContent =
+    (vfdVolt !== null && !isNaN(vfdVolt)) ? vfdVolt.toFixed(0) + " V" : "-- V";
+
+  const vfdCurr = vfdCurrCol ? Number(lastRow[vfdCurrCol]) : null;
+  document.getElementById("statusVfdCurr").textContent =
+    (vfdCurr !== null && !isNaN(vfdCurr)) ? vfdCurr.toFixed(2) + " A" : "-- A";
+
+  // Estado de bomba / nebulización
+  const pumpCol = cols.find(c => ["pump_on"].includes(c));
+  if (pumpCol) {
+    const rawPump = lastRow[pumpCol];
+    const pumpOn = Number(rawPump) === 1 || rawPump === true;
+    const pumpLabel = document.getElementById("statusPump");
+    if (pumpLabel) {
+      pumpLabel.textContent = pumpOn ? "ON" : "OFF";
+    }
+    setOnOffChip("chipPump", "dotPump", "labelPump", pumpOn, "Encendida", "Apagada");
+  }
+
+  let tsText = "--";
+  if (timeCol && lastRow[timeCol]) {
+    const d = new Date(lastRow[timeCol]);
+    if (!isNaN(d.getTime())) {
+      tsText = d.toLocaleString();
+      const hour = d.getHours();
+      const isDay = hour >= 7 && hour < 19;
+      const chip = document.getElementById("chipDayNight");
+      const dot = document.getElementById("dotDayNight");
+      const label = document.getElementById("labelDayNight");
+      if (isDay) {
+        chip.classList.add("on");
+        dot.classList.add("on");
+        label.textContent = "Día (RTC)";
+      } else {
+        chip.classList.remove("on");
+        dot.classList.remove("on");
+        label.textContent = "Noche (RTC)";
+      }
+    }
+  }
+  document.getElementById("statusLastTs").textContent = tsText;
+
+  updateTemperatureVisuals();
+  updateSummaryWidgets();
+}
+
+
+function updateControlStatusFromData() {
+  if (!globalData || !globalData.rows || !globalData.rows.length) return;
+  const rows = globalData.rows;
+  const cols = globalData.columns || [];
+  const timeCols = globalData.datetimeColumns || [];
+
+  const timeCol = timeCols.includes("timestamp")
+    ? "timestamp"
+    : (timeCols[0] || null);
+
+  let lastRow = rows[rows.length - 1];
+  if (timeCol) {
+    const sorted = [...rows].filter(r => r[timeCol]).sort((a, b) => {
+      return new Date(a[timeCol]) - new Date(b[timeCol]);
+    });
+    if (sorted.length) lastRow = sorted[sorted.length - 1];
+  }
+
+  const wallCol = cols.find(c => ["vent_pared_on", "relay_pared_on", "wallFansOn"].includes(c));
+  const colgStateCol = cols.find(c => ["vent_colg_on", "colgFansOn"].includes(c));
+  const colgCountCol = cols.find(c => ["n_colg_vent_on"].includes(c));
+  const colgRefCol = cols.find(c => ["colg_ref_unidades"].includes(c));
+  const pumpCol = cols.find(c => ["pump_on"].includes(c));
+  const freqCol = cols.find(c => ["freq_cmd_Hz", "vfd_freq_out_Hz"].includes(c));
+
+  const wallStateLabel = document.getElementById("ctrlWallState");
+  if (wallStateLabel) {
+    let txt = "Estado actual: --";
+    if (wallCol && lastRow[wallCol] !== undefined && lastRow[wallCol] !== null) {
+      const on = Number(lastRow[wallCol]) > 0;
+      txt = "Estado actual: " + (on ? "ON" : "OFF");
+    }
+    wallStateLabel.textContent = txt;
+  }
+
+  const colgStateLabel = document.getElementById("ctrlColgState");
+  const colgDetailLabel = document.getElementById("ctrlColgDetail");
+  if (colgStateLabel) {
+    let on = false;
+    if (colgStateCol && lastRow[colgStateCol] !== undefined && lastRow[colgStateCol] !== null) {
+      on = Number(lastRow[colgStateCol]) > 0;
+    }
+    colgStateLabel.textContent = "Estado actual: " + (on ? "ON" : "OFF");
+  }
+  if (colgDetailLabel) {
+    const ref = colgRefCol && lastRow[colgRefCol] != null ? Number(lastRow[colgRefCol]) : null;
+    const cnt = colgCountCol && lastRow[colgCountCol] != null ? Number(lastRow[colgCountCol]) : null;
+    const freq = freqCol && lastRow[freqCol] != null ? Number(lastRow[freqCol]) : null;
+    let txt = "Cantidad objetivo / real: --";
+    if (!isNaN(ref) || !isNaN(cnt)) {
+      txt = "Cantidad objetivo / real: " +
+        (isNaN(ref) ? "--" : ref.toFixed(1)) + " / " +
+        (isNaN(cnt) ? "--" : cnt.toFixed(0));
+    }
+    if (!isNaN(freq)) {
+      txt += ` · Frecuencia: ${freq.toFixed(1)} Hz`;
+    }
+    colgDetailLabel.textContent = txt;
+  }
+
+  const pumpStateLabel = document.getElementById("ctrlPumpState");
+  if (pumpStateLabel) {
+    let txt = "Estado actual: --";
+    if (pumpCol && lastRow[pumpCol] !== undefined && lastRow[pumpCol] !== null) {
+      const on = Number(lastRow[pumpCol]) > 0;
+      txt = "Estado actual: " + (on ? "ON" : "OFF");
+    }
+    pumpStateLabel.textContent = txt;
+  }
+}
+
+async function loadControlState() {
+  try {
+    const resp = await fetch("/api/control_state");
+    if (!resp.ok) return;
+    const data = await resp.json();
+    const map = {
+      ctrlWallManual: "wall_manual",
+      ctrlWallOn: "wall_on",
+      ctrlColgManual: "colg_manual",
+      ctrlColgOn: "colg_on",
+      ctrlPumpManual: "pump_manual",
+      ctrlPumpOn: "pump_on",
+    };
+    Object.keys(map).forEach(id => {
+      const el = document.getElementById(id);
+      if (el && typeof data[map[id]] === "boolean") {
+        el.checked = data[map[id]];
+      }
+    });
+  } catch (e) {
+    console.error("Error al cargar control_state", e);
+  }
+}
+
+async function applyControlState() {
+  const statusMsg = document.getElementById("ctrlStatusMsg");
+  const payload = {
+    wall_manual: document.getElementById("ctrlWallManual")?.checked || false,
+    wall_on: document.getElementById("ctrlWallOn")?.checked || false,
+    colg_manual: document.getElementById("ctrlColgManual")?.checked || false,
+    colg_on: document.getElementById("ctrlColgOn")?.checked || false,
+    pump_manual: document.getElementById("ctrlPumpManual")?.checked || false,
+    pump_on: document.getElementById("ctrlPumpOn")?.checked || false,
+  };
+  try {
+    const resp = await fetch("/api/control_state", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(payload),
+    });
+    if (!resp.ok) {
+      if (statusMsg) statusMsg.textContent = "Error al enviar el control.";
+      return;
+    }
+    await resp.json();
+    if (statusMsg) statusMsg.textContent = "Control enviado correctamente.";
+  } catch (e) {
+    console.error("Error al aplicar control", e);
+    if (statusMsg) statusMsg.textContent = "Error de red al enviar el control.";
+  }
+}
+
+// ---- Tabla virtualizada: sólo se piden y dibujan las filas visibles ----
+const TABLE_PAGE_SIZE = 200;
+const TABLE_ROW_HEIGHT = 28;
+const TABLE_MAX_PAGES = 8;
+// Alto máximo del área de scroll: más allá se escala la posición.
+const TABLE_MAX_SCROLL_PX = 8000000;
+const tableState = {
+  total: 0, columns: [], sort: null, order: "asc",
+  pages: new Map(), pending: new Set(), generation: 0
+};
+
+function tableQuery(offset) {
+  const params = new URLSearchParams({ offset, limit: TABLE_PAGE_SIZE, order: tableState.order });
+  if (tableState.sort) params.set("sort", tableState.sort);
+  const fromStr = document.getElementById("fromDate").value;
+  const toStr = document.getElementById("toDate").value;
+  if (fromStr) params.set("from", fromStr);
+  if (toStr) params.set("to", toStr);
+  if (currentFilter === "day" || currentFilter === "night") params.set("filter", currentFilter);
+  return withDataset("/api/table?" + params.toString());
+}
+
+async function fetchTablePage(pageIdx) {
+  if (tableState.pages.has(pageIdx) || tableState.pending.has(pageIdx)) return;
+  const generation = tableState.generation;
+  tableState.pending.add(pageIdx);
+  try {
+    const resp = await fetch(tableQuery(pageIdx * TABLE_PAGE_SIZE));
+    if (!resp.ok || generation !== tableState.generation) return;
+    const json = await resp.json();
+    tableState.total = json.total;
+    tableState.columns = json.columns;
+    tableState.pages.set(pageIdx, json.rows);
+    // Memoria constante: se descartan las páginas más antiguas.
+    while (tableState.pages.size > TABLE_MAX_PAGES) {
+      tableState.pages.delete(tableState.pages.keys().next().value);
+    }
+    drawTable();
+  } catch (err) {
+    console.error(err);
+  } finally {
+    tableState.pending.delete(pageIdx);
+  }
+}
+
+function tableRowAt(i) {
+  const page = tableState.pages.get(Math.floor(i / TABLE_PAGE_SIZE));
+  return page ? page[i % TABLE_PAGE_SIZE] : null;
+}
+
+function drawTable() {
+  const wrapper = document.getElementById("tableWrapper");
+  if (!wrapper) return;
+  const cols = tableState.columns;
+  const labels = (globalData && globalData.fieldFriendlyLabels) || {};
+  const total = tableState.total;
+  if (!total || !cols.length) {
+    wrapper.innerHTML = '<div class="empty-state" style="padding:16px;">Sin datos para mostrar.</div>';
+    return;
+  }
+
+  const virtualHeight = Math.min(total * TABLE_ROW_HEIGHT, TABLE_MAX_SCROLL_PX);
+  const visible = Math.ceil((wrapper.clientHeight || 420) / TABLE_ROW_HEIGHT) + 2;
+  const maxScroll = Math.max(1, virtualHeight - (wrapper.clientHeight || 420));
+  const ratio = Math.min(1, wrapper.scrollTop / maxScroll);
+  const first = Math.round(ratio * Math.max(0, total - visible + 2));
+  const last = Math.min(total, first + visible);
+
+  const neededFirst = Math.floor(first / TABLE_PAGE_SIZE);
+  const neededLast = Math.floor(Math.max(first, last - 1) / TABLE_PAGE_SIZE);
+  for (let p = neededFirst; p <= neededLast; p++) fetchTablePage(p);
+
+  const topPad = Math.min(wrapper.scrollTop, virtualHeight - visible * TABLE_ROW_HEIGHT);
+  const bottomPad = Math.max(0, virtualHeight - topPad - (last - first) * TABLE_ROW_HEIGHT);
+
+  let html = "<table><thead><tr>";
+  cols.forEach(c => {
+    const arrow = tableState.sort === c ? (tableState.order === "asc" ? " ▲" : " ▼") : "";
+    html += '<th data-col="' + c + '" style="cursor:pointer;">' + (labels[c] || c) + arrow + "</th>";
+  });
+  html += '</tr></thead><tbody><tr style="height:' + Math.max(0, topPad) + 'px"></tr>';
+  for (let i = first; i < last; i++) {
+    const r = tableRowAt(i);
+    html += '<tr style="height:' + TABLE_ROW_HEIGHT + 'px">';
+    cols.forEach((c, j) => {
+      let v = r ? r[j] : "…";
+      if (v === null || v === undefined) v = "";
+      html += "<td>" + v + "</td>";
+    });
+    html += "</tr>";
+  }
+  html += '<tr style="height:' + bottomPad + 'px"></tr></tbody></table>';
+  const scrollTop = wrapper.scrollTop;
+  wrapper.innerHTML = html;
+  wrapper.scrollTop = scrollTop;
+  document.getElementById("tableCount").textContent = total + " filas";
+}
+
+function renderTable() {
+  tableState.generation += 1;
+  tableState.pages.clear();
+  tableState.pending.clear();
+  tableState.total = 0;
+  const wrapper = document.getElementById("tableWrapper");
+  if (wrapper) wrapper.scrollTop = 0;
+  drawTable();
+  fetchTablePage(0);
+}
+
+function setupTable() {
+  const wrapper = document.getElementById("tableWrapper");
+  if (!wrapper) return;
+  let scheduled = false;
+  wrapper.addEventListener("scroll", () => {
+    if (scheduled) return;
+    scheduled = true;
+    requestAnimationFrame(() => { scheduled = false; drawTable(); });
+  });
+  wrapper.addEventListener("click", (ev) => {
+    const th = ev.target.closest("th[data-col]");
+    if (!th) return;
+    const col = th.getAttribute("data-col");
+    if (tableState.sort === col) {
+      tableState.order = tableState.order === "asc" ? "desc" : "asc";
+    } else {
+      tableState.sort = col;
+      tableState.order = "asc";
+    }
+    renderTable();
+  });
+}
+
+function renderFieldsDictionary() {
+  const container = document.getElementById("fieldsGrid");
+  container.innerHTML = "";
+  if (!globalData || !globalData.columns) return;
+  const cols = globalData.columns;
+  const labels = globalData.fieldFriendlyLabels || {};
+  const descs = globalData.fieldDescriptions || {};
+
+  cols.forEach(c => {
+    const card = document.createElement("div");
+    card.className = "field-card";
+    const label = labels[c] || c;
+    const desc = descs[c] || ("Campo registrado: " + label);
+    card.innerHTML = `
+      <div class="field-name">${c}</div>
+      <div class="field-label">${label}</div>
+      <div class="field-desc">${desc}</div>
+    `;
+    container.appendChild(card);
+  });
+}
+
+function resetFilters() {
+  const from = document.getElementById("fromDate");
+  const to = document.getElementById("toDate");
+  if (from) from.value = "";
+  if (to) to.value = "";
+  currentFilter = "all";
+  applyFilterButtons();
+  if (globalData) {
+    initControls();
+    updateChart();
+    renderTable();
+  }
+}
+
+function setupTabs() {
+  const tabs = document.querySelectorAll(".tab");
+  const panels = document.querySelectorAll(".tab-panel");
+  tabs.forEach(tab => {
+    tab.addEventListener("click", () => {
+      const target = tab.getAttribute("data-tab");
+      tabs.forEach(t => t.classList.remove("active"));
+      tab.classList.add("active");
+      panels.forEach(p => {
+        if (p.id === "tab-" + target) p.classList.add("active");
+        else p.classList.remove("active");
+      });
+    });
+  });
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+  document.getElementById("btnUpload").addEventListener("click", uploadFile);
+  document.getElementById("btnReset").addEventListener("click", resetFilters);
+  const datasetSelect = document.getElementById("datasetSelect");
+  if (datasetSelect) datasetSelect.addEventListener("change", () => selectDataset(datasetSelect.value));
+
+  const btnExport = document.getElementById("btnExportXlsx");
+  if (btnExport) btnExport.addEventListener("click", exportXlsx);
+  const btnApplyControl = document.getElementById("btnApplyControl");
+  if (btnApplyControl) btnApplyControl.addEventListener("click", function(e) { e.preventDefault(); applyControlState(); });
+  loadControlState();
+
+  const selY1 = document.getElementById("selectY1");
+  const selY2 = document.getElementById("selectY2");
+  const selTime = document.getElementById("selectTime");
+  const from = document.getElementById("fromDate");
+  const to = document.getElementById("toDate");
+  const rangePreset = document.getElementById("selectRangePreset");
+
+  if (selY1) selY1.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); });
+  if (selY2) selY2.addEventListener("change", updateChart);
+  if (selTime) selTime.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); });
+  if (from) from.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); renderTable(); });
+  if (to) to.addEventListener("change", () => { updateChart(); updateTemperatureVisuals(); renderTable(); });
+
+  if (rangePreset) rangePreset.addEventListener("change", () => {
+    applyRangePreset(rangePreset.value);
+    updateChart();
+    updateTemperatureVisuals();
+    renderTable();
+  });
+
+  ["fltAll","fltDay","fltNight"].forEach(id => {
+    const btn = document.getElementById(id);
+    if (!btn) return;
+    btn.addEventListener("click", () => {
+      const filter = btn.getAttribute("data-filter");
+      currentFilter = filter;
+      applyFilterButtons();
+      updateChart();
+      renderTable();
+    });
+  });
+
+  setupTabs();
+  setupTable();
+  setEmptyState(true);
+  applyFilterButtons();
+  loadDatasets();
+  loadData();
+  updateGsmStatusFromData();
+  setInterval(updateGsmStatusFromData, 10000);
+});
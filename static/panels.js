@@ -0,0 +1,369 @@
+// Paneles de las pestañas. Se insertan antes de que corra dashboard.js:
+// así el cascarón (index.html, que se revalida en cada carga) queda chico
+// y este marcado se cachea como inmutable, igual que el resto de static/.
+document.getElementById("tabPanels").insertAdjacentHTML("beforeend", `
+      <!-- TAB DASHBOARD -->
+      <div class="tab-panel active" id="tab-dashboard">
+        <div class="grid">
+          <section class="card">
+            <div class="card-header">
+              <div class="card-title">Visualización general</div>
+              <span style="font-size:11px;color:var(--text-muted);">
+                La configuración de gráficos se realiza en la pestaña <strong>Gráficos</strong>.
+              </span>
+            </div>
+            <div class="card-content">
+              <div class="upload-area">
+                <div class="upload-row">
+                  <span class="form-label-inline">Modo de carga:</span>
+                  <select id="uploadMode">
+                    <option value="replace">Reemplazar datos</option>
+                    <option value="append">Añadir a datos actuales</option>
+                  </select>
+                  <span class="form-label-inline">Conjunto:</span>
+                  <input type="text" id="uploadDataset" placeholder="en vivo" size="14"
+                         title="Nombre del conjunto donde cargar el archivo; vacío = datos en vivo">
+                </div>
+                <div class="upload-row">
+                  <input type="file" id="fileInput" accept=".xlsx,.xls">
+                  <button class="btn" id="btnUpload">⬆ Cargar datos</button>
+                </div>
+              </div>
+
+              <div class="chart-container" id="chartContainer">
+                <canvas id="chart"></canvas>
+              </div>
+
+              <div class="meta-info" id="chartMeta" style="display:none;">
+                <span><span class="legend-dot y1"></span> Y1: <span id="metaY1"></span></span>
+                <span><span class="legend-dot y2"></span> Y2: <span id="metaY2"></span></span>
+                <span>Registros en la vista: <span id="metaCount"></span></span>
+              </div>
+
+              <div class="empty-state" id="emptyState">
+                Sube un archivo Excel generado por tu sistema ESP32 para comenzar.<br>
+                Luego entra en la pestaña <strong>Gráficos</strong> para elegir variables, fechas y filtros.
+              </div>
+            </div>
+          </section>
+
+          <section class="card">
+            <div class="card-header">
+              <div class="card-title">Estado actual del sistema</div>
+            </div>
+            <div class="card-content">
+              <div class="status-grid">
+                <div class="status-item" id="statusTempCard">
+                  <h3>Clima interno</h3>
+                  <div class="status-value" id="statusTemp">-- °C</div>
+                  <div class="status-sub" id="statusTempRange">Mín: -- °C · Máx: -- °C</div>
+                  <div class="temp-bar">
+                    <div class="temp-bar-fill" id="tempBarFill" style="width:0%;"></div>
+                  </div>
+                  <div class="temp-sparkline-wrapper">
+                    <canvas id="tempSparkline"></canvas>
+                  </div>
+                  <div class="status-chip" id="chipDayNight">
+                    <span class="status-dot" id="dotDayNight"></span>
+                    <span id="labelDayNight">Sin datos</span>
+                  </div>
+                </div>
+
+                <div class="status-item">
+                  <h3>Modo de trabajo</h3>
+                  <div class="status-value" id="statusMode">--</div>
+                  <div class="status-sub" id="statusModeDesc">Sin datos aún.</div>
+                  <div class="status-chip" id="chipStation">
+                    <span class="status-dot" id="dotStation"></span>
+                    <span id="labelStation">Estación: --</span>
+                  </div>
+                </div>
+
+                <div class="status-item">
+                  <h3>Ventiladores pared</h3>
+                  <div class="status-value" id="statusWall">--</div>
+                  <div class="status-chip" id="chipWall">
+                    <span class="status-dot" id="dotWall"></span>
+                    <span id="labelWall">OFF</span>
+                  </div>
+                </div>
+                <div class="status-item">
+                  <h3>Ventiladores colgantes</h3>
+                  <div class="status-value" id="statusColg">--</div>
+                  <div class="status-sub" id="statusColgDetail">—</div>
+                  <div class="status-chip" id="chipColg">
+                    <span class="status-dot" id="dotColg"></span>
+                    <span id="labelColg">OFF</span>
+                  </div>
+                </div>
+              </div>
+
+              <div class="status-grid" style="margin-top:12px;">
+                <div class="status-item">
+                  <h3>Frecuencia VFD</h3>
+                  <div class="status-value" id="statusVfdFreq">-- Hz</div>
+                </div>
+                <div class="status-item">
+                  <h3>Tensión VFD</h3>
+                  <div class="status-value" id="statusVfdVolt">-- V</div>
+                </div>
+                <div class="status-item">
+                  <h3>Consumo VFD</h3>
+                  <div class="status-value" id="statusVfdCurr">-- A</div>
+                </div>
+                <div class="status-item">
+                  <h3>Último registro</h3>
+                  <div class="status-value" id="statusLastTs">--</div>
+                </div>
+              </div>
+
+              <!-- NUEVOS WIDGETS -->
+              <div class="status-grid" style="margin-top:12px;">
+                <div class="status-item">
+                  <h3>Estabilidad térmica (hoy)</h3>
+                  <div class="status-value" id="statusTempStd">--</div>
+                  <div class="status-sub" id="statusTempMean">Promedio: -- °C</div>
+                </div>
+                <div class="status-item">
+                  <h3>Ventilación últimas 24 h</h3>
+                  <div class="status-sub" id="statusVentHours">Pared: -- h · Colg.: -- h</div>
+                  <div class="status-sub" id="statusVentSamples">Muestras analizadas: --</div>
+                </div>
+                <div class="status-item">
+                  <h3>Energía estimada 24 h</h3>
+                  <div class="status-value" id="statusEnergy">-- kWh</div>
+                  <div class="status-sub" id="statusPowerMean">Potencia media: -- kW</div>
+                </div>
+                <div class="status-item">
+                  <h3>Carga por modo (hoy)</h3>
+                  <div class="status-sub" id="statusModeLoad">
+                    Auto: -- h · Verano man.: -- h · Invierno man.: -- h
+                  </div>
+                </div>
+              </div>
+              <!-- FIN NUEVOS WIDGETS -->
+
+            
+                <div class="status-item" id="statusHumCard">
+                  <h3>Humedad interna</h3>
+                  <div class="status-value" id="statusHum">-- %</div>
+                  <div class="status-sub" id="statusHumRange">Mín: -- % · Máx: -- %</div>
+                  <div class="temp-bar">
+                    <div class="temp-bar-fill" id="humBarFill" style="width:0%;"></div>
+                  </div>
+                </div>
+
+                <div class="status-item">
+                  <h3>Bomba / nebulización</h3>
+                  <div class="status-value" id="statusPump">--</div>
+                  <div class="status-chip" id="chipPump">
+                    <span class="status-dot" id="dotPump"></span>
+                    <span id="labelPump">OFF</span>
+                  </div>
+                </div>
+
+                <div class="status-item">
+                  <h3>Clima exterior</h3>
+                  <div class="status-sub">Benjamín Aceval · Cerrito, Paraguay</div>
+                  <div style="margin-top:8px;">
+                    <a class="weatherwidget-io"
+                       href="https://forecast7.com/en/n25d04n57d37/asuncion/"
+                       data-label_1="BENJAMÍN ACEVAL"
+                       data-label_2="CERRITO · PY"
+                       data-theme="dark"
+                       data-basecolor="#020617"
+                       data-textcolor="#e5e7eb"
+                       data-highcolor="#fbbf24"
+                       data-lowcolor="#38bdf8"
+                       data-suncolor="#fbbf24"
+                       data-mooncolor="#38bdf8">
+                      BENJAMÍN ACEVAL CERRITO · PY
+                    </a>
+                  </div>
+                </div>
+</div>
+          </section>
+        </div>
+      </div>
+
+      <!-- TAB GRAFICOS -->
+      <div class="tab-panel" id="tab-charts">
+        <section class="card">
+          <div class="card-header">
+            <div class="card-title">Laboratorio de gráficos</div>
+            <button class="btn-secondary btn" id="btnReset">⟳ Reset filtros</button>
+          </div>
+          <div class="card-content">
+            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
+              Aquí eliges qué variables graficar, en qué rango de fechas y si quieres ver sólo día o sólo noche.
+              El gráfico grande de abajo se actualiza y el pequeño del Dashboard se mantiene sincronizado.
+            </p>
+
+            <div id="controlsWrapper" style="margin-top:10px;">
+              <div class="controls-grid">
+                <div class="form-group">
+                  <label class="form-label">Variable eje Y principal</label>
+                  <select id="selectY1"></select>
+                </div>
+                <div class="form-group">
+                  <label class="form-label">Variable eje Y secundario</label>
+                  <select id="selectY2">
+                    <option value="">(sin eje secundario)</option>
+                  </select>
+                </div>
+                <div class="form-group">
+                  <label class="form-label">Columna de tiempo</label>
+                  <select id="selectTime"></select>
+                </div>
+              </div>
+
+              <div class="controls-grid" style="margin-top:8px;">
+                <div class="form-group">
+                  <label class="form-label">Desde</label>
+                  <input type="datetime-local" id="fromDate">
+                </div>
+                <div class="form-group">
+                  <label class="form-label">Hasta</label>
+                  <input type="datetime-local" id="toDate">
+                </div>
+                <div class="form-group">
+                  <label class="form-label">Rango rápido</label>
+                  <select id="selectRangePreset">
+                    <option value="last_day" selected>Último día</option>
+                    <option value="last_7">Últimos 7 días</option>
+                    <option value="last_30">Último mes</option>
+                    <option value="all">Todo el dataset</option>
+                  </select>
+                </div>
+                <div class="form-group">
+                  <label class="form-label">Vista</label>
+                  <div class="chip-toggle-group">
+
+                <div class="form-group">
+                  <label class="form-label">Exportar</label>
+                  <select id="exportFormat">
+                    <option value="xlsx" selected>XLSX</option>
+                    <option value="csv">CSV</option>
+                    <option value="parquet">Parquet</option>
+                  </select>
+                  <button class="btn" id="btnExportXlsx" type="button">⬇ Exportar</button>
+                </div>
+                    <button class="chip-toggle active" data-filter="all" id="fltAll">
+                      <span class="chip-toggle-dot"></span>Todo el día
+                    </button>
+                    <button class="chip-toggle" data-filter="day" id="fltDay">
+                      <span class="chip-toggle-dot"></span>Sólo horario diurno
+                    </button>
+                    <button class="chip-toggle" data-filter="night" id="fltNight">
+                      <span class="chip-toggle-dot"></span>Sólo horario nocturno
+                    </button>
+                  </div>
+                </div>
+              </div>
+            </div>
+
+            <div class="chart-container" id="chartWideContainer">
+              <canvas id="chartWide"></canvas>
+            </div>
+          </div>
+        </section>
+      </div>
+
+      <!-- TAB TABLA -->
+      <div class="tab-panel" id="tab-table">
+        <section class="card">
+          <div class="card-header">
+            <div class="card-title">Tabla de registros</div>
+          </div>
+          <div class="card-content">
+            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
+              Visualización tabular de todos los datos capturados: las filas se piden al servidor a medida que
+              te desplazas, respetando el rango Desde/Hasta. Haz clic en una columna para ordenar.
+              <span id="tableCount"></span>
+            </p>
+            <div class="table-wrapper" id="tableWrapper"></div>
+          </div>
+        </section>
+      </div>
+
+      
+      <!-- TAB CONTROL -->
+      <div class="tab-panel" id="tab-control">
+        <section class="card">
+          <div class="card-header">
+            <div class="card-title">Control remoto de equipos</div>
+          </div>
+          <div class="card-content">
+            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
+              Desde aquí puedes ver el estado actual reportado por el ESP32 y enviar órdenes manuales
+              a los relés de pared, colgantes y bomba / nebulización.
+            </p>
+
+            <div class="controls-grid" style="margin-top:10px;">
+              <div class="form-group">
+                <label class="form-label">Ventiladores pared</label>
+                <div class="status-sub" id="ctrlWallState">Estado actual: --</div>
+                <div class="chip-toggle-group" style="margin-top:6px;">
+                  <label class="status-sub">
+                    <input type="checkbox" id="ctrlWallManual"> Modo manual
+                  </label>
+                  <label class="status-sub">
+                    <input type="checkbox" id="ctrlWallOn"> Forzar ON
+                  </label>
+                </div>
+              </div>
+
+              <div class="form-group">
+                <label class="form-label">Ventiladores colgantes</label>
+                <div class="status-sub" id="ctrlColgState">Estado actual: --</div>
+                <div class="status-sub" id="ctrlColgDetail">Cantidad objetivo / real: --</div>
+                <div class="chip-toggle-group" style="margin-top:6px;">
+                  <label class="status-sub">
+                    <input type="checkbox" id="ctrlColgManual"> Modo manual
+                  </label>
+                  <label class="status-sub">
+                    <input type="checkbox" id="ctrlColgOn"> Forzar ON
+                  </label>
+                </div>
+              </div>
+
+              <div class="form-group">
+                <label class="form-label">Bomba / nebulización</label>
+                <div class="status-sub" id="ctrlPumpState">Estado actual: --</div>
+                <div class="chip-toggle-group" style="margin-top:6px;">
+                  <label class="status-sub">
+                    <input type="checkbox" id="ctrlPumpManual"> Modo manual
+                  </label>
+                  <label class="status-sub">
+                    <input type="checkbox" id="ctrlPumpOn"> Forzar ON
+                  </label>
+                </div>
+              </div>
+            </div>
+
+            <div style="margin-top:12px; display:flex; gap:8px; flex-wrap:wrap;">
+              <button class="btn" id="btnApplyControl">Aplicar cambios</button>
+              <span style="font-size:11px;color:var(--text-muted);" id="ctrlStatusMsg">
+                Los cambios se envían a /api/control_state y serán leídos por el ESP32 en su próximo ciclo.
+              </span>
+            </div>
+          </div>
+        </section>
+      </div>
+
+<!-- TAB CAMPOS -->
+      <div class="tab-panel" id="tab-fields">
+        <section class="card">
+          <div class="card-header">
+            <div class="card-title">Diccionario de campos</div>
+          </div>
+          <div class="card-content">
+            <p style="font-size:12px;color:var(--text-muted);margin:0 0 6px;">
+              Aquí ves el nombre real de cada columna (como está en el Excel),
+              la etiqueta legible que usa la interfaz y una descripción funcional.
+            </p>
+            <div class="fields-grid" id="fieldsGrid"></div>
+          </div>
+        </section>
+      </div>
+`);
@@ -0,0 +1,11 @@
+(function() {
+  var d = document;
+  var id = "weatherwidget-io-js";
+  if (!d.getElementById(id)) {
+    var s = d.createElement("script");
+    s.id = id;
+    s.src = "https://weatherwidget.io/js/widget.min.js";
+    s.async = true;
+    d.head.appendChild(s);
+  }
+})();
@@ -0,0 +1,75 @@
+"""
+Fixtures comunes: cada prueba corre con su propio DATA_DIR y el estado en
+memoria del servidor vacío.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+T0 = datetime(2024, 1, 1, 8, 0)
+DIAS = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+
+
+def make_lectura(seq: int, minute: float, device_id: str = "esp32-a", **fields) -> dict:
+    """Lectura de /api/ingreso `minute` minutos después de T0, con valores fijos."""
+    ts = T0 + timedelta(minutes=minute)
+    lectura = {
+        "device_id": device_id,
+        "seq": seq,
+        "timestamp": ts.isoformat(timespec="seconds"),
+        "dia_semana": DIAS[ts.weekday()],
+        "modo_control": "auto",
+        "estacion": "verano",
+        "temp_invernadero_C": 28.0,
+        "hum_invernadero_rel": 60.0,
+        "freq_ref_Hz": 40.0,
+        "freq_cmd_Hz": 40.0,
+        "colg_ref_unidades": 1.0,
+        "n_colg_vent_on": 1,
+        "relay_pared_on": 1,
+        "relay_colg_1_on": 1,
+        "relay_colg_2_on": 0,
+        "vent_pared_on": 1,
+        "vent_colg_on": 1,
+        "vfd_freq_out_Hz": 40.0,
+        "vfd_volt_out_V": 300.0,
+        "vfd_curr_out_A": 4.0,
+        "pump_on": 0,
+        "pump_auto_mode": 1,
+    }
+    lectura.update(fields)
+    return lectura
+
+
+def reset_state(monkeypatch, data_dir) -> None:
+    """Como un servidor recién arrancado sobre `data_dir` (sin haber retomado nada)."""
+    monkeypatch.setattr(main, "DATA_DIR", str(data_dir))
+    monkeypatch.setattr(main, "DEDUP", main.IngestDedup())
+    monkeypatch.setattr(main, "JOURNAL", main.Journal())
+    monkeypatch.setattr(main, "DEVICES", {})
+    monkeypatch.setattr(main, "_CHUNK_FILES", {})
+    monkeypatch.setattr(main, "_CHECKPOINT_VERSION", None)
+    monkeypatch.setattr(main, "_CHECKPOINT_LOCK", None)
+    main.replace_data(None)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """Estado vacío sobre un DATA_DIR temporal."""
+    reset_state(monkeypatch, tmp_path)
+    yield tmp_path
+    main.DEDUP.close()
+    main.replace_data(None)
+
+
+@pytest.fixture
+def client(server):
+    # sin lifespan no hay appender: cada lectura se aplica en línea
+    return TestClient(main.app)
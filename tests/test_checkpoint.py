@@ -0,0 +1,61 @@
+"""
+Arranque en caliente: checkpoint + journal, y un checkpoint que no se
+puede leer (se aparta y se sigue con el journal).
+"""
+import asyncio
+import os
+
+import main
+from conftest import make_lectura, reset_state
+
+
+def ingest(client, minutes):
+    for minute in minutes:
+        assert client.post("/api/ingreso", json=make_lectura(minute + 1, minute)).status_code == 200
+
+
+def restart(monkeypatch, data_dir):
+    """Otro proceso sobre el mismo DATA_DIR: memoria vacía y warm_restart."""
+    # cierra el journal; el archivo apartado también se reaplica
+    main.JOURNAL.rotate()
+    reset_state(monkeypatch, data_dir)
+    asyncio.run(main.warm_restart())
+
+
+def test_checkpoint_and_journal(client, server, monkeypatch):
+    monkeypatch.setattr(main, "_CHECKPOINT_VERSION", 0)
+    ingest(client, range(5))
+    assert asyncio.run(main.checkpoint())
+    # después del checkpoint sólo quedan en el journal
+    ingest(client, range(5, 8))
+    energy = main.ENERGY.total_kwh
+    starts = list(main.GAPS.starts)
+
+    restart(monkeypatch, server)
+    assert main.SNAPSHOT.n == 8
+    assert main.TIME_INDEX.n == 8
+    assert main.ENERGY.total_kwh == energy
+    assert main.GAPS.starts == starts
+    # lo reaplicado quedó en un checkpoint nuevo y el journal se vació
+    assert main.read_checkpoint()["manifest"]["rows"] == 8
+    assert main.JOURNAL.read_after(0) == []
+
+
+def test_corrupt_checkpoint(client, server, monkeypatch):
+    monkeypatch.setattr(main, "_CHECKPOINT_VERSION", 0)
+    ingest(client, range(5))
+    assert asyncio.run(main.checkpoint())
+    ingest(client, range(5, 8))
+    root = os.path.join(server, main.CHECKPOINT_DIR)
+    chunk = next(name for name in os.listdir(root) if name.startswith("chunk-"))
+    with open(os.path.join(root, chunk), "r+b") as fh:
+        fh.truncate(10)
+
+    restart(monkeypatch, server)
+    # el checkpoint se apartó; quedan las lecturas del journal
+    assert any(name.startswith(main.CHECKPOINT_DIR + ".bad-") for name in os.listdir(server))
+    assert main.SNAPSHOT.n == 3
+    assert main.read_checkpoint()["manifest"]["rows"] == 3
+    # y el ingreso sigue
+    ingest(client, [8])
+    assert main.SNAPSHOT.n == 4
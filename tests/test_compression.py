@@ -0,0 +1,30 @@
+"""
+Caché de respuestas comprimidas: los encabezados de CORS guardados son los
+del Origin de cada pedido.
+"""
+
+from conftest import make_lectura
+
+
+def test_cache_keeps_cors_per_origin(client):
+    for minute in range(60):
+        assert client.post("/api/ingreso", json=make_lectura(minute, minute)).status_code == 200
+
+    def get(origin=None):
+        headers = {"Accept-Encoding": "gzip"}
+        if origin is not None:
+            headers["Origin"] = origin
+        response = client.get("/api/series", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        return response
+
+    plain = get()
+    assert "access-control-allow-origin" not in plain.headers
+    cross = get("http://panel.local")
+    assert cross.headers["access-control-allow-origin"] == "*"
+    # los dos ya están en la caché: cada uno con los suyos
+    assert "access-control-allow-origin" not in get().headers
+    assert get("http://panel.local").headers["access-control-allow-origin"] == "*"
+    assert get("http://otro.local").headers["access-control-allow-origin"] == "*"
+    assert cross.json() == plain.json()
@@ -0,0 +1,79 @@
+"""
+Importador de WATCH_DIR: avance por offset en CSV que siguen creciendo,
+huellas de archivos ya importados y filas que ya están en los datos.
+"""
+import asyncio
+import shutil
+
+import pandas as pd
+import pytest
+
+import main
+from conftest import make_lectura
+
+
+@pytest.fixture
+def folder(server, tmp_path_factory, monkeypatch):
+    # bloques chicos: cada archivo de prueba se parte en varios
+    monkeypatch.setattr(main, "WATCH_BLOCK_BYTES", 1024)
+    root = tmp_path_factory.mktemp("watch")
+    importer = main.FolderImporter(str(root))
+    yield root, importer
+    importer.shutdown()
+
+
+def csv_lines(minutes, header=True) -> str:
+    df = pd.DataFrame([make_lectura(m, m) for m in minutes]).drop(columns=["seq"])
+    return df.to_csv(index=False, header=header, lineterminator="\n")
+
+
+def run_once(importer) -> int:
+    return asyncio.run(importer.run_once())
+
+
+def test_offset_follows_growing_csv(folder):
+    root, importer = folder
+    path = root / "log.csv"
+    complete = csv_lines(range(20))
+    partial = csv_lines([20], header=False)
+    path.write_text(complete + partial[:40])
+
+    # la última línea sin terminar queda para la próxima vuelta
+    assert run_once(importer) == 20
+    entry = importer.files[str(path)]
+    assert entry["offset"] == len(complete)
+    assert entry["fingerprint"] is None
+
+    path.write_text(complete + partial + csv_lines(range(21, 26), header=False))
+    assert run_once(importer) == 6
+    assert entry["offset"] == path.stat().st_size
+    assert entry["fingerprint"] == main.file_fingerprint(str(path), path.stat().st_size)
+    assert entry["rows"] == 26
+    assert main.SNAPSHOT.n == 26
+    # sin cambios no se vuelve a leer
+    assert run_once(importer) == 0
+
+
+def test_fingerprint_skips_copies(folder):
+    root, importer = folder
+    path = root / "log.csv"
+    path.write_text(csv_lines(range(10)))
+    assert run_once(importer) == 10
+    shutil.copy(path, root / "copia.csv")
+    assert run_once(importer) == 0
+    assert importer.files[str(root / "copia.csv")]["fingerprint"] == importer.files[str(path)]["fingerprint"]
+
+    # mismo nombre, otro archivo (cambia el comienzo): se importa desde cero
+    path.write_text(csv_lines(range(100, 115)))
+    assert run_once(importer) == 15
+    assert main.SNAPSHOT.n == 25
+
+
+def test_rows_already_live_are_skipped(client, folder):
+    root, importer = folder
+    for minute in range(10):
+        assert client.post("/api/ingreso", json=make_lectura(minute, minute)).status_code == 200
+    (root / "export.csv").write_text(csv_lines(range(5, 16)))
+    assert run_once(importer) == 6
+    assert main.SNAPSHOT.n == 16
+    assert importer.files[str(root / "export.csv")]["rows"] == 6
@@ -0,0 +1,102 @@
+"""
+Reenvíos en /api/ingreso: un ESP32 que se reinicia vuelve a contar `seq`
+desde el principio y sus lecturas nuevas no deben tomarse como reenvíos.
+
+    python -m pytest tests
+"""
+from fastapi.testclient import TestClient
+
+import main
+from conftest import make_lectura
+
+
+def send(client, seq, minute, key=None):
+    headers = {} if key is None else {"Idempotency-Key": key}
+    response = client.post("/api/ingreso", json=make_lectura(seq, minute), headers=headers)
+    assert response.status_code == 200
+    return response.json().get("duplicate", False)
+
+
+def restart_dedup(monkeypatch):
+    """Como después de reiniciar el servidor: ventana vacía, sólo disco y marcas."""
+    main.DEDUP.close()
+    monkeypatch.setattr(main, "DEDUP", main.IngestDedup())
+
+
+def test_reboot_restarts_seq(client):
+    assert [send(client, seq, seq) for seq in range(1, 6)] == [False] * 5
+    # el controlador se reinicia: seq vuelve a 1 con timestamps nuevos
+    assert [send(client, seq, 10 + seq) for seq in range(1, 4)] == [False] * 3
+    assert main.SNAPSHOT.n == 8
+    # un reenvío de verdad (mismo seq y timestamp) sigue siendo duplicado
+    assert send(client, 3, 13)
+    assert send(client, 5, 5)
+    assert main.SNAPSHOT.n == 8
+
+
+def test_reboot_restarts_seq_after_server_restart(client, monkeypatch):
+    for seq in range(1, 6):
+        send(client, seq, seq)
+    restart_dedup(monkeypatch)
+    assert [send(client, seq, 10 + seq) for seq in range(1, 4)] == [False] * 3
+    assert send(client, 2, 2)
+    assert main.SNAPSHOT.n == 8
+
+
+def test_seq_far_below_watermark_is_a_reset(client, monkeypatch):
+    for seq in range(5000, 5003):
+        send(client, seq, seq - 5000)
+    restart_dedup(monkeypatch)
+    assert not send(client, 0, 10)
+    assert not send(client, 1, 11)
+    assert send(client, 1, 11)
+    # la marca de agua volvió a empezar desde el contador reiniciado
+    restart_dedup(monkeypatch)
+    assert not send(client, 2, 12)
+    assert send(client, 1, 11)
+    assert main.SNAPSHOT.n == 6
+
+
+def test_opaque_idempotency_key(client, monkeypatch):
+    keys = ["3f2a", "b71c", "09de"]
+    assert [send(client, None, i, key) for i, key in enumerate(keys)] == [False] * 3
+    restart_dedup(monkeypatch)
+    # se ordena por timestamp: lo nuevo no toca el disco, el reenvío sí se reconoce
+    lookups = []
+    monkeypatch.setattr(main.DEDUP, "_reader", LoggingReader(main.DEDUP, lookups))
+    assert not send(client, None, 5, "aa01")
+    assert lookups == []
+    assert send(client, None, 1, "b71c")
+    assert lookups
+    assert main.SNAPSHOT.n == 4
+
+
+class LoggingReader:
+    """Conexión de lectura de IngestDedup que anota cada consulta."""
+
+    def __init__(self, dedup, log):
+        dedup.open()
+        self._db = dedup._reader
+        self._log = log
+
+    def execute(self, *args):
+        self._log.append(args)
+        return self._db.execute(*args)
+
+    def close(self):
+        self._db.close()
+
+
+def test_failed_apply_does_not_record_the_key(client, monkeypatch):
+    apply = main.apply_ingest_batch
+
+    def broken(batch, journal=True):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(main, "apply_ingest_batch", broken)
+    failing = TestClient(main.app, raise_server_exceptions=False)
+    assert failing.post("/api/ingreso", json=make_lectura(1, 1)).status_code == 500
+    monkeypatch.setattr(main, "apply_ingest_batch", apply)
+    # el reintento del controlador se agrega, no es un reenvío
+    assert not send(client, 1, 1)
+    assert main.SNAPSHOT.n == 1
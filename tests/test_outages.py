@@ -0,0 +1,44 @@
+"""
+Cortes de datos: el GapIndex y las horas de funcionamiento y la energía,
+que no cuentan el tiempo sin lecturas.
+"""
+import numpy as np
+import pytest
+
+import main
+from conftest import make_lectura
+
+NS_PER_MINUTE = 60 * 10**9
+
+
+def test_gap_mask():
+    t = np.arange(10, dtype=np.int64) * NS_PER_MINUTE
+    t[6:] += 20 * NS_PER_MINUTE
+    gaps = main.GapIndex()
+    gaps.rebuild(t)
+    assert gaps.starts == [int(t[5])] and gaps.ends == [int(t[6])]
+    assert gaps.mask(t).tolist() == [False] * 5 + [True] + [False] * 3
+    # sólo el intervalo que contiene el inicio del corte, aunque se pida un rango parcial
+    assert gaps.mask(t[4:8]).tolist() == [False, True, False]
+    assert gaps.mask(t[:5]).tolist() == [False] * 4
+    assert gaps.mask(t[:1]).tolist() == []
+
+
+def test_runtime_and_energy_skip_outage(client):
+    # cada minuto de 0 a 30, un corte de 10 minutos y de 40 a 70
+    for seq, minute in enumerate(list(range(31)) + list(range(40, 71))):
+        assert client.post("/api/ingreso", json=make_lectura(seq, minute)).status_code == 200
+
+    outages = client.get("/api/outages").json()
+    assert [o["durationS"] for o in outages["outages"]] == [600.0]
+
+    runtime = client.get("/api/runtime").json()
+    assert runtime["coveredHours"] == pytest.approx(1.0)
+    assert runtime["wallHours"] == pytest.approx(1.0)
+    assert runtime["pumpHours"] == 0
+    assert runtime["modeHours"] == {"auto": pytest.approx(1.0)}
+
+    # 300 V · 4 A · factor de potencia, durante la hora con lecturas
+    energy = client.get("/api/energy").json()
+    assert energy["coveredHours"] == pytest.approx(1.0)
+    assert energy["kWh"] == pytest.approx(300 * 4 * main.VFD_POWER_FACTOR / 1000)
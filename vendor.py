@@ -0,0 +1,109 @@
+"""
+Paso de armado: copia a static/vendor/ las librerías del dashboard que no
+se escriben acá (Chart.js), verificadas contra su hash SRI fijado en
+vendor.lock.json. Se corre al preparar la instalación (con internet), no
+al arrancar: el servidor sólo sirve el archivo local, nunca la CDN, así el
+dashboard funciona en la LAN sin salida a internet.
+
+    python vendor.py            # descarga lo que falte y verifica el hash fijado
+    python vendor.py --pin      # descarga y fija el hash en vendor.lock.json (al cambiar la versión)
+    python vendor.py --check    # sin red: exit 1 si falta un archivo o no coincide su hash
+
+Después de --pin se commitean vendor.lock.json y static/vendor/.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+VENDOR_DIR = os.path.join(REPO_ROOT, "static", "vendor")
+LOCK_FILE = os.path.join(REPO_ROOT, "vendor.lock.json")
+# Archivo en static/vendor → URL, con la versión fija.
+LIBRARIES = {
+    "chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js",
+}
+
+
+def integrity(body: bytes) -> str:
+    """Hash en formato SRI ("sha384-<base64>"), el mismo que publica la CDN."""
+    return "sha384-" + base64.b64encode(hashlib.sha384(body).digest()).decode("ascii")
+
+
+def load_lock() -> dict:
+    if not os.path.exists(LOCK_FILE):
+        return {}
+    with open(LOCK_FILE, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_lock(lock: dict) -> None:
+    with open(LOCK_FILE, "w", encoding="utf-8") as fh:
+        json.dump(lock, fh, indent=2, sort_keys=True)
+        fh.write("\n")
+
+
+def read_local(name: str):
+    path = os.path.join(VENDOR_DIR, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def download(name: str, url: str, expected) -> str:
+    """Descarga `url` a static/vendor/`name` si su hash es `expected` (None = aceptarlo). Devuelve el hash."""
+    with urllib.request.urlopen(url, timeout=30) as resp:
+        body = resp.read()
+    got = integrity(body)
+    if expected is not None and got != expected:
+        raise ValueError(f"hash {got} distinto del fijado {expected}")
+    path = os.path.join(VENDOR_DIR, name)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(body)
+    os.replace(tmp, path)
+    return got
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--pin", action="store_true", help="descargar de nuevo y fijar el hash")
+    mode.add_argument("--check", action="store_true", help="sólo verificar lo que ya está (sin red)")
+    args = parser.parse_args()
+
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    lock = load_lock()
+    failed = 0
+    for name, url in LIBRARIES.items():
+        entry = lock.get(name) or {}
+        pinned = entry.get("integrity") if entry.get("url") == url else None
+        body = read_local(name)
+        try:
+            if args.pin:
+                lock[name] = {"url": url, "integrity": download(name, url, None)}
+                print(f"Fijado static/vendor/{name}: {lock[name]['integrity']}")
+            elif pinned is None:
+                raise ValueError(f"sin hash fijado para {url}: correr con --pin")
+            elif body is not None and integrity(body) == pinned:
+                continue
+            elif args.check:
+                raise ValueError("falta" if body is None else f"hash {integrity(body)} distinto del fijado")
+            else:
+                download(name, url, pinned)
+                print(f"Descargado static/vendor/{name} ({url})")
+        except (OSError, ValueError) as e:
+            failed += 1
+            print(f"static/vendor/{name}: {e}", file=sys.stderr)
+    if args.pin:
+        save_lock(lock)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())